@@ -4,9 +4,10 @@ from logging.handlers import SMTPHandler
 
 import tomllib
 from celery.app import Celery
-from celery.signals import after_setup_logger
+from celery.signals import after_setup_logger, task_prerun
 
 from app.config import CONFIG_FILE
+from app.utils.tools import refresh_config
 
 app = Celery()
 app.config_from_object("app.celeryconfig")
@@ -52,5 +53,11 @@ def setup_loggers(*args, **kwargs):
     logger.info(f"Config file: {CONFIG_FILE}")
 
 
+@task_prerun.connect
+def reload_config(*args, **kwargs):
+    """Every task works on the config file as it is when the task starts"""
+    refresh_config()
+
+
 if __name__ == "__main__":
     app.start()
@@ -8,7 +8,8 @@ password = os.getenv("RABBITMQ_DEFAULT_PASS", "mypass")
 
 broker_url = "pyamqp://{}:{}@{}//".format(username, password, host)
 
-result_backend = "rpc://{}:{}@{}//".format(username, password, host)
+# Fanning out the processors needs a backend supporting chords, for example "db+postgresql://..."
+result_backend = os.getenv("CELERY_RESULT_BACKEND") or "rpc://{}:{}@{}//".format(username, password, host)
 
 timezone = "Europe/Zurich"
 enable_utc = True
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.common.api.bitbucket_api import BEARER
+from app.common.api.http_session import RETRY_STATUSES, RequestStats, get_endpoint
+from app.common.api.rate_limit import LOW, RateLimitScheduler, get_scheduler
+from app.common.exceptions.access_denied_exception import AccessDeniedException
+from app.common.exceptions.repo_not_found_exception import RepoNotFoundException
+from app.common.exceptions.request_exception import RequestException
+from app.utils.tools import read_config
+
+
+class AsyncBitBucketApi:
+    """asyncio version of BitBucketApi, for fetching the data of many repositories at once.
+
+    All the requests go through a semaphore of `concurrency` requests and the RateLimitScheduler of the server, shared
+    with the synchronous clients, as low priority requests. The pages of the listing endpoints are prefetched
+    `prefetch_pages` at a time instead of being walked one after the other.
+    Must be used as an async context manager, ex: `async with AsyncBitBucketApi(url, token) as api:`
+    """
+
+    api_path = "/rest/api/1.0/"
+    page_limit = 100
+
+    log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+    def __init__(self, url, token=None, concurrency: int = None, scheduler: RateLimitScheduler = None, prefetch_pages: int = None):
+        config = read_config("http", {}) or {}
+        async_config = config.get("async") or {}
+        self.url = url
+        self.token = token
+        self.concurrency = concurrency or async_config.get("concurrency", 16)
+        self.scheduler = scheduler or get_scheduler(url)
+        self.prefetch_pages = prefetch_pages or async_config.get("prefetch_pages", 4)
+        self.retries = config.get("retries", 5)
+        self.backoff_factor = config.get("backoff_factor", 0.5)
+        self.timeout = config.get("timeout", 60)
+        self.stats = RequestStats()
+        self.client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        headers = {"Authorization": BEARER + self.token} if self.token else {}
+        self.client = httpx.AsyncClient(
+            base_url=self.url,
+            headers=headers,
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.client.aclose()
+
+    async def _request(self, method, path, params=None, json=None, headers=None) -> httpx.Response:
+        """Send a request, retrying 429 and 5xx like the synchronous session"""
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                # The scheduler blocks its thread while waiting for a token
+                await asyncio.to_thread(self.scheduler.acquire, LOW)
+                start_time = time.monotonic()
+                response = await self.client.request(method, path, params=params, json=json, headers=headers)
+                self.scheduler.update(response)
+            retry = response.status_code in RETRY_STATUSES and attempt < self.retries and method != "POST"
+            self.stats.add(get_endpoint(method, self.url + path), response.status_code, time.monotonic() - start_time, int(retry))
+            if not retry:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff_factor * (2**attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _check(self, response: httpx.Response, method: str, path: str, params, expected=(200,)):
+        if response.status_code == 401:
+            self.log.warning(f"Error {method} request {self.url + path} with params {params}: {response.text}")
+            raise AccessDeniedException(f"Error {method} request {self.url + path} with params {params}, status: {response.status_code}")
+        elif response.status_code == 404:
+            raise RepoNotFoundException(f"Page {self.url + path} doesn't exist anymore")
+        elif response.status_code not in expected:
+            self.log.warning(f"Error {method} request {self.url + path} with params {params}: {response.text}")
+            raise RequestException(f"Error {method} request {self.url + path} with params {params}, status: {response.status_code}")
+
+    async def _get_page(self, path, params, start) -> dict:
+        params = dict(params, limit=self.page_limit, start=start)
+        response = await self._request("GET", path, params=params)
+        self._check(response, "GET", path, params)
+        return response.json()
+
+    async def _get(self, path, params, count=False, only_data=True, all=False):
+        if all or count:
+            values, size = await self._get_all(path, params)
+            return size if count else values
+        response = await self._request("GET", path, params=params)
+        self._check(response, "GET", path, params)
+        if only_data:
+            return response.json()["values"]
+        return response
+
+    async def _get_all(self, path, params) -> tuple[list, int]:
+        """Walk all the pages, the next `prefetch_pages` pages are requested at the same time"""
+        page = await self._get_page(path, params, 0)
+        values = list(page["values"])
+        size = page["size"]
+        # The server may cap the page size below the limit asked
+        step = page.get("limit") or self.page_limit
+        _next = None if page.get("isLastPage", False) else page.get("nextPageStart")
+        while _next is not None:
+            starts = [_next + i * step for i in range(self.prefetch_pages)]
+            pages = await asyncio.gather(*(self._get_page(path, params, start) for start in starts))
+            for start, page in zip(starts, pages):
+                if start != _next:
+                    # Shorter page than expected, the next batch starts where it stopped
+                    break
+                values += page["values"]
+                size += page["size"]
+                _next = None if page.get("isLastPage", False) else page.get("nextPageStart")
+                if _next is None:
+                    break
+        return values, size
+
+    async def _post(self, path, params):
+        headers = {"X-Atlassian-Token": "no-check"}
+        response = await self._request("POST", path, json=params, headers=headers)
+        self._check(response, "POST", path, params, expected=(200, 204))
+        return response.json() if response.status_code == 200 else None
+
+    async def _delete(self, path, params):
+        headers = {"X-Atlassian-Token": "no-check"}
+        response = await self._request("DELETE", path, json=params, headers=headers)
+        self._check(response, "DELETE", path, params, expected=(204,))
+
+    async def get_repos(self, visibility="public", limit=25, count=False, only_data=True, all=False):
+        return await self._get(
+            self.api_path + "repos", {"visibility": visibility, "limit": limit}, count=count, only_data=only_data, all=all
+        )
+
+    async def get_projects(self, limit=25, count=False, only_data=True, all=False):
+        return await self._get(self.api_path + "projects", {"limit": limit}, count=count, only_data=only_data, all=all)
+
+    async def get_branch_permissions(self, project_key, repo, limit=100, count=False, only_data=True):
+        return await self._get(
+            f"/rest/branch-permissions/2.0/projects/{project_key}/repos/{repo}/restrictions",
+            {"limit": limit},
+            count=count,
+            only_data=only_data,
+        )
+
+    async def get_branch_model(self, project_key, repo, count=False):
+        response = await self._get(f"/rest/branch-utils/latest/projects/{project_key}/repos/{repo}/branchmodel", {}, only_data=False)
+        return response.json()
+
+    async def get_hooks(self, project_key, repo, limit=100, count=False, only_data=True):
+        return await self._get(
+            f"/rest/api/1.0/projects/{project_key}/repos/{repo}/settings/hooks", {"limit": limit}, count=count, only_data=only_data
+        )
+
+    async def get_branches(self, project_key, repo, limit=100, count=False, only_data=True):
+        return await self._get(
+            f"/rest/api/1.0/projects/{project_key}/repos/{repo}/branches", {"limit": limit}, count=count, only_data=only_data
+        )
+
+    async def get_repo_users_permissions(self, repo, limit=100, count=False, only_data=True):
+        return await self._get(
+            f"/rest/api/1.0/projects/{repo.project.key}/repos/{repo.slug}/permissions/users",
+            {"limit": limit},
+            count=count,
+            only_data=only_data,
+        )
+
+    async def get_repo_groups_permissions(self, repo, limit=100, count=False, only_data=True):
+        return await self._get(
+            f"/rest/api/1.0/projects/{repo.project.key}/repos/{repo.slug}/permissions/groups",
+            {"limit": limit},
+            count=count,
+            only_data=only_data,
+        )
+
+    async def get_labels(self, repo):
+        return await self._get(f"/rest/api/1.0/projects/{repo.project.key}/repos/{repo.slug}/labels", {})
+
+    async def add_label_to_repo(self, repo, label):
+        return await self._post(f"/rest/api/1.0/projects/{repo.project.key}/repos/{repo.slug}/labels", {"name": label})
+
+    async def delete_label_to_repo(self, repo, label):
+        return await self._delete(f"/rest/api/1.0/projects/{repo.project.key}/repos/{repo.slug}/labels/{label}", {})
+
+    async def get_repo_branch_permissions(self, repo):
+        return await self._get(f"/rest/branch-permissions/2.0/projects/{repo.project.key}/repos/{repo.slug}/restrictions", {})
+
+    async def get_groups(self, username):
+        return await self._get("/rest/api/1.0/admin/users/more-members?", params={"context": username})
+
+    async def get_group_members(self, group):
+        return await self._get("/rest/api/1.0/admin/groups/more-members", params={"context": group}, all=True)
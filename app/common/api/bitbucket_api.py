@@ -1,8 +1,7 @@
 import logging
 from datetime import datetime, timedelta
 
-import requests
-
+from app.common.api.http_session import get_session
 from app.common.exceptions.access_denied_exception import AccessDeniedException
 from app.common.exceptions.repo_not_found_exception import RepoNotFoundException
 from app.common.exceptions.request_exception import RequestException
@@ -16,9 +15,11 @@ class BitBucketApi:
 
     log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
-    def __init__(self, url, token=None):
+    def __init__(self, url, token=None, session=None):
         self.url = url
         self.token = token
+        # Connections are kept alive and shared by all the clients of the server
+        self.session = session or get_session(url)
 
     def _get(self, path, params, count=False, only_data=True, all=False):
         headers = {}
@@ -30,7 +31,8 @@ class BitBucketApi:
             while _next is not None:
                 params["limit"] = 100
                 params["start"] = _next
-                response = requests.get(self.url + path, params=params, headers=headers)
+                response = self.session.get(self.url + path, params=params, headers=headers)
+                self._check_page(response, path, params)
                 page_json = response.json()
                 i += page_json["size"]
                 _next = page_json.get("nextPageStart", None)
@@ -42,13 +44,14 @@ class BitBucketApi:
             while _next is not None:
                 params["limit"] = 100
                 params["start"] = _next
-                response = requests.get(self.url + path, params=params, headers=headers)
+                response = self.session.get(self.url + path, params=params, headers=headers)
+                self._check_page(response, path, params)
                 page_json = response.json()
                 i += page_json["size"]
                 _next = page_json.get("nextPageStart", None)
                 results += page_json["values"]
             return results
-        r = requests.get(self.url + path, params=params, headers=headers, allow_redirects=True)
+        r = self.session.get(self.url + path, params=params, headers=headers, allow_redirects=True)
         if r.status_code == 401:
             self.log.warning(f"Error GET request {self.url + path} with params {params}: {r.text}")
             raise AccessDeniedException(f"Error GET request {self.url + path} with params {params}, status: {r.status_code}")
@@ -64,6 +67,15 @@ class BitBucketApi:
         else:
             return r
 
+    def _check_page(self, response, path, params):
+        if response.status_code == 401:
+            raise AccessDeniedException(f"Error GET request {self.url + path} with params {params}, status: {response.status_code}")
+        elif response.status_code == 404:
+            raise RepoNotFoundException(f"Page {self.url + path} doesn't exist anymore")
+        elif response.status_code != 200:
+            self.log.warning(f"Error GET request {self.url + path} with params {params}: {response.text}")
+            raise RequestException(f"Error GET request {self.url + path} with params {params}, status: {response.status_code}")
+
     def _post(self, path, params):
         headers = {}
         if self.token:
@@ -71,7 +83,7 @@ class BitBucketApi:
                 "Authorization": BEARER + self.token,
                 "X-Atlassian-Token": "no-check",
             }
-        r = requests.post(self.url + path, json=params, headers=headers, allow_redirects=True)
+        r = self.session.post(self.url + path, json=params, headers=headers, allow_redirects=True)
         if r.status_code == 401:
             self.log.warning(f"Error GET request {self.url + path} with params {params}: {r.text}")
             raise AccessDeniedException(f"Error GET request {self.url + path} with params {params}, status: {r.status_code}")
@@ -89,7 +101,7 @@ class BitBucketApi:
                 "Authorization": BEARER + self.token,
                 "X-Atlassian-Token": "no-check",
             }
-        r = requests.delete(self.url + path, json=params, headers=headers, allow_redirects=True)
+        r = self.session.delete(self.url + path, json=params, headers=headers, allow_redirects=True)
         if r.status_code == 401:
             self.log.warning(f"Error GET request {self.url + path} with params {params}: {r.text}")
             raise AccessDeniedException(f"Error GET request {self.url + path} with params {params}, status: {r.status_code}")
@@ -284,6 +296,16 @@ class BitBucketApi:
             params={"context": username},
         )
 
+    def get_admin_groups(self):
+        return self._get("/rest/api/1.0/admin/groups", params={}, all=True)
+
+    def get_group_members(self, group):
+        return self._get(
+            "/rest/api/1.0/admin/groups/more-members",
+            params={"context": group},
+            all=True,
+        )
+
     def get_project_activities(self, project_id: int, last_days: int = 10):
         today = datetime.now()
         last_days_ago = today - timedelta(days=last_days)
@@ -0,0 +1,229 @@
+import logging
+
+from app.common.api.http_session import get_session
+from app.common.exceptions.request_exception import RequestException
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Permissions of the REST API granted by each GraphQL repository permission, in the order of the REST payloads
+REST_PERMISSIONS = {
+    "ADMIN": ["admin", "maintain", "push", "triage", "pull"],
+    "MAINTAIN": ["maintain", "push", "triage", "pull"],
+    "WRITE": ["push", "triage", "pull"],
+    "TRIAGE": ["triage", "pull"],
+    "READ": ["pull"],
+}
+REST_TEAM_PERMISSIONS = {"ADMIN": "admin", "MAINTAIN": "maintain", "WRITE": "push", "TRIAGE": "triage", "READ": "pull"}
+# Settings of the branch protection rules, by key of the REST branch protection in the order of the REST payload
+REST_PROTECTIONS = {
+    "required_signatures": "requiresCommitSignatures",
+    "enforce_admins": "isAdminEnforced",
+    "required_linear_history": "requiresLinearHistory",
+    "allow_force_pushes": "allowsForcePushes",
+    "allow_deletions": "allowsDeletions",
+    "block_creations": "blocksCreations",
+    "required_conversation_resolution": "requiresConversationResolution",
+    "lock_branch": "lockBranch",
+    "allow_fork_syncing": "lockAllowsFetchAndMerge",
+}
+
+COLLABORATORS_FIELDS = """
+fragment collaboratorsFields on RepositoryCollaboratorConnection {
+  pageInfo { hasNextPage endCursor }
+  edges { permission node { login name email databaseId } }
+}
+"""
+
+REPOSITORY_FIELDS = (
+    """
+fragment repositoryFields on Repository {
+  databaseId
+  nameWithOwner
+  collaborators(first: 100) @include(if: $collaborators) { ...collaboratorsFields }
+  outsideCollaborators: collaborators(first: 100, affiliation: OUTSIDE) @include(if: $collaborators) {
+    ...collaboratorsFields
+  }
+  defaultBranchRef @include(if: $protection) {
+    name
+    branchProtectionRule {
+      requiresApprovingReviews requiredApprovingReviewCount dismissesStaleReviews requiresCodeOwnerReviews
+      requireLastPushApproval requiresCommitSignatures isAdminEnforced requiresLinearHistory allowsForcePushes
+      allowsDeletions blocksCreations requiresConversationResolution lockBranch lockAllowsFetchAndMerge
+      bypassPullRequestAllowances(first: 100) { nodes { actor { ... on User { login } ... on Team { name } } } }
+    }
+  }
+}
+"""
+    + COLLABORATORS_FIELDS
+)
+
+COLLABORATORS_QUERY = (
+    """
+query($owner: String!, $name: String!, $after: String, $affiliation: CollaboratorAffiliation) {
+  repository(owner: $owner, name: $name) {
+    collaborators(first: 100, after: $after, affiliation: $affiliation) { ...collaboratorsFields }
+  }
+}
+"""
+    + COLLABORATORS_FIELDS
+)
+
+TEAMS_QUERY = """
+query($org: String!, $after: String) {
+  organization(login: $org) {
+    teams(first: 100, after: $after) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name slug databaseId
+        repositories(first: 100) { pageInfo { hasNextPage endCursor } edges { permission node { databaseId } } }
+      }
+    }
+  }
+}
+"""
+
+TEAM_REPOSITORIES_QUERY = """
+query($org: String!, $slug: String!, $after: String) {
+  organization(login: $org) {
+    team(slug: $slug) {
+      repositories(first: 100, after: $after) { pageInfo { hasNextPage endCursor } edges { permission node { databaseId } } }
+    }
+  }
+}
+"""
+
+
+class GithubGraphQL:
+    """GitHub GraphQL client fetching the permissions of many repositories per query.
+
+    Its results have the shapes of the REST API, for the wrapper to process them the same way.
+    """
+
+    def __init__(self, token: str, url: str = GRAPHQL_URL, session=None):
+        self.url = url
+        self.token = token
+        self.session = session or get_session(url)
+
+    def query(self, query: str, variables: dict = None) -> dict:
+        """Data of a query. Errors are only logged when there is data, the fields in error are null"""
+        response = self.session.post(
+            self.url, json={"query": query, "variables": variables or {}}, headers={"Authorization": f"bearer {self.token}"}
+        )
+        if response.status_code != 200:
+            log.warning(f"Error POST request {self.url}: {response.text}")
+            raise RequestException(f"Error POST request {self.url}, status: {response.status_code}")
+        payload = response.json()
+        if payload.get("data") is None:
+            raise RequestException(f"Error GraphQL query on {self.url}: {payload.get('errors')}")
+        for error in payload.get("errors", []):
+            log.debug(f"GraphQL error on {error.get('path')}: {error.get('message')}")
+        return payload["data"]
+
+    def get_repositories(self, names: list[str], collaborators=True, protection=True) -> dict:
+        """Collaborators and default branch protection of repositories ("owner/name"), keyed by repository id.
+
+        {id: {"collaborators": [...] or None, "protection": {"branch": name, "raw_data": {...} or None} or None}}
+        A repository missing from the result couldn't be read, ex: deleted or not accessible.
+        """
+        variables = {"collaborators": collaborators, "protection": protection}
+        arguments = ["$collaborators: Boolean!", "$protection: Boolean!"]
+        fields = []
+        for i, name in enumerate(names):
+            variables[f"owner{i}"], variables[f"name{i}"] = name.split("/", 1)
+            arguments += [f"$owner{i}: String!", f"$name{i}: String!"]
+            fields.append(f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{ ...repositoryFields }}")
+        query = f"query({', '.join(arguments)}) {{\n" + "\n".join(fields) + "\n}\n" + REPOSITORY_FIELDS
+        data = self.query(query, variables)
+
+        result = {}
+        for i, name in enumerate(names):
+            repository = data.get(f"r{i}")
+            if repository is None:
+                continue
+            result[repository["databaseId"]] = {
+                "collaborators": self._get_collaborators(name, repository) if collaborators else None,
+                "protection": self._get_protection(repository["defaultBranchRef"]) if protection else None,
+            }
+        return result
+
+    def get_teams_repositories(self, org: str) -> dict:
+        """Teams having access to the repositories of an organisation, keyed by repository id"""
+        result = {}
+        after = None
+        while True:
+            teams = self.query(TEAMS_QUERY, {"org": org, "after": after})["organization"]["teams"]
+            for team in teams["nodes"]:
+                get_page = self._get_team_repositories_page(org, team["slug"])
+                for edge in self._get_all_edges(team["repositories"], get_page):
+                    result.setdefault(edge["node"]["databaseId"], []).append(
+                        {
+                            "group": {"name": team["name"], "id": team["databaseId"]},
+                            "permissions": [REST_TEAM_PERMISSIONS.get(edge["permission"], edge["permission"].lower())],
+                        }
+                    )
+            if not teams["pageInfo"]["hasNextPage"]:
+                return result
+            after = teams["pageInfo"]["endCursor"]
+
+    def _get_team_repositories_page(self, org: str, slug: str):
+        variables = {"org": org, "slug": slug}
+        return lambda cursor: self.query(TEAM_REPOSITORIES_QUERY, dict(variables, after=cursor))["organization"]["team"]["repositories"]
+
+    def _get_collaborators(self, name: str, repository: dict):
+        """Collaborators like the REST API, None if they can't be read (the token needs push access)"""
+        if repository.get("collaborators") is None or repository.get("outsideCollaborators") is None:
+            return None
+        owner, name = name.split("/", 1)
+
+        def get_page(affiliation):
+            variables = {"owner": owner, "name": name, "affiliation": affiliation}
+            return lambda cursor: self.query(COLLABORATORS_QUERY, dict(variables, after=cursor))["repository"]["collaborators"]
+
+        outside = {edge["node"]["login"] for edge in self._get_all_edges(repository["outsideCollaborators"], get_page("OUTSIDE"))}
+        return [
+            {
+                "login": edge["node"]["login"],
+                "name": edge["node"]["name"],
+                "email": edge["node"]["email"] or None,
+                "id": edge["node"]["databaseId"],
+                "external": edge["node"]["login"] in outside,
+                "permissions": REST_PERMISSIONS.get(edge["permission"], []),
+            }
+            for edge in self._get_all_edges(repository["collaborators"], get_page("ALL"))
+        ]
+
+    @staticmethod
+    def _get_all_edges(connection: dict, get_page) -> list:
+        """Edges of a connection, the pages after the first one being fetched with `get_page(cursor)`"""
+        edges = list(connection["edges"])
+        while connection["pageInfo"]["hasNextPage"]:
+            connection = get_page(connection["pageInfo"]["endCursor"])
+            edges += connection["edges"]
+        return edges
+
+    @staticmethod
+    def _get_protection(branch: dict):
+        """Protection of the default branch, as the `raw_data` of the REST branch protection"""
+        if branch is None:
+            return None
+        rule = branch["branchProtectionRule"]
+        if rule is None:
+            return {"branch": branch["name"], "raw_data": None}
+        raw_data = {}
+        if rule["requiresApprovingReviews"]:
+            actors = [node["actor"] or {} for node in rule["bypassPullRequestAllowances"]["nodes"]]
+            raw_data["required_pull_request_reviews"] = {
+                "dismiss_stale_reviews": rule["dismissesStaleReviews"],
+                "require_code_owner_reviews": rule["requiresCodeOwnerReviews"],
+                "require_last_push_approval": rule["requireLastPushApproval"],
+                "required_approving_review_count": rule["requiredApprovingReviewCount"],
+                "bypass_pull_request_allowances": {
+                    "users": [{"login": actor["login"]} for actor in actors if "login" in actor],
+                    "teams": [{"name": actor["name"]} for actor in actors if "name" in actor],
+                },
+            }
+        for key, field in REST_PROTECTIONS.items():
+            raw_data[key] = {"enabled": bool(rule[field])}
+        return {"branch": branch["name"], "raw_data": raw_data}
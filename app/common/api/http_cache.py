@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from app.common.api.rate_limit import ScheduledAdapter
+from app.utils.tools import read_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Headers describing the raw body, which is stored decoded
+BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+# Budget of the rate limit when the response was stored, outdated when it is read
+RATE_LIMIT_HEADERS = {"x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset", "x-ratelimit-used", "x-ratelimit-resource"}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class HttpCache:
+    """SQLite store of the GET responses, keyed by URL and credentials.
+
+    A response is used as is during the TTL of its endpoint family (`http.cache.ttl`, matched on the path). Then it is
+    revalidated with If-None-Match / If-Modified-Since, a 304 costs no payload and doesn't count in the GitHub rate limit.
+    """
+
+    def __init__(self, path: str, ttl: dict = None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl = dict(ttl or {})
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, body BLOB, "
+                "etag TEXT, last_modified TEXT, stored_at REAL)"
+            )
+
+    @staticmethod
+    def get_key(request: requests.PreparedRequest) -> str:
+        authorization = request.headers.get("Authorization", "")
+        return hashlib.sha256(f"{request.method} {request.url} {authorization}".encode("utf-8")).hexdigest()
+
+    def get_ttl(self, url: str) -> float:
+        """TTL of the first family found in the path of the URL, `default` otherwise"""
+        path = url.split("://", 1)[-1].split("?", 1)[0]
+        for family, ttl in self.ttl.items():
+            if family != "default" and family in path:
+                return ttl
+        return self.ttl.get("default", 0)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, etag, last_modified, stored_at = row
+        return {
+            "status": status,
+            "headers": json.loads(headers),
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": stored_at,
+        }
+
+    def set(self, key: str, response: requests.Response):
+        excluded = BODY_HEADERS | RATE_LIMIT_HEADERS
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in excluded}
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, status, headers, body, etag, last_modified, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response.url,
+                    response.status_code,
+                    json.dumps(headers),
+                    response.content,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    time.time(),
+                ),
+            )
+
+    def touch(self, key: str):
+        with self._lock, self.connection:
+            self.connection.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+
+    def record(self, result: str):
+        with self._lock:
+            self.stats[result] += 1
+
+    def log_summary(self, reset=True):
+        requests_count = self.stats["hit"] + self.stats["revalidated"] + self.stats["miss"]
+        ratio = 100 * (self.stats["hit"] + self.stats["revalidated"]) / requests_count if requests_count else 0
+        log.info(
+            f"[HTTP cache] {requests_count} requests: {self.stats['hit']} hits, {self.stats['revalidated']} revalidated (304), "
+            f"{self.stats['miss']} misses, {ratio:.0f}% served from the cache"
+        )
+        if reset:
+            self.stats.clear()
+
+
+class CachingAdapter(ScheduledAdapter):
+    """Adapter answering the GET requests from an HttpCache when it can, only the requests sent count for the scheduler"""
+
+    def __init__(self, cache: HttpCache, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, *args, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, *args, **kwargs)
+        key = self.cache.get_key(request)
+        ttl = self.cache.get_ttl(request.url)
+        cached = self.cache.get(key)
+        if cached is not None and time.time() - cached["stored_at"] < ttl:
+            self.cache.record("hit")
+            return self._build_response(request, cached)
+        if cached is not None:
+            if cached["etag"]:
+                request.headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                request.headers["If-Modified-Since"] = cached["last_modified"]
+        response = super().send(request, *args, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.record("revalidated")
+            self.cache.touch(key)
+            response.close()
+            return self._build_response(request, cached, raw=response.raw)
+        self.cache.record("miss")
+        if response.status_code == 200 and (ttl > 0 or "ETag" in response.headers or "Last-Modified" in response.headers):
+            self.cache.set(key, response)
+        return response
+
+    @staticmethod
+    def _build_response(request: requests.PreparedRequest, cached: dict, raw=None) -> requests.Response:
+        response = requests.Response()
+        response.status_code = cached["status"]
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(cached["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = cached["body"]
+        response.url = request.url
+        response.request = request
+        response.raw = raw
+        return response
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """Cache shared by the sessions of the process, None unless `http.cache.enabled`"""
+    global _cache
+    if not read_config("http.cache.enabled", False):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache(read_config("http.cache.path", "reports/http_cache.sqlite"), read_config("http.cache.ttl", {}))
+        return _cache
+
+
+def log_cache_stats(reset=True):
+    if _cache is not None:
+        _cache.log_summary(reset=reset)
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+import requests
+from github import Requester
+from urllib3.util.retry import Retry
+
+from app.common.api.http_cache import CachingAdapter, HttpCache, get_http_cache, log_cache_stats
+from app.common.api.rate_limit import RateLimitScheduler, ScheduledAdapter, get_scheduler, log_schedulers_metrics
+from app.utils.tools import read_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Path segments followed by an identifier, replaced by a placeholder in the endpoint names
+ID_SEGMENTS = {"projects", "repos", "commits", "labels", "users", "groups", "hooks", "branches"}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_endpoint(method: str, url: str) -> str:
+    """Name of an endpoint for the stats, without query string nor identifiers.
+
+    ex: GET /rest/api/1.0/projects/{}/repos/{}/permissions/users
+    """
+    path = url.split("://", 1)[-1].split("?", 1)[0]
+    segments = path.split("/")[1:]
+    for i in range(1, len(segments)):
+        if segments[i - 1] in ID_SEGMENTS and segments[i] not in ID_SEGMENTS:
+            segments[i] = "{}"
+    return f"{method} /" + "/".join(segments)
+
+
+class RequestStats:
+    """Latency, status and retry counters per endpoint, shared by the threads using a session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = Counter()
+        self.time = defaultdict(float)
+        self.retries = Counter()
+        self.statuses = defaultdict(Counter)
+
+    def add(self, endpoint: str, status: int, elapsed: float, retries: int = 0):
+        with self._lock:
+            self.count[endpoint] += 1
+            self.time[endpoint] += elapsed
+            self.retries[endpoint] += retries
+            self.statuses[endpoint][status] += 1
+
+    def reset(self):
+        with self._lock:
+            self.count.clear()
+            self.time.clear()
+            self.retries.clear()
+            self.statuses.clear()
+
+    def summary(self) -> list[dict]:
+        """Endpoints sorted by total time"""
+        with self._lock:
+            return [
+                {
+                    "endpoint": endpoint,
+                    "count": count,
+                    "total_time": self.time[endpoint],
+                    "mean_time": self.time[endpoint] / count,
+                    "retries": self.retries[endpoint],
+                    "statuses": dict(self.statuses[endpoint]),
+                }
+                for endpoint, count in sorted(self.count.items(), key=lambda item: -self.time[item[0]])
+            ]
+
+    def log_summary(self, name: str, limit: int = 20):
+        summary = self.summary()
+        total = sum(stat["total_time"] for stat in summary)
+        log.info(f"[HTTP] {name}: {sum(stat['count'] for stat in summary)} requests in {total:.1f}s")
+        for stat in summary[:limit]:
+            log.info(
+                f"[HTTP] {stat['endpoint']}: {stat['count']} requests, {stat['total_time']:.1f}s "
+                f"(mean {1000 * stat['mean_time']:.0f}ms), {stat['retries']} retries, statuses {stat['statuses']}"
+            )
+
+
+class InstrumentedSession(requests.Session):
+    """requests.Session recording the stats of every request and applying a default timeout"""
+
+    def __init__(self, timeout: float = None):
+        super().__init__()
+        self.timeout = timeout
+        self.stats = RequestStats()
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        start_time = time.monotonic()
+        response = super().request(method, url, *args, **kwargs)
+        retries = response.raw.retries.history if getattr(response.raw, "retries", None) is not None else ()
+        self.stats.add(get_endpoint(method, url), response.status_code, time.monotonic() - start_time, len(retries))
+        return response
+
+
+def create_session(
+    pool_size: int = 10,
+    retries: int = 5,
+    backoff_factor: float = 0.5,
+    timeout: float = 60,
+    cache: HttpCache = None,
+    scheduler: RateLimitScheduler = None,
+) -> InstrumentedSession:
+    """Session keeping `pool_size` connections alive per host.
+
+    Requests answered by 429 or 5xx are retried with an exponential backoff, or after the delay of the Retry-After
+    header when there is one. POST requests are not retried, they aren't idempotent.
+    With a `cache`, the GET responses are stored and revalidated with their ETag. With a `scheduler`, the requests
+    are paced to the rate limit of the server.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = InstrumentedSession(timeout=timeout)
+    adapter = _create_adapter(cache, scheduler, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _create_adapter(cache: HttpCache = None, scheduler: RateLimitScheduler = None, **kwargs) -> ScheduledAdapter:
+    if cache is not None:
+        return CachingAdapter(cache, scheduler=scheduler, **kwargs)
+    return ScheduledAdapter(scheduler=scheduler, **kwargs)
+
+
+def get_session(url: str) -> InstrumentedSession:
+    """Session shared by all the API clients of a server, configured by `http`"""
+    with _sessions_lock:
+        if url not in _sessions:
+            config = read_config("http", {}) or {}
+            _sessions[url] = create_session(
+                pool_size=config.get("pool_size", 10),
+                retries=config.get("retries", 5),
+                backoff_factor=config.get("backoff_factor", 0.5),
+                timeout=config.get("timeout", 60),
+                cache=get_http_cache(),
+                scheduler=get_scheduler(url),
+            )
+        return _sessions[url]
+
+
+def log_sessions_stats(reset=True):
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for url, session in sessions.items():
+        session.stats.log_summary(url)
+        if reset:
+            session.stats.reset()
+    log_cache_stats(reset=reset)
+    log_schedulers_metrics()
+
+
+class _SharedSessionConnection:
+    """PyGithub connection going through the session of its server, with its stats, cache and rate limit scheduler.
+
+    PyGithub creates a connection per request once its connection classes are injected, the shared session keeps the
+    connections to the server alive.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session.close()
+        self.session = _get_github_session(f"{self.protocol}://{self.host}", self.retry, self.pool_size)
+
+    def close(self):
+        pass
+
+
+class SharedHTTPRequestsConnection(_SharedSessionConnection, Requester.HTTPRequestsConnectionClass):
+    pass
+
+
+class SharedHTTPSRequestsConnection(_SharedSessionConnection, Requester.HTTPSRequestsConnectionClass):
+    pass
+
+
+def _get_github_session(url: str, retry, pool_size: int) -> InstrumentedSession:
+    """Like get_session, with the retries of PyGithub"""
+    cache = get_http_cache()
+    scheduler = get_scheduler(url)
+    with _sessions_lock:
+        if url not in _sessions:
+            session = InstrumentedSession()
+            session.auth = Requester.Requester.noopAuth
+            adapter = _create_adapter(cache, scheduler, max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount(url.split("://", 1)[0] + "://", adapter)
+            _sessions[url] = session
+        return _sessions[url]
+
+
+def inject_github_session():
+    """Route the requests of PyGithub through the shared sessions"""
+    Requester.Requester.injectConnectionClasses(SharedHTTPRequestsConnection, SharedHTTPSRequestsConnection)
@@ -0,0 +1,193 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.tools import read_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+PRIORITY_NAMES = {HIGH: "high", NORMAL: "normal", LOW: "low"}
+
+_priority = contextvars.ContextVar("request_priority", default=NORMAL)
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def request_priority(priority: int):
+    """Priority of the requests sent in the block, ex: `with request_priority(HIGH): wrapper.add_label(...)`"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimitScheduler:
+    """Token bucket pacing the requests sent to a server, shared by the threads of the process.
+
+    - `rate` requests per second, up to `burst` at once
+    - the budget announced by the server (X-RateLimit-Remaining / X-RateLimit-Reset) is followed: once only `reserve`
+      requests are left, the normal and low priority requests wait for the reset, the high priority ones use the reserve
+    - a 429 (or a 403 with Retry-After, GitHub secondary limit) pauses every request for Retry-After, `pause` without it
+    - waiting requests are served by priority, then in arrival order
+    """
+
+    def __init__(self, name: str, rate: float = 10, burst: int = 20, reserve: int = 100, pause: float = 5):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.pause = pause
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.paused_until = 0.0
+        self.requests = Counter()
+        self.waiting = Counter()
+        self.wait_time = Counter()
+        self.throttled = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: int = None):
+        """Block until a request of this priority can be sent"""
+        priority = _priority.get() if priority is None else priority
+        ticket = (priority, next(self._sequence))
+        start_time = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    delay = self._get_delay(ticket)
+                    if delay <= 0:
+                        break
+                    self._condition.wait(timeout=min(delay, 1.0))
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self.waiting[priority] -= 1
+            self.tokens -= 1
+            if self.remaining is not None:
+                self.remaining -= 1
+            self.requests[priority] += 1
+            self.wait_time[priority] += time.monotonic() - start_time
+            self._condition.notify_all()
+
+    def _get_delay(self, ticket: tuple) -> float:
+        """Seconds before the request of the ticket can be sent, 0 if it can be sent now"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self._queue[0] != ticket:
+            return 1.0
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.remaining is not None and self.reset_at is not None:
+            left = self.remaining if ticket[0] == HIGH else self.remaining - self.reserve
+            if left <= 0 and self.reset_at > time.time():
+                return self.reset_at - time.time()
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
+
+    def update(self, response: requests.Response):
+        """Follow the budget and the throttling announced by a response"""
+        headers = response.headers
+        with self._condition:
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+                self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 0)) or None
+                self.reset_at = float(headers["X-RateLimit-Reset"]) if "X-RateLimit-Reset" in headers else None
+            retry_after = headers.get("Retry-After")
+            if response.status_code == 429 or (response.status_code == 403 and retry_after is not None):
+                self.throttled += 1
+                delay = float(retry_after) if retry_after is not None and retry_after.isdigit() else self.pause
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                log.warning(f"[Rate limit] {self.name} throttled the requests, pausing {delay:.0f}s")
+            self._condition.notify_all()
+
+    def metrics(self) -> dict:
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset_in": max(0.0, self.reset_at - time.time()) if self.reset_at is not None else None,
+                "throttled": self.throttled,
+                "requests": {PRIORITY_NAMES[priority]: count for priority, count in self.requests.items()},
+                "waiting": {PRIORITY_NAMES[priority]: count for priority, count in self.waiting.items()},
+                "wait_time": {PRIORITY_NAMES[priority]: wait_time for priority, wait_time in self.wait_time.items()},
+            }
+
+
+class ScheduledAdapter(HTTPAdapter):
+    """HTTPAdapter sending its requests through a RateLimitScheduler"""
+
+    def __init__(self, *args, scheduler: RateLimitScheduler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def send(self, request: requests.PreparedRequest, *args, **kwargs) -> requests.Response:
+        if self.scheduler is None:
+            return super().send(request, *args, **kwargs)
+        self.scheduler.acquire()
+        response = super().send(request, *args, **kwargs)
+        self.scheduler.update(response)
+        return response
+
+
+def get_scheduler(url: str) -> RateLimitScheduler:
+    """Scheduler shared by all the clients of a server, configured by `http.rate_limit`"""
+    with _schedulers_lock:
+        if url not in _schedulers:
+            config = read_config("http.rate_limit", {}) or {}
+            _schedulers[url] = RateLimitScheduler(
+                url,
+                rate=config.get("rate", 10),
+                burst=config.get("burst", 20),
+                reserve=config.get("reserve", 100),
+                pause=config.get("pause", 5),
+            )
+        return _schedulers[url]
+
+
+def log_schedulers_metrics():
+    """Log the budget usage of the servers and write it to `http.rate_limit.metrics_path` (Prometheus text format)"""
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    lines = []
+    for url, scheduler in schedulers.items():
+        metrics = scheduler.metrics()
+        log.info(
+            f"[Rate limit] {url}: {metrics['remaining']}/{metrics['limit']} remaining, {metrics['throttled']} throttled, "
+            f"requests {metrics['requests']}, waited {({name: round(value, 1) for name, value in metrics['wait_time'].items()})}s"
+        )
+        labels = f'source="{url}"'
+        for name in ["limit", "remaining", "reset_in", "throttled"]:
+            if metrics[name] is not None:
+                lines.append(f"secretkeeper_rate_limit_{name}{{{labels}}} {metrics[name]}")
+        for name in ["requests", "waiting", "wait_time"]:
+            for priority, value in metrics[name].items():
+                lines.append(f'secretkeeper_rate_limit_{name}{{{labels},priority="{priority}"}} {value}')
+    path = read_config("http.rate_limit.metrics_path")
+    if path is not None and lines:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(f"{path}.tmp", path)
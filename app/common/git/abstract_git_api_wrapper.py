@@ -1,14 +1,20 @@
 import logging
 import os
 import shutil
+import subprocess
+import time
 from abc import ABC, abstractmethod
 from datetime import date
+from typing import Optional
 
 from app.common.git.abstract_git_data import AbstractGitData
-from app.utils.tools import read_config
+from app.common.git.mirror_cache import MirrorCache, MirrorError
+from app.utils.tools import get_folder_size, read_config
 from common.models.repository import Repository
 from common.models.repository_project import RepositoryProject
 
+_MISSING = object()
+
 
 class AbstractGitApiWrapper(ABC):
     repo = None
@@ -19,6 +25,9 @@ class AbstractGitApiWrapper(ABC):
     directory_path = None
     repo_from_db = False
     report_path = None
+    mirror_cache = None
+    clone_time = None
+    clone_size = None
 
     def __init__(self, source: AbstractGitData, repo_db=None, url=None):
         self.repo = repo_db
@@ -29,6 +38,7 @@ class AbstractGitApiWrapper(ABC):
             self.repo_from_db = True
             self.url = self.repo.url_http
         self.path = None
+        self._prefetched = {}
 
     @abstractmethod
     def get_repos(self, visibility=None):
@@ -50,21 +60,115 @@ class AbstractGitApiWrapper(ABC):
     def get_branch_permissions(self, branch: str) -> dict:
         pass
 
+    def get_clone_path(self) -> str:
+        """Return the folder the repository is cloned into, unique per repository so clones can run concurrently"""
+        url = self.get_repository().url_http
+        return read_config("scanner.tmp_git_folder") + url.split("/")[-1].replace(".git", "") + f"-{self.repo.id}"
+
+    def get_clone_args(self) -> list[str]:
+        """Options of `git clone` for the clone strategy of the git source.
+
+        - full: the whole history
+        - shallow: only the last commit, the history is fetched by `deepen` when a finding needs blame
+        - partial: the whole history without the blobs larger than `blob_limit`. The checkout still downloads the
+          ones of HEAD, only the large blobs of the older commits are skipped
+        """
+        strategy = self.source.clone_strategy
+        if strategy == "shallow":
+            # Without the blobs, deepening only fetches the commits and trees
+            return ["--depth", "1", "--filter=blob:none"]
+        if strategy == "partial":
+            return [f"--filter=blob:limit={self.source.clone_blob_limit}"]
+        if strategy != "full":
+            raise ValueError(f"Unknown clone strategy {strategy}")
+        return []
+
+    def set_clone_stats(self, path: str, start_time: float):
+        self.clone_time = time.time() - start_time
+        self.clone_size = get_folder_size(os.path.join(path, ".git"))
+        self.log.debug(f"Cloned in {self.clone_time:.1f}s, {self.clone_size // 1024} kB")
+
+    def is_shallow(self) -> bool:
+        return self.path is not None and os.path.exists(os.path.join(self.path, ".git", "shallow"))
+
+    def deepen(self) -> bool:
+        """Fetch the history of a shallow clone, needed by the blame and the incremental scans"""
+        if not self.is_shallow():
+            return True
+        start_time = time.time()
+        result = subprocess.run(["git", "-C", self.path, "fetch", "--unshallow", "--quiet"], capture_output=True)
+        if result.returncode != 0:
+            self.log.error(f"Error on deepening {self.path}: {result.stderr.decode('utf-8', errors='replace')}")
+            return False
+        elapsed = time.time() - start_time
+        self.clone_time = (self.clone_time or 0) + elapsed
+        self.clone_size = get_folder_size(os.path.join(self.path, ".git"))
+        self.log.debug(f"History of {self.path} fetched in {elapsed:.1f}s")
+        return True
+
+    def clone_from_mirror(self, url: str, branch: str = None, git_config: dict = None) -> Optional[str]:
+        """Check out the repository from the mirror cache, only the new objects are fetched from the remote.
+
+        Returns None if the remote can't be read. Raises MirrorError on the other errors, for the caller to clone the
+        repository without the cache.
+        """
+        mirror_cache = MirrorCache()
+        path = self.get_clone_path()
+        start_time = time.time()
+        size = get_folder_size(mirror_cache.get_mirror_path(self.repo.id))
+        try:
+            mirror_cache.checkout(self.repo.id, url, path, branch=branch, git_config=git_config)
+        except MirrorError as e:
+            self.log.warning("Error on updating the mirror.")
+            self.log.error(e)
+            shutil.rmtree(path, ignore_errors=True)
+            if "Could not read from remote repository" in e.stderr:
+                return None
+            raise
+        self.mirror_cache = mirror_cache
+        self.clone_time = time.time() - start_time
+        # Only what the fetch added to the mirror
+        self.clone_size = max(0, get_folder_size(mirror_cache.get_mirror_path(self.repo.id)) - size)
+        self.directory_path = path
+        self.path = path
+        return path
+
     def get_report_path(self):
         if self.report_path is not None:
             return self.report_path
         os.makedirs(read_config("scanner.report_path"), exist_ok=True)
 
-        self.report_path = read_config("scanner.report_path") + self.repo.name.replace("/", "__") + ".json"
+        self.report_path = read_config("scanner.report_path") + self.repo.name.replace("/", "__") + f"-{self.repo.id}.json"
 
         return self.report_path
 
     def clean(self):
         if self.report_path is not None and os.path.exists(self.report_path):
             os.remove(self.report_path)
-        if os.path.exists(self.path):
+        if self.mirror_cache is not None and self.path is not None:
+            self.mirror_cache.remove_worktree(self.repo.id, self.path)
+        if self.path is not None and os.path.exists(self.path):
             shutil.rmtree(self.path, ignore_errors=True)
 
+    def prefetch(self, repos: list, kinds: list[str]):
+        """Fetch the `kinds` of data of many repositories at once, before they are processed one by one.
+
+        The wrappers without a batch mode fetch them on demand.
+        """
+        pass
+
+    def _get_prefetched(self, kind: str, repo: Repository, func):
+        """Prefetched data of a repository, `func` is called when there is none.
+
+        An exception raised while prefetching is raised again, as the on demand call would have done.
+        """
+        result = self._prefetched.pop((kind, repo.id), _MISSING)
+        if result is _MISSING:
+            return func()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
     @abstractmethod
     def get_repo_settings(self, repo):
         pass
@@ -20,6 +20,9 @@ class AbstractGitData(ABC):
         excludes = config.get("excludes", {})
         self.exclude_repos = excludes.get("repositories", [])
         self.type = config.get("type", "bitbucket")
+        clone = config.get("clone") or {}
+        self.clone_strategy = clone.get("strategy", "full")
+        self.clone_blob_limit = clone.get("blob_limit", "1m")
 
         credentials = config.get("credentials_env", {})
         self.username = read_env_variable(credentials.get("username"))
@@ -6,7 +6,7 @@ from sqlalchemy.orm import Session
 from app.common.exceptions.access_denied_exception import AccessDeniedException
 from app.common.exceptions.repo_not_found_exception import RepoNotFoundException
 from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
-from app.utils.helper import process_user, process_group
+from app.utils.identity_cache import IdentityCache
 from app.utils.notifications import process_notification
 from common.models.basemodel import engine
 from common.models.notification_action_enum import NotificationActionEnum
@@ -26,6 +26,7 @@ class AbstractGitPermissions(ABC):
         self.wrapper = wrapper
         self.repositories_query = repositories_query
         self.session = Session(engine)
+        self.identities = IdentityCache(self.session, wrapper)
 
     @abstractmethod
     def get_repos(self, visibility=None):
@@ -89,9 +90,9 @@ class AbstractGitPermissions(ABC):
             db_user = None
             db_group = None
             if user is not None:
-                db_user = process_user(self.session, user, self.wrapper)
+                db_user = self.identities.get_user(user)
             else:
-                db_group = process_group(self.session, group)
+                db_group = self.identities.get_group(group)
             db_permission = (
                 self.session.query(RepositoryPermission)
                 .filter(
@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 import logging
 
+from sqlalchemy import case, func, insert, select, update
 from sqlalchemy.orm import Session, Query
 
+from app.common.api.rate_limit import LOW, request_priority
 from app.common.exceptions.access_denied_exception import AccessDeniedException
 from app.common.exceptions.repo_not_found_exception import RepoNotFoundException
 from app.common.exceptions.request_exception import RequestException
@@ -14,6 +18,8 @@ from app.runners.fetchers.abstract_fetcher import AbstractFetcher
 from app.runners.fetchers.branches_fetcher import BranchesFetcher
 from app.runners.fetchers.permissions_fetcher import PermissionsFetcher
 from app.runners.fetchers.settings_fetcher import SettingsFetcher
+from app.utils.identity_cache import IdentityCache
+from app.utils.tools import read_config
 from common.models.basemodel import engine
 from common.models.gitleaks import Gitleak
 from common.models.notification_enum import NotificationEnum
@@ -23,12 +29,24 @@ from common.models.repository_project import RepositoryProject
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# Classification reason by critical value of the open leaks: none, some, some with a vault secret
+CRITICAL_DATA = {0: "internal", 1: "confidential", 2: "vault secret"}
+# Label of the repositories by classification
+LABELS = {0: "internal", 1: "confidential"}
+# Results of the synchronization of a label
+LABEL_APPLIED = "applied"
+LABEL_DRY_RUN = "dry_run"
+LABEL_DENIED = "denied"
+LABEL_DELETED = "deleted"
+LABEL_ERROR = "error"
+
 
 class AbstractGitService(ABC):
     """Abstract class for Git Service"""
 
     data: AbstractGitData
     service: AbstractGitApiWrapper
+    name: str = None
 
     def __init__(self, config: dict, session=None):
         self.config = config
@@ -36,10 +54,17 @@ class AbstractGitService(ABC):
         if session is None:
             self.session = Session(engine)
         self.wrapper = None
+        self.identities = None
 
     def run_fetcher(self, fetcher: AbstractFetcher, repo_url=None):
-        _fetcher = fetcher(self.session, self.wrapper, self.config)
-        _fetcher.fetch(self.get_repositories_query([], repo_url=repo_url))
+        if self.identities is None:
+            self.identities = IdentityCache(self.session, self.wrapper)
+        _fetcher = fetcher(
+            self.session, self.wrapper, self.config, identities=self.identities
+        )
+        # Bulk reads, they leave the end of the rate limit budget to the label writes
+        with request_priority(LOW):
+            _fetcher.fetch(self.get_repositories_query([], repo_url=repo_url))
 
     def run_checker(self, checker: AbstractChecker, repo_url=None):
         _checker = checker(self.session, self.wrapper, self.config)
@@ -64,142 +89,178 @@ class AbstractGitService(ABC):
 
     def process_classification(self, repo_url=None, dry_run_label=True):
         log.info("Running classification")
-        filters = [Repository.deleted.isnot(True)]  # noqa
-        if repo_url is not None:
-            filters.append(Repository.url_http == repo_url)
-        repositories = self.get_repositories_query([]).filter(*filters).all()
-
-        critical_data = {0: "internal", 1: "confidential", 2: "vault secret"}
-
-        i = 1
-
-        count_confidential = 0
-        count_internal = 0
-        count_no_access = 0
-        for repo in repositories:
-            critical_value = 0
-            leaks = (
-                self.session.query(Gitleak)
-                .filter(
-                    Gitleak.repository_id == repo.id,
-                    Gitleak.is_false_positive.isnot(True),
-                    Gitleak.fixed.isnot(True),
-                )
-                .all()
+        self.classify_repositories(repo_url=repo_url)
+        self.classify_projects()
+        self.session.commit()
+        self.process_labels(repo_url=repo_url, dry_run_label=dry_run_label)
+
+    def classify_repositories(self, repo_url=None):
+        """Classify the repositories from their open leaks, with one aggregate query"""
+        leaks = (
+            select(
+                Gitleak.repository_id,
+                func.count(Gitleak.id).label("count"),
+                func.max(case((Gitleak.tags.contains("vault"), 2), else_=1)).label(
+                    "critical_value"
+                ),
             )
-            log.debug(
-                f"Processing repo {i}/{len(repositories)}: {repo.name}, with {len(leaks)} leaks"
+            .where(Gitleak.is_false_positive.isnot(True), Gitleak.fixed.isnot(True))
+            .group_by(Gitleak.repository_id)
+            .subquery()
+        )
+        rows = (
+            self.get_repositories_query([], repo_url=repo_url)
+            .filter(Repository.deleted.isnot(True))
+            .outerjoin(leaks, leaks.c.repository_id == Repository.id)
+            .with_entities(
+                Repository.id,
+                Repository.name,
+                Repository.classification,
+                Repository.classification_reason,
+                func.coalesce(leaks.c.count, 0),
+                func.coalesce(leaks.c.critical_value, 0),
             )
-            i += 1
-            for leak in leaks:
-                if "vault" in leak.tags:
-                    critical_value = 2
-                    break
-                else:
-                    critical_value = 1
+            .all()
+        )
+
+        updates = []
+        notifications = []
+        for repo_id, name, classification, reason, count, critical_value in rows:
             new_classification = min(1, critical_value)
-            if new_classification != repo.classification:
-                text = f"{repo.name} classification has been updated from {repo.classification} to {new_classification}"
-                log.debug(text)
-                notification = Notification(
-                    repository=repo,
-                    content=text,
-                    type=NotificationEnum.LEAK,
-                    notified=True,
+            new_reason = CRITICAL_DATA[critical_value]
+            if new_classification != classification:
+                text = f"{name} classification has been updated from {classification} to {new_classification}"
+                log.debug(f"{text}, {count} open leaks")
+                notifications.append(
+                    {
+                        "repository_id": repo_id,
+                        "content": text,
+                        "type": NotificationEnum.LEAK,
+                        "notified": True,
+                    }
+                )
+            if (new_classification, new_reason) != (classification, reason):
+                updates.append(
+                    {
+                        "id": repo_id,
+                        "classification": new_classification,
+                        "classification_reason": new_reason,
+                    }
                 )
-                self.session.add(notification)
-
-            repo.classification_reason = critical_data[critical_value]
-            repo.classification = new_classification
-            try:
-                _labels = self.wrapper.get_labels(repo)
-            except AccessDeniedException:
-                log.info(f"Access Denied for repo {repo.id}")
-                repo.access_denied_to_admin = True
-                count_no_access += 1
-                continue
-
-            except RepoNotFoundException:
-                log.warning(f"Repo {repo.url_http} has been deleted")
-                repo.deleted = True
-                self.session.commit()
-                continue
-
-            except RequestException:
-                log.warning("Error accessing the repo")
-                continue
-
-            labels = list(map(lambda x: x["name"], _labels))
-            if critical_value == 0:
-                if dry_run_label:
-                    log.info(f"[DRY] Add tag Internal to repo {repo.url_http}")
-                    count_internal += 1
-                else:
-                    if "internal" not in labels:
-                        if "confidential" in labels:
-                            try:
-                                log.debug(
-                                    f"Removing label confidential {repo.url_http}"
-                                )
-                                self.wrapper.delete_label(repo, "confidential")
-                            except Exception:
-                                pass  # It throws an exception if the tag doesn't exist
-                        log.debug(f"Adding label internal {repo.url_http}")
-                        try:
-                            self.wrapper.add_label(repo, "internal")
-                        except AccessDeniedException:
-                            log.info(f"Access Denied for repo {repo.id}")
-                            count_no_access += 1
-                            continue
-                        except RequestException as e:
-                            log.exception(e)
-                            continue
-                        count_internal += 1
-                    else:
-                        count_internal += 1
-            else:
-                if dry_run_label:
-                    log.warning(f"[DRY] Add tag Confidential to repo {repo.url_http}")
-                    count_confidential += 1
-                else:
-                    if "confidential" not in labels:
-                        if "internal" in labels:
-                            try:
-                                log.debug(f"Removing label internal {repo.url_http}")
-                                self.wrapper.delete_label(repo, "internal")
-                            except (RequestException, RepoNotFoundException):
-                                pass  # It throws an exception if the tag doesn't exist
-                        log.debug(f"Adding label confidential {repo.url_http}")
-                        try:
-                            self.wrapper.add_label(repo, "confidential")
-                        except AccessDeniedException:
-                            log.info(f"Access Denied for repo {repo.id}")
-                            count_no_access += 1
-                            continue
-                        except RequestException as e:
-                            log.exception(e)
-                            continue
-                        count_confidential += 1
-                    else:
-                        count_confidential += 1
+        if notifications:
+            self.session.execute(insert(Notification), notifications)
+        if updates:
+            self.session.execute(update(Repository), updates)
+        log.info(f"{len(rows)} repositories classified, {len(notifications)} changed")
+
+    def process_labels(self, repo_url=None, dry_run_label=True):
+        """Label the repositories with their classification.
+
+        Only the repositories whose label differs from the last one applied (`Repository.label`) are updated,
+        `classification.labels_concurrency` at a time.
+        """
+        desired = case((Repository.classification == 0, LABELS[0]), else_=LABELS[1])
+        query = self.get_repositories_query([], repo_url=repo_url).filter(
+            Repository.deleted.isnot(True), Repository.classification.isnot(None)
+        )
+        repositories = query.filter(Repository.label.is_distinct_from(desired)).all()
+        skipped = query.count() - len(repositories)
+
+        concurrency = read_config("classification.labels_concurrency", 8)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(
+                executor.map(
+                    lambda repo: self.sync_label(repo, dry_run_label=dry_run_label),
+                    repositories,
+                )
+            )
+
+        summary = Counter()
+        updates = []
+        for repo, status in zip(repositories, statuses):
+            summary[status] += 1
+            if status == LABEL_APPLIED:
+                summary[LABELS[repo.classification]] += 1
+                updates.append({"id": repo.id, "label": LABELS[repo.classification]})
+            elif status == LABEL_DENIED:
+                updates.append({"id": repo.id, "access_denied_to_admin": True})
+            elif status == LABEL_DELETED:
+                updates.append({"id": repo.id, "deleted": True})
+        if updates:
+            self.session.execute(update(Repository), updates)
+        self.session.commit()
         log.info(
             f"""
-        --- Summary ---
-        Repo labeled as Internal: {count_internal}
-        Repo labeled as Confidential: {count_confidential}
-        Repo with no access: {count_no_access}
+        --- Labels ---
+        Applied: {summary[LABEL_APPLIED]} (internal: {summary[LABELS[0]]}, confidential: {summary[LABELS[1]]})
+        Skipped, already applied: {skipped}
+        Access denied: {summary[LABEL_DENIED]}
+        Deleted repositories: {summary[LABEL_DELETED]}
+        Errors: {summary[LABEL_ERROR]}
+        Dry run: {summary[LABEL_DRY_RUN]}
         """
         )
-        projects = self.session.query(RepositoryProject).all()
-        for project in projects:
-            for repo in project.repositories:
-                if project.classification is None or (
-                    repo.classification is not None
-                    and project.classification < repo.classification
-                ):
-                    project.classification = repo.classification
-                    project.classification_reason = repo.classification_reason
-        self.session.commit()
+
+    def sync_label(self, repo: Repository, dry_run_label=True) -> str:
+        """Replace the classification label of a repository, called from the label threads"""
+        label = LABELS[repo.classification]
+        if dry_run_label:
+            log.info(f"[DRY] Add tag {label.title()} to repo {repo.url_http}")
+            return LABEL_DRY_RUN
+        try:
+            labels = [x["name"] for x in self.wrapper.get_labels(repo) or []]
+            for other in LABELS.values():
+                if other != label and other in labels:
+                    log.debug(f"Removing label {other} {repo.url_http}")
+                    try:
+                        self.wrapper.delete_label(repo, other)
+                    except (RequestException, RepoNotFoundException):
+                        pass  # It throws an exception if the tag doesn't exist
+            if label not in labels:
+                log.debug(f"Adding label {label} {repo.url_http}")
+                self.wrapper.add_label(repo, label)
+        except AccessDeniedException:
+            log.info(f"Access Denied for repo {repo.id}")
+            return LABEL_DENIED
+        except RepoNotFoundException:
+            log.warning(f"Repo {repo.url_http} has been deleted")
+            return LABEL_DELETED
+        except RequestException as e:
+            log.exception(e)
+            return LABEL_ERROR
+        return LABEL_APPLIED
+
+    def classify_projects(self):
+        """Raise the classification of the projects to the highest one of their repositories, with one aggregate query"""
+        severity = case(
+            {CRITICAL_DATA[2]: 2, CRITICAL_DATA[1]: 1},
+            value=Repository.classification_reason,
+            else_=0,
+        )
+        rows = (
+            self.session.query(
+                RepositoryProject.id,
+                RepositoryProject.classification,
+                func.max(Repository.classification),
+                func.max(severity),
+            )
+            .join(Repository, Repository.project_id == RepositoryProject.id)
+            .filter(Repository.classification.isnot(None))
+            .group_by(RepositoryProject.id, RepositoryProject.classification)
+            .all()
+        )
+        updates = [
+            {
+                "id": project_id,
+                "classification": classification,
+                "classification_reason": CRITICAL_DATA[critical_value],
+            }
+            for project_id, current, classification, critical_value in rows
+            if current is None or current < classification
+        ]
+        if updates:
+            self.session.execute(update(RepositoryProject), updates)
+        log.debug(f"Classification of {len(updates)} projects raised")
 
     def get_repositories_query(self, filters=None, repo_url: str = None) -> Query[Any]:
         """Get repositories from database with default filters to be sure to have repositories from the current source"""
@@ -1,19 +1,36 @@
+import asyncio
 import logging
 import os
 import subprocess
+import time
 from datetime import datetime, date, timedelta
 from typing import List, Optional
 
 from sqlalchemy.orm import Session
 
+from app.common.api.async_bitbucket_api import AsyncBitBucketApi
 from app.common.api.bitbucket_api import BitBucketApi
+from app.common.api.rate_limit import HIGH, request_priority
 from app.common.git.abstract_git_data import AbstractGitData
 from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
+from app.common.git.mirror_cache import MirrorCache, MirrorError
 from common.models.basemodel import engine
 from common.models.repository import Repository
 from app.utils.tools import read_config
 from common.models.repository_project import RepositoryProject
 
+# Requests of the batch mode, by kind of data
+PREFETCH_CALLS = {
+    "repo_users_permissions": lambda api, repo: api.get_repo_users_permissions(repo),
+    "repo_groups_permissions": lambda api, repo: api.get_repo_groups_permissions(repo),
+    "branches": lambda api, repo: api.get_branches(repo.project.key, repo.slug),
+    "branch_permissions": lambda api, repo: api.get_branch_permissions(repo.project.key, repo.slug),
+    "hooks": lambda api, repo: api.get_hooks(repo.project.key, repo.slug),
+    "branch_model": lambda api, repo: api.get_branch_model(repo.project.key, repo.slug),
+    "repo_branch_permissions": lambda api, repo: api.get_repo_branch_permissions(repo),
+    "labels": lambda api, repo: api.get_labels(repo),
+}
+
 
 class BitbucketApiWrapper(AbstractGitApiWrapper):
     def __init__(self, source: AbstractGitData, repo_db=None):
@@ -21,6 +38,29 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
         self.api = BitBucketApi(source.url, source.token)
         self.session = Session()
 
+    def prefetch(self, repos: list, kinds: list[str]):
+        """Fetch the data of the repositories concurrently with AsyncBitBucketApi, when `http.async.enabled`.
+
+        The results, or the exception raised, are kept until the synchronous getters ask for them.
+        """
+        if not read_config("http.async.enabled", False):
+            return
+        self._prefetched = {}
+        asyncio.run(self._prefetch(repos, kinds))
+
+    async def _prefetch(self, repos: list, kinds: list[str]):
+        async with AsyncBitBucketApi(self.source.url, self.source.token) as api:
+
+            async def fetch(kind, repo):
+                try:
+                    result = await PREFETCH_CALLS[kind](api, repo)
+                except Exception as e:
+                    result = e
+                self._prefetched[(kind, repo.id)] = result
+
+            await asyncio.gather(*(fetch(kind, repo) for repo in repos for kind in kinds))
+        api.stats.log_summary(f"{self.source.url} (batch of {len(repos)} repositories)")
+
     def get_repos(self, visibility="public"):
         return self.api.get_repos(visibility=visibility, all=True)
 
@@ -30,11 +70,6 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
     def clone(self, branch="master") -> Optional[str]:
         if self.path is not None:
             raise RuntimeError(f"Repository has already been cloned to {self.path}")
-        url = self.get_repository().url_http
-        path = read_config("scanner.tmp_git_folder") + url.split("/")[-1].replace(".git", "")
-        if not os.path.exists(path):
-            os.makedirs(path)
-        logging.debug("Cloning repo...")
         ssh = self.source.config.get("ssh")
         private_key = ssh.get("private_key")
         ssh_args = ""
@@ -46,6 +81,16 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
         strict_host_key_checking = ssh.get("strict_host_key_checking")
         if strict_host_key_checking is not None:
             ssh_args += f" -o StrictHostKeyChecking={strict_host_key_checking}"
+        if MirrorCache.is_enabled():
+            git_config = {"core.sshCommand": f"ssh {ssh_args}"} if ssh_args != "" else None
+            try:
+                return self.clone_from_mirror(self.get_repository().url_ssh, branch=branch, git_config=git_config)
+            except MirrorError:
+                self.log.warning("Cloning the repository without the mirror cache")
+        path = self.get_clone_path()
+        if not os.path.exists(path):
+            os.makedirs(path)
+        logging.debug("Cloning repo...")
         args = [
             "git",
             "clone",
@@ -54,8 +99,10 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
             args += f'-c core.sshCommand="ssh {ssh_args}"'.split(" ")
         if branch is not None:
             args.append(f"-b {branch}")
+        args += self.get_clone_args()
         args += [self.get_repository().url_ssh, path]
         self.log.debug(" ".join(args))
+        start_time = time.time()
         proc = subprocess.Popen(
             " ".join(args),
             stderr=subprocess.PIPE,
@@ -72,6 +119,7 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
                 return None
             else:
                 self.log.error(f"Error on cloning {path} (path already exists ?), code error: {exit_code} ")
+        self.set_clone_stats(path, start_time)
         self.directory_path = path
         self.log.debug("Cloning done")
         self.path = path
@@ -104,13 +152,15 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
         return repo
 
     def add_label(self, repo, label):
-        return self.api.add_label_to_repo(repo, label)
+        with request_priority(HIGH):
+            return self.api.add_label_to_repo(repo, label)
 
     def delete_label(self, repo, label):
-        return self.api.delete_label_to_repo(repo, label)
+        with request_priority(HIGH):
+            return self.api.delete_label_to_repo(repo, label)
 
     def get_labels(self, repo):
-        return self.api.get_labels(repo)
+        return self._get_prefetched("labels", repo, lambda: self.api.get_labels(repo))
 
     def get_project_users_permissions(self, project_key):
         users = self.api.get_project_users_permissions(project_key)
@@ -140,7 +190,7 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
         return result
 
     def get_repo_users_permissions(self, repo: Repository) -> List:
-        users = self.api.get_repo_users_permissions(repo)
+        users = self._get_prefetched("repo_users_permissions", repo, lambda: self.api.get_repo_users_permissions(repo))
         result = []
         for _user in users:
             user = _user["user"]
@@ -169,7 +219,7 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
         }
 
     def get_repo_groups_permissions(self, repo):
-        groups = self.api.get_repo_groups_permissions(repo)
+        groups = self._get_prefetched("repo_groups_permissions", repo, lambda: self.api.get_repo_groups_permissions(repo))
         result = []
         for _group in groups:
             group = _group["group"]
@@ -201,15 +251,35 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
             items.append(item["name"])
         return items
 
+    def get_groups_members(self) -> dict:
+        """Members of all the groups, {group name: [users]}, one listing per group instead of one per user.
+
+        With `http.async.enabled`, the members of the groups are fetched concurrently.
+        """
+        groups = [group["name"] for group in self.api.get_admin_groups()]
+        if read_config("http.async.enabled", False):
+            return asyncio.run(self._get_groups_members(groups))
+        return {group: self.api.get_group_members(group) for group in groups}
+
+    async def _get_groups_members(self, groups: list[str]) -> dict:
+        async with AsyncBitBucketApi(self.source.url, self.source.token) as api:
+            members = await asyncio.gather(*(api.get_group_members(group) for group in groups))
+        api.stats.log_summary(f"{self.source.url} (members of {len(groups)} groups)")
+        return dict(zip(groups, members))
+
     def get_branch_permissions(self, branch: str) -> dict:
         repo = self.get_repository()
         project_default_branch_mapping = {}
         if repo is None or branch is None:
             return {}
         try:
-            branches = self.api.get_branch_permissions(self.repo.project.key, repo.slug)
-            hooks = self.api.get_hooks(self.repo.project.key, repo.slug)
-            branching_model = self.api.get_branch_model(self.repo.project.key, repo.slug)
+            branches = self._get_prefetched(
+                "branch_permissions", repo, lambda: self.api.get_branch_permissions(self.repo.project.key, repo.slug)
+            )
+            hooks = self._get_prefetched("hooks", repo, lambda: self.api.get_hooks(self.repo.project.key, repo.slug))
+            branching_model = self._get_prefetched(
+                "branch_model", repo, lambda: self.api.get_branch_model(self.repo.project.key, repo.slug)
+            )
             # displayId = "Development" and not "develop" in this case
             if "development" in branching_model.keys():
                 project_default_branch_mapping[
@@ -295,7 +365,7 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
         if repo is None:
             return None
         try:
-            branches = self.api.get_branches(self.repo.project.key, repo.slug)
+            branches = self._get_prefetched("branches", repo, lambda: self.api.get_branches(self.repo.project.key, repo.slug))
         except Exception as e:
             logging.warning(e)
             return None
@@ -305,7 +375,7 @@ class BitbucketApiWrapper(AbstractGitApiWrapper):
 
     def get_repo_settings(self, repo):
         try:
-            data = self.api.get_repo_branch_permissions(repo)
+            data = self._get_prefetched("repo_branch_permissions", repo, lambda: self.api.get_repo_branch_permissions(repo))
         except Exception as e:
             logging.warning(e)
             return []
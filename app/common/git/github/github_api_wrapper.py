@@ -1,12 +1,17 @@
 import logging
 import os
+import time
 from datetime import datetime, date
 
 from github import Github
 from sqlalchemy.orm import Session
 
+from app.common.api.github_graphql import GRAPHQL_URL, GithubGraphQL
+from app.common.api.http_session import inject_github_session
+from app.common.exceptions.request_exception import RequestException
 from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
 from app.common.git.abstract_git_data import AbstractGitData
+from app.common.git.mirror_cache import MirrorCache, MirrorError
 from common.models.basemodel import engine
 from common.models.repository import Repository
 from app.utils.tools import read_config
@@ -17,17 +22,29 @@ from common.models.user import User
 class GithubApiWrapper(AbstractGitApiWrapper):
     def __init__(self, source: AbstractGitData, repo_db=None):
         super().__init__(source, repo_db, source.url)
+        inject_github_session()
         self.api = Github(source.token, per_page=1000)
+        self._teams_by_org = {}
 
     def clone(self, branch=None) -> str:
         from git import Repo
 
         url = self.get_repository().url_http
-        path = read_config("scanner.tmp_git_folder") + url.split("/")[-1].replace(
-            ".git", ""
-        )
+        if MirrorCache.is_enabled():
+            try:
+                return self.clone_from_mirror(
+                    url.replace(
+                        "https://",
+                        f"https://{self.source.username}:{self.source.token}@",
+                    ),
+                    branch=branch,
+                )
+            except MirrorError:
+                self.log.warning("Cloning the repository without the mirror cache")
+        path = self.get_clone_path()
         if not os.path.exists(path):
             os.makedirs(path)
+        start_time = time.time()
         try:
             Repo.clone_from(
                 url.replace(
@@ -36,10 +53,13 @@ class GithubApiWrapper(AbstractGitApiWrapper):
                 ),
                 path,
                 branch=branch,
+                multi_options=self.get_clone_args(),
             )
         except Exception as e:
             self.log.error(e)
+        self.set_clone_stats(path, start_time)
         self.directory_path = path
+        self.path = path
         return path
 
     def get_leak_url(self, leak):
@@ -96,21 +116,93 @@ class GithubApiWrapper(AbstractGitApiWrapper):
         items = []
         return items
 
-    def get_repo_users_permissions(self, repo):
-        users = self.get_github_repo(repo).get_collaborators()
-        outside_collabs = list(
-            map(
-                lambda user: user.login,
-                list(
-                    self.get_github_repo(repo).get_collaborators(affiliation="outside")
+    def prefetch(self, repos: list, kinds: list[str]):
+        """Fetch the collaborators, teams and branch protections with GraphQL.
+
+        Enabled by `graphql.enabled` in the git source config. `graphql.batch_size`
+        repositories are read per query, the teams once per organisation. The data
+        GraphQL couldn't read is fetched with REST.
+        """
+        config = self.source.config.get("graphql") or {}
+        if not config.get("enabled", False):
+            return
+        self._prefetched = {}
+        client = GithubGraphQL(self.source.token, url=config.get("url", GRAPHQL_URL))
+        collaborators = "repo_users_permissions" in kinds
+        protection = "branch_permissions" in kinds
+        if collaborators or protection:
+            batch_size = config.get("batch_size", 50)
+            for start in range(0, len(repos), batch_size):
+                batch = repos[start : start + batch_size]
+                try:
+                    data = client.get_repositories(
+                        [repo.name for repo in batch],
+                        collaborators=collaborators,
+                        protection=protection,
+                    )
+                except RequestException as e:
+                    self.log.warning(
+                        f"Cannot fetch the repositories with GraphQL, falling back to REST: {e}"
+                    )
+                    continue
+                for repo in batch:
+                    repository = data.get(repo.id, {})
+                    for kind, key in [
+                        ("repo_users_permissions", "collaborators"),
+                        ("branch_permissions", "protection"),
+                    ]:
+                        if repository.get(key) is not None:
+                            self._prefetched[(kind, repo.id)] = repository[key]
+        if "repo_groups_permissions" in kinds:
+            for repo in repos:
+                org = repo.name.split("/", 1)[0]
+                if org not in self._teams_by_org:
+                    try:
+                        self._teams_by_org[org] = client.get_teams_repositories(org)
+                    except RequestException as e:
+                        self.log.warning(
+                            f"Cannot fetch the teams of {org} with GraphQL, falling back to REST: {e}"
+                        )
+                        self._teams_by_org[org] = None
+                teams = self._teams_by_org[org]
+                if teams is not None:
+                    kind = "repo_groups_permissions"
+                    self._prefetched[(kind, repo.id)] = teams.get(repo.id, [])
+
+    def get_collaborators(self, repo: Repository) -> list[dict]:
+        """Collaborators of a repository, with their permissions and affiliation"""
+        github_repo = self.get_github_repo(repo)
+        outside_collabs = [
+            user.login for user in github_repo.get_collaborators(affiliation="outside")
+        ]
+        return [
+            {
+                "login": user.login,
+                "name": user.name,
+                "email": user.email,
+                "id": user.id,
+                "external": user.login in outside_collabs,
+                "permissions": list(
+                    filter(
+                        lambda attr: user.permissions.raw_data[attr],
+                        user.permissions.raw_data.keys(),
+                    )
                 ),
-            )
+            }
+            for user in github_repo.get_collaborators()
+        ]
+
+    def get_repo_users_permissions(self, repo):
+        collaborators = self._get_prefetched(
+            "repo_users_permissions", repo, lambda: self.get_collaborators(repo)
         )
         result = []
-        for _user in list(users):
-            self.log.debug(f"Processing user {_user.login}")
+        for _user in collaborators:
+            self.log.debug(f"Processing user {_user['login']}")
             with Session(engine) as session:
-                user_db = session.query(User).filter(User.slug == _user.login).first()
+                user_db = (
+                    session.query(User).filter(User.slug == _user["login"]).first()
+                )
                 if user_db:
 
                     result.append(
@@ -122,46 +214,34 @@ class GithubApiWrapper(AbstractGitApiWrapper):
                                 "active": True,
                                 "slug": user_db.slug,
                                 "id": user_db.remote_id,
-                                "external": user_db.slug in outside_collabs,
+                                "external": _user["external"],
                             },
-                            "permissions": list(
-                                filter(
-                                    lambda attr: _user.permissions.raw_data[attr],
-                                    _user.permissions.raw_data.keys(),
-                                )
-                            ),
+                            "permissions": _user["permissions"],
                         }
                     )
                 else:
                     result.append(
                         {
-                            "user": self._process_user(
-                                _user, outside_collabs=outside_collabs
-                            ),
-                            "permissions": list(
-                                filter(
-                                    lambda attr: _user.permissions.raw_data[attr],
-                                    _user.permissions.raw_data.keys(),
-                                )
-                            ),
+                            "user": {
+                                "source": "github",
+                                "name": _user["name"],
+                                "emailAddress": _user["email"],
+                                "active": True,
+                                "slug": _user["login"],
+                                "id": _user["id"],
+                                "external": _user["external"],
+                            },
+                            "permissions": _user["permissions"],
                         }
                     )
         return result
 
-    def _process_user(self, user, outside_collabs=None):
-        if outside_collabs is None:
-            outside_collabs = []
-        return {
-            "source": "github",
-            "name": user.name,
-            "emailAddress": user.email,
-            "active": True,
-            "slug": user.login,
-            "id": user.id,
-            "external": user.login in outside_collabs,
-        }
-
     def get_repo_groups_permissions(self, repo):
+        return self._get_prefetched(
+            "repo_groups_permissions", repo, lambda: self.get_teams(repo)
+        )
+
+    def get_teams(self, repo):
         teams = self.get_github_repo(repo).get_teams()
         result = []
         for _team in teams:
@@ -216,6 +296,11 @@ class GithubApiWrapper(AbstractGitApiWrapper):
         repo = self.get_repository()
         if branch == "":
             return {}
+        protection = self._get_prefetched("branch_permissions", repo, lambda: None)
+        if protection is not None and protection["branch"] == branch:
+            if protection["raw_data"] is None:
+                return {}
+            return self._process_protection(protection["raw_data"])
         try:
             data = self.api.get_repo(repo.name).get_branch(branch)
         except Exception as e:
@@ -224,11 +309,12 @@ class GithubApiWrapper(AbstractGitApiWrapper):
 
         if not data.protected:
             return {}
+        return self._process_protection(data.get_protection().raw_data)
+
+    def _process_protection(self, raw_data: dict) -> dict:
+        """Branch permissions from the raw data of a REST branch protection"""
         result = {}
-        protections = data.get_protection()
-        required_pull_request_review = protections.raw_data.get(
-            "required_pull_request_reviews", {}
-        )
+        required_pull_request_review = raw_data.get("required_pull_request_reviews", {})
         result["permissions"] = list(
             filter(
                 lambda attr: required_pull_request_review[attr] is True,
@@ -251,10 +337,10 @@ class GithubApiWrapper(AbstractGitApiWrapper):
 
         result["permissions"] += list(
             filter(
-                lambda attr: protections.raw_data[attr].get("enabled", False)
-                if isinstance(protections.raw_data[attr], dict)
+                lambda attr: raw_data[attr].get("enabled", False)
+                if isinstance(raw_data[attr], dict)
                 else False,
-                protections.raw_data.keys(),
+                raw_data.keys(),
             )
         )
         result["reviewers_required_count"] = required_pull_request_review.get(
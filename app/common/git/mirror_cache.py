@@ -0,0 +1,163 @@
+import contextlib
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+from typing import Optional
+
+from app.utils.tools import get_folder_size, read_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+FETCH_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+
+class MirrorError(Exception):
+    def __init__(self, message: str, stderr: str = ""):
+        super().__init__(message)
+        self.stderr = stderr
+
+
+class MirrorCache:
+    """Bare mirrors of the repositories, kept between the scans and updated with `git fetch --prune`.
+
+    - one bare repository per repository id: `<path>/<id>.git`, the scans check out a worktree from it
+    - an exclusive lock file per mirror (`<path>/<id>.lock`) serialises the fetches and worktree changes of the workers
+    - a shared lock (`<path>/<id>.use`) is held as long as a worktree of the mirror exists, the mirror isn't evicted
+      while a scan uses it
+    - the least recently used mirrors are evicted once the cache is larger than `max_size_mb`
+
+    The remote URL is given on every fetch and never stored in the mirror, so tokens embedded in it don't end up on disk.
+    """
+
+    def __init__(self, path: str = None, max_size_mb: int = None):
+        self.path = path or read_config("scanner.mirror_cache.path", "/tmp/mirrors/")
+        if max_size_mb is None:
+            max_size_mb = read_config("scanner.mirror_cache.max_size_mb")
+        self.max_size = int(max_size_mb) * 1024 * 1024 if max_size_mb is not None else None
+        # Files holding the shared lock of the mirrors whose worktree is checked out, by repository id
+        self._in_use = {}
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return read_config("scanner.mirror_cache.enabled", False)
+
+    def get_mirror_path(self, repo_id: int) -> str:
+        return os.path.join(self.path, f"{repo_id}.git")
+
+    @contextlib.contextmanager
+    def lock(self, repo_id: int, blocking=True, name="lock"):
+        """Exclusive lock on a mirror, shared by every worker using the same cache folder"""
+        with open(os.path.join(self.path, f"{repo_id}.{name}"), "a") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def checkout(self, repo_id: int, url: str, path: str, branch: str = None, git_config: dict = None) -> str:
+        """Update the mirror of a repository and check out a branch of it in `path`, as a detached worktree.
+
+        Raises MirrorError if the fetch or the checkout fails.
+        """
+        mirror_path = self.get_mirror_path(repo_id)
+        self._acquire_use(repo_id)
+        try:
+            self._checkout(repo_id, mirror_path, url, path, branch, git_config)
+        except Exception:
+            self._release_use(repo_id)
+            raise
+        self.evict()
+        return path
+
+    def _checkout(self, repo_id: int, mirror_path: str, url: str, path: str, branch: str = None, git_config: dict = None):
+        with self.lock(repo_id):
+            if not os.path.exists(os.path.join(mirror_path, "HEAD")):
+                self._git(mirror_path, "init", "--bare", "-q", mirror_path, cwd=self.path)
+            self._git(mirror_path, "fetch", "--prune", "--quiet", url, *FETCH_REFSPECS, git_config=git_config)
+            if branch is None:
+                branch = self._get_remote_default_branch(mirror_path, url, git_config)
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            self._git(mirror_path, "worktree", "prune")
+            self._git(mirror_path, "worktree", "add", "--detach", "--force", "-q", path, f"refs/heads/{branch}")
+            os.utime(mirror_path)
+
+    def remove_worktree(self, repo_id: int, path: str):
+        mirror_path = self.get_mirror_path(repo_id)
+        try:
+            with self.lock(repo_id):
+                if os.path.exists(mirror_path):
+                    try:
+                        self._git(mirror_path, "worktree", "remove", "--force", path)
+                    except MirrorError as e:
+                        log.warning(f"Cannot remove the worktree {path}: {e.stderr}")
+                        shutil.rmtree(path, ignore_errors=True)
+                        self._git(mirror_path, "worktree", "prune")
+        finally:
+            self._release_use(repo_id)
+
+    def evict(self) -> int:
+        """Delete the least recently used mirrors until the cache fits in its budget, returns the bytes freed.
+
+        Mirrors locked or having a worktree checked out, by this worker or another one, are left alone.
+        """
+        if self.max_size is None:
+            return 0
+        mirrors = []
+        for entry in os.scandir(self.path):
+            if entry.is_dir() and entry.name.endswith(".git"):
+                mirrors.append((entry.stat().st_mtime, entry.name[: -len(".git")], entry.path, get_folder_size(entry.path)))
+        total = sum(size for *_, size in mirrors)
+        freed = 0
+        for _, repo_id, mirror_path, size in sorted(mirrors):
+            if total - freed <= self.max_size:
+                break
+            with self.lock(repo_id, blocking=False) as locked, self.lock(repo_id, blocking=False, name="use") as unused:
+                if not locked or not unused:
+                    continue
+                log.info(f"Evicting mirror {mirror_path} ({size // (1024 * 1024)} MB)")
+                shutil.rmtree(mirror_path, ignore_errors=True)
+                freed += size
+        return freed
+
+    def _acquire_use(self, repo_id: int):
+        """Take the shared lock of a mirror until its worktree is removed, waits while the mirror is being evicted"""
+        if repo_id in self._in_use:
+            return
+        use_file = open(os.path.join(self.path, f"{repo_id}.use"), "a")
+        fcntl.flock(use_file, fcntl.LOCK_SH)
+        self._in_use[repo_id] = use_file
+
+    def _release_use(self, repo_id: int):
+        use_file = self._in_use.pop(repo_id, None)
+        if use_file is not None:
+            fcntl.flock(use_file, fcntl.LOCK_UN)
+            use_file.close()
+
+    def _get_remote_default_branch(self, mirror_path: str, url: str, git_config: dict = None) -> str:
+        output = self._git(mirror_path, "ls-remote", "--symref", url, "HEAD", git_config=git_config)
+        for line in output.splitlines():
+            if line.startswith("ref: refs/heads/"):
+                return line.split("\t")[0][len("ref: refs/heads/") :]
+        raise MirrorError(f"Cannot find the default branch of {mirror_path}")
+
+    @staticmethod
+    def _git(mirror_path: str, *args, git_config: dict = None, cwd: str = None) -> str:
+        command = ["git"]
+        for key, value in (git_config or {}).items():
+            command += ["-c", f"{key}={value}"]
+        if cwd is None:
+            command += ["-C", mirror_path]
+        result = subprocess.run(command + list(args), capture_output=True, cwd=cwd)
+        if result.returncode != 0:
+            stderr = result.stderr.decode("utf-8", errors="replace")
+            raise MirrorError(f"git {args[0]} failed on {mirror_path}: {stderr}", stderr)
+        return result.stdout.decode("utf-8", errors="replace")
@@ -1,5 +1,11 @@
+import contextlib
+import fcntl
+import glob
+import hashlib
 import logging
-import uuid
+import os
+import threading
+import time
 
 import regex
 
@@ -8,10 +14,30 @@ from app.utils.tools import read_config
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 types_mapping = {"hcVault": HcVaultSecretSource}
+CONFIG_FOLDER = "/tmp"
 
 
 class GitLeaksVault:
+    def __init__(self):
+        self.sources = {}
+
     def generate_gitleaks_config_file(self) -> str:
+        """Write the gitleaks config to a file named after its content, so it is only written once"""
+        config = self.render_config()
+        digest = hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+        filename = os.path.join(CONFIG_FOLDER, f"gitleaks-{digest}.toml")
+        if not os.path.exists(filename):
+            tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}"
+            # The rules contain the secrets, only readable by the scanner
+            with open(
+                os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+                "w",
+            ) as r:
+                r.write(config)
+            os.replace(tmp_filename, filename)
+        return filename
+
+    def render_config(self) -> str:
         source_config = read_config("secret_sources")
         config_file = read_config("scanner.config_file", None)
         secrets = ""
@@ -45,20 +71,35 @@ class GitLeaksVault:
                 encoding="UTF-8",
             ) as file:
                 config += file.read()
+        return config
 
-        filename = "/tmp/" + str(uuid.uuid4()) + ".toml"
-        with open(filename, "w+") as r:
-            r.write(config)
-        return filename
+    def get_versions(self) -> dict | None:
+        """Versions of the secrets of every enabled source, None if a source can't tell them"""
+        versions = {}
+        for source_name, source_data in read_config("secret_sources").items():
+            if source_data.get("enabled", False):
+                try:
+                    versions[source_name] = self.get_source(
+                        source_name, source_data
+                    ).get_versions()
+                except Exception as e:
+                    log.warning(f"Cannot read the versions of {source_name}: {e}")
+                    return None
+        return versions
 
-    def read_and_write_hc_vault(self, name: str, config: dict) -> str:
-        source_type = config.get("type")
-        if source_type not in types_mapping.keys():
-            raise ValueError(
-                f"Source of type {source_type} is unknown for source {name}"
-            )
+    def get_source(self, name: str, config: dict):
+        """Secret source client, created (and authenticated) once"""
+        if name not in self.sources:
+            source_type = config.get("type")
+            if source_type not in types_mapping.keys():
+                raise ValueError(
+                    f"Source of type {source_type} is unknown for source {name}"
+                )
+            self.sources[name] = types_mapping[source_type](config)
+        return self.sources[name]
 
-        hc_api = types_mapping[source_type](config)
+    def read_and_write_hc_vault(self, name: str, config: dict) -> str:
+        hc_api = self.get_source(name, config)
         secrets = hc_api.get_secrets()
         result = ""
         for path, secret in secrets.items():
@@ -66,3 +107,124 @@ class GitLeaksVault:
 
         log.info(f"Read {len(secrets.keys())} secrets from {hc_api.url}")
         return result
+
+
+class GitLeaksConfigCache:
+    """Gitleaks config shared by all the scans of the worker.
+
+    The config is only rendered again when `scanner.gitleaks_config_ttl` seconds have passed and the versions of
+    the secrets have changed in the secret sources. A single login to the sources is needed for that check.
+
+    The scans hold a shared lock on the file while gitleaks runs (`use`), the files are only deleted when nobody holds
+    it, by this worker or another one using the same folder.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.filename = None
+        self.versions = None
+        self.expires_at = 0.0
+        # Files of this worker which couldn't be deleted because they were in use
+        self._stale = set()
+
+    def get(self) -> str:
+        with self._lock:
+            if (
+                self.filename is not None
+                and time.time() < self.expires_at
+                and os.path.exists(self.filename)
+            ):
+                return self.filename
+            vault = GitLeaksVault()
+            # Read before rendering, a secret changed meanwhile is rendered again on the next check
+            versions = vault.get_versions()
+            if (
+                versions is None
+                or versions != self.versions
+                or self.filename is None
+                or not os.path.exists(self.filename)
+            ):
+                log.info("Generating the gitleaks config")
+                filename = vault.generate_gitleaks_config_file()
+                if self.filename is not None and self.filename != filename:
+                    self._stale.add(self.filename)
+                self.filename = filename
+                self.versions = versions
+                self._remove_expired()
+            # Still current, not deleted as expired by the other workers
+            os.utime(self.filename)
+            self.expires_at = time.time() + float(
+                read_config("scanner.gitleaks_config_ttl", 900)
+            )
+            return self.filename
+
+    @contextlib.contextmanager
+    def use(self):
+        """Path of the config, not deleted until the block exits"""
+        for _ in range(3):
+            filename = self.get()
+            try:
+                config_file = open(filename, "r")
+            except FileNotFoundError:
+                # Deleted by another worker since get()
+                with self._lock:
+                    self.expires_at = 0.0
+                continue
+            with config_file:
+                fcntl.flock(config_file, fcntl.LOCK_SH)
+                if (
+                    os.path.exists(filename)
+                    and os.stat(filename).st_ino
+                    == os.fstat(config_file.fileno()).st_ino
+                ):
+                    yield filename
+                    return
+        raise FileNotFoundError(f"The gitleaks config {filename} keeps being deleted")
+
+    def clear(self):
+        with self._lock:
+            if self.filename is not None:
+                self._stale.add(self.filename)
+            self.filename = None
+            self.versions = None
+            self.expires_at = 0.0
+            self._remove_expired()
+
+    def _remove_expired(self):
+        """Delete the configs left by the previous renders, of this worker or others"""
+        self._stale = {
+            filename
+            for filename in self._stale
+            if filename != self.filename and not self._remove(filename)
+        }
+        ttl = float(read_config("scanner.gitleaks_config_ttl", 900))
+        for filename in glob.glob(os.path.join(CONFIG_FOLDER, "gitleaks-*.toml")):
+            try:
+                expired = os.stat(filename).st_mtime < time.time() - ttl
+            except FileNotFoundError:
+                continue
+            if filename != self.filename and expired:
+                self._remove(filename)
+
+    @staticmethod
+    def _remove(filename: str) -> bool:
+        """Delete a config unless a scan uses it, return False if it is in use"""
+        try:
+            config_file = open(filename, "r")
+        except FileNotFoundError:
+            return True
+        with config_file:
+            try:
+                fcntl.flock(config_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                log.debug(f"The gitleaks config {filename} is in use, not deleted")
+                return False
+            if (
+                os.path.exists(filename)
+                and os.stat(filename).st_ino == os.fstat(config_file.fileno()).st_ino
+            ):
+                os.remove(filename)
+        return True
+
+
+gitleaks_config = GitLeaksConfigCache()
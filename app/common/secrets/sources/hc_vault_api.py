@@ -1,8 +1,11 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import hvac
+from hvac.exceptions import InvalidPath
 
 from app.common.secrets.sources.abstract_secrets_source import AbstractSecretSource
+from app.common.secrets.sources.secret_cache import EncryptedSecretCache
 from app.utils.tools import read_env_variable
 
 
@@ -23,6 +26,13 @@ class HcVaultSecretSource(AbstractSecretSource):
             raise Exception(f"Missing role id or secret for vault {self.url}")
         self.auth_method = vault_config.get("auth_method", "approle")
         self.path = vault_config.get("path", None)
+        # KV v2 mounts harvested when the path is a "data" folder, the mount of the path by default
+        self.mounts = vault_config.get("mounts") or [
+            (self.path or "").rsplit("/data", 1)[0]
+        ]
+        self.concurrency = vault_config.get("concurrency", 8)
+        self.cache = EncryptedSecretCache.from_config(vault_config)
+        self.versions = None
 
         self.client = hvac.Client(
             url=self.url, verify=vault_config.get("ca_cert", None)
@@ -47,20 +57,84 @@ class HcVaultSecretSource(AbstractSecretSource):
                         continue
                     result[self.path + "/" + key] = secret
             else:
-                directories = self._list_directories()
-                result = {}
-                for directory in directories:
-                    secrets = self._get_secret(self.path + "/" + directory)
+                for path, secrets in self._harvest().items():
                     for key, secret in secrets.items():
                         if key in self.excludes:
                             continue
-                        result[directory + "/" + key] = secret
+                        result[self._get_name(path) + "/" + key] = secret
         return result
 
-    def _list_directories(self):
-        response = self.client.adapter.request("GET", "v1/infra/metadata/?list=1")
+    def get_versions(self) -> dict:
+        """KV v2 metadata version of every secret read by get_secrets, cheaper to compare than the secrets"""
+        if ":" in self.path or not self.path.endswith("data"):
+            return {self.path: self._get_version(self.path.split(":")[0])}
+        if self.versions is not None:
+            # Already listed by this client, get_secrets reads the secrets at those versions
+            return self.versions
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            paths = self._list_secrets(executor)
+            self.versions = dict(zip(paths, executor.map(self._get_version, paths)))
+        return self.versions
+
+    def _harvest(self) -> dict:
+        """Read every secret of the mounts, only the ones whose version changed since the last harvest if cached"""
+        versions = self.get_versions()
+        cached = self.cache.load() if self.cache is not None else {}
+        to_read = [
+            path
+            for path, version in versions.items()
+            if path not in cached or cached[path]["version"] != version
+        ]
+        self.log.info(
+            f"Reading {len(to_read)} secrets from {self.url}, {len(versions) - len(to_read)} unchanged"
+        )
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for path, secrets in zip(to_read, executor.map(self._get_secret, to_read)):
+                cached[path] = {"version": versions[path], "data": secrets}
+        # Secrets deleted from the vault are dropped from the cache as well
+        harvested = {path: cached[path] for path in versions}
+        if self.cache is not None and len(to_read) > 0:
+            self.cache.save(harvested)
+        return {path: secret["data"] for path, secret in harvested.items()}
+
+    def _list_secrets(self, executor: ThreadPoolExecutor) -> list:
+        """List recursively the secrets of the mounts, one level of folders at a time"""
+        paths = []
+        folders = [(mount, "") for mount in self.mounts]
+        while folders:
+            listed = list(
+                executor.map(lambda folder: self._list_folder(*folder), folders)
+            )
+            next_folders = []
+            for (mount, prefix), keys in zip(folders, listed):
+                for key in keys:
+                    if key.endswith("/"):
+                        next_folders.append((mount, prefix + key))
+                    else:
+                        paths.append(f"{mount}/data/{prefix}{key}")
+            folders = next_folders
+        return paths
+
+    def _list_folder(self, mount: str, prefix: str) -> list:
+        try:
+            response = self.client.adapter.request(
+                "GET", f"v1/{mount}/metadata/{prefix}?list=1"
+            )
+        except InvalidPath:
+            return []
         return response["data"]["keys"]
 
+    def _get_name(self, path: str) -> str:
+        """Name of a secret in the rules, relative to its mount when only one is harvested"""
+        mount, name = path.split("/data/", 1)
+        return name if len(self.mounts) == 1 else f"{mount}/{name}"
+
+    def _get_version(self, path) -> int:
+        response = self.client.adapter.request(
+            "GET", "v1/" + path.replace("/data", "/metadata", 1)
+        )
+        return response["data"]["current_version"]
+
     def _get_secret(self, path) -> dict:
         secret = path
         field = None
@@ -0,0 +1,47 @@
+import json
+import logging
+import os
+from typing import Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.utils.tools import read_env_variable
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class EncryptedSecretCache:
+    """Secrets read from a source with the version they were read at, stored encrypted with Fernet.
+
+    Content: {secret path: {"version": int, "data": {key: secret}}}
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.fernet = Fernet(key)
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["EncryptedSecretCache"]:
+        """Cache of a secret source, None if no path or no key are configured"""
+        cache_config = config.get("cache") or {}
+        key = read_env_variable(cache_config.get("key_env"))
+        if cache_config.get("path") is None or not key:
+            return None
+        return cls(cache_config["path"], key)
+
+    def load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            try:
+                return json.loads(self.fernet.decrypt(f.read()))
+            except (InvalidToken, ValueError):
+                log.warning(f"Cannot decrypt the secrets cache {self.path}, all the secrets will be read again")
+                return {}
+
+    def save(self, secrets: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(self.fernet.encrypt(json.dumps(secrets).encode("utf-8")))
+        os.replace(tmp_path, self.path)
@@ -3,16 +3,38 @@ from abc import ABC, abstractmethod
 from sqlalchemy.orm import Session
 
 from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
+from app.utils.identity_cache import IdentityCache
+from app.utils.tools import read_config
 
 
 class AbstractFetcher(ABC):
     """Abstract fetcher class."""
 
-    def __init__(self, session: Session, wrapper: AbstractGitApiWrapper, config: dict):
+    def __init__(
+        self,
+        session: Session,
+        wrapper: AbstractGitApiWrapper,
+        config: dict,
+        identities: IdentityCache = None,
+    ):
         self.wrapper = wrapper
         self.session = session
         self.config = config
+        # Users and groups, shared by the fetchers of a task
+        self.identities = identities or IdentityCache(session, wrapper)
 
     @abstractmethod
     def fetch(self, repositories_query):
         pass
+
+    def prefetched(self, repos: list, kinds: list[str], skip=None):
+        """Iterate over the repositories, their data being prefetched by batches.
+
+        The batches have `http.async.batch_size` repositories. `skip` tells which
+        repositories won't be processed, their data isn't prefetched.
+        """
+        batch_size = read_config("http.async.batch_size", 200)
+        for start in range(0, len(repos), batch_size):
+            batch = repos[start : start + batch_size]
+            self.wrapper.prefetch([repo for repo in batch if skip is None or not skip(repo)], kinds)
+            yield from batch
@@ -1,17 +1,23 @@
+import hashlib
 import logging
 
+from sqlalchemy import delete, insert, update
 from sqlalchemy.orm import Session
 
 from app.runners.fetchers.abstract_fetcher import AbstractFetcher
 from common.models.basemodel import engine
-from common.models.group import Group, UserGroupRelation
+from common.models.group import UserGroupRelation
 from common.models.repository import Repository
 from common.models.repository_project import RepositoryProject
 from common.models.user import User
-from app.utils.helper import process_group
+from app.utils.bulk import bulk_upsert
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# Columns refreshed from Bitbucket on the existing rows, the others are only set when the row is added
+PROJECT_UPDATE_COLUMNS = ["key", "name", "description"]
+REPOSITORY_UPDATE_COLUMNS = ["slug", "name", "description"]
+
 
 class BitbucketFetcher(AbstractFetcher):
     """Bitbucket fetcher class implementation"""
@@ -22,139 +28,167 @@ class BitbucketFetcher(AbstractFetcher):
         self.session.commit()
 
     def get_repo_to_db(self):
+        """Upsert the projects and repositories of Bitbucket in bulk"""
         log.info("Importing BitBucket Repositories....")
         projects = self.wrapper.get_projects()
-        count = 0
+        private_repos = self.wrapper.get_repos(visibility="private")
+        public_repos = self.wrapper.get_repos(visibility="public")
+        repos = {repo["id"]: repo for repo in private_repos + public_repos}
+
+        project_rows = {project["id"]: self.get_project_row(project) for project in projects}
+        for repo in repos.values():
+            _project = repo["project"]
+            if _project["id"] not in project_rows:
+                logging.warning(
+                    f"Repo {repo['id']} is linked to an unknown project {_project['key']}, adding it to projects"
+                )
+                project_rows[_project["id"]] = self.get_project_row(_project)
 
         with Session(engine) as session:
-            projects_db = [
-                value
-                for value, in session.query(RepositoryProject)
-                .with_entities(RepositoryProject.id)
-                .all()
-            ]
-
-            for project in projects:
-                if project["id"] not in projects_db:
-                    rp = RepositoryProject(
-                        id=project["id"],
-                        key=project["key"],
-                        type=project["type"],
-                        url=project["links"]["self"][0]["href"],
-                        name=project["name"],
-                        description=project["description"]
-                        if "description" in project
-                        else None,
-                        confidentiality="public" if project["public"] else "private",
-                        source="bitbucket",
-                    )
-                    session.add(rp)
-                    logging.info(f"Adding project {rp.key}")
-                    count += 1
-            session.commit()
-            logging.info(f"{count} projects have been added")
-
-            private_repos = self.wrapper.get_repos(visibility="private")
-            public_repos = self.wrapper.get_repos(visibility="public")
-
-            count = 0
-
-            for repo in private_repos + public_repos:
-                count += self.add_project_and_repo_to_db(repo, session)
-            session.commit()
-
-            logging.info(f"{count} repositories have been added")
-
-    def add_project_and_repo_to_db(self, repo: dict, session: Session) -> int:
-        _project = repo["project"]
-        project = (
-            session.query(RepositoryProject)
-            .filter(RepositoryProject.id == _project["id"])
-            .first()
-        )
-        if project is None:
-            logging.warning(
-                f"Repo {repo['id']} is linked to an unknown project {_project['key']}, adding it to projects"
+            counts = bulk_upsert(
+                session,
+                RepositoryProject,
+                list(project_rows.values()),
+                update_columns=PROJECT_UPDATE_COLUMNS,
             )
-            project = RepositoryProject(
-                id=_project["id"],
-                key=_project["key"],
-                type=_project["type"],
-                url=_project["links"]["self"][0]["href"],
-                name=_project["name"],
-                description=_project["description"]
-                if "description" in _project
-                else None,
-                source="bitbucket",
+            logging.info(
+                f"Projects: {counts['inserted']} added, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged"
             )
-            if "public" in _project:
-                project.confidentiality = "public" if _project["public"] else "private"
-            session.add(project)
-        repository = (
-            session.query(Repository).filter(Repository.id == repo["id"]).first()
-        )
-        if repository is None:
-
-            repository = Repository(
-                id=repo["id"],
-                slug=repo["slug"],
-                url=repo["links"]["self"][0]["href"],
-                name=repo["name"],
-                confidentiality="public" if repo["public"] else "private",
-                description=repo["description"] if "description" in repo else None,
-                source="bitbucket",
-                project=project,
+            counts = bulk_upsert(
+                session,
+                Repository,
+                [self.get_repository_row(repo) for repo in repos.values()],
+                update_columns=REPOSITORY_UPDATE_COLUMNS,
             )
-            logging.info(f"Adding repository {repository.name}")
-            links = repo["links"]
-            if "clone" in links:
-                for link in links["clone"]:
-                    if link["name"] == "ssh":
-                        repository.url_ssh = link["href"]
-                    elif link["name"] == "http":
-                        repository.url_http = link["href"]
-            session.add(repository)
-            return 1
-        else:
-            repository.slug = repo["slug"]
-            repository.name = (repo["name"],)
-            repository.description = (
-                repo["description"] if "description" in repo else None,
+            session.commit()
+            logging.info(
+                f"Repositories: {counts['inserted']} added, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged"
             )
-            return 0
+
+    @staticmethod
+    def get_project_row(project: dict) -> dict:
+        confidentiality = None
+        if "public" in project:
+            confidentiality = "public" if project["public"] else "private"
+        return {
+            "id": project["id"],
+            "key": project["key"],
+            "type": project["type"],
+            "url": project["links"]["self"][0]["href"],
+            "name": project["name"],
+            "description": project.get("description"),
+            "confidentiality": confidentiality,
+            "source": "bitbucket",
+        }
+
+    @staticmethod
+    def get_repository_row(repo: dict) -> dict:
+        row = {
+            "id": repo["id"],
+            "slug": repo["slug"],
+            "url": repo["links"]["self"][0]["href"],
+            "name": repo["name"],
+            "confidentiality": "public" if repo["public"] else "private",
+            "description": repo.get("description"),
+            "source": "bitbucket",
+            "project_id": repo["project"]["id"],
+            "url_ssh": None,
+            "url_http": None,
+        }
+        for link in repo["links"].get("clone", []):
+            if link["name"] == "ssh":
+                row["url_ssh"] = link["href"]
+            elif link["name"] == "http":
+                row["url_http"] = link["href"]
+        return row
 
     def get_groups_from_users(self, user_id=None):
-        sources = ["bitbucket"]
-        filters = []
+        """Synchronize the groups of the Bitbucket users with the members of the Bitbucket groups.
+
+        The members are listed per group and compared in memory with the relations of the database. Only the users
+        whose groups changed since the last sync (`User.groups_hash`) are updated, with bulk statements.
+        """
+        log.info("Synchronizing BitBucket groups....")
+        members = self.wrapper.get_groups_members()
+        user_groups = {}
+        memberships = {}
+        for group, users in members.items():
+            for user in users:
+                user_groups.setdefault(user["id"], set()).add(group)
+                memberships.setdefault(user["slug"], []).append(group)
+        # The users added by the next fetchers won't have to ask for their groups
+        self.identities.memberships.update(memberships)
+
+        filters = [User.source == "bitbucket"]
         if user_id is not None:
             filters.append(User.id == user_id)
-        with Session(engine) as session:
-            users = (
-                session.query(User)
-                .filter(*filters)
-                .filter(User.source.in_(sources))
-                .all()
-            )
-            i = 0
-            for user in users:
-                i += 1
-
-                log.debug(f"Processing {user.source} user {user.name} {i}/{len(users)}")
-                _groups = self.wrapper.get_groups(user.name)
-                groups_db = list(map(lambda x: x.name, user.groups))
-                groups_deleted = (
-                    session.query(Group)
-                    .filter(~Group.name.in_(_groups), Group.name.in_(groups_db))
-                    .all()
-                )
-                session.query(UserGroupRelation).filter(
-                    UserGroupRelation.group_id.in_(map(lambda x: x.id, groups_deleted))
-                ).delete()
-                log.debug(f"{len(groups_deleted)} groups has been removed")
-                new_groups = set(_groups) - set(groups_db)
-                log.debug(f"{len(new_groups)} groups has been added")
-                for group in new_groups:
-                    group_db = process_group(
-                        session, {"name": group}, source="bitbucket"
+        changed = {}
+        for user in self.session.query(User).filter(*filters):
+            groups = user_groups.get(user.remote_id, set())
+            groups_hash = self.get_groups_hash(groups)
+            if user.groups_hash != groups_hash:
+                changed[user] = (groups, groups_hash)
+        log.debug(f"{len(changed)} users have new groups")
+        if not changed:
+            return
+
+        desired = set()
+        for user, (groups, _) in changed.items():
+            for group in groups:
+                desired.add(
+                    (
+                        user,
+                        self.identities.get_group({"name": group}, source="bitbucket"),
                     )
-                    user.groups.append(group_db)
+                )
+        # The new groups get their id
+        self.session.flush()
+        desired = {(user.id, self.identities.get_id(group)) for user, group in desired}
+        current = {
+            (relation.user_id, relation.group_id): relation.id
+            for relation in self.session.query(UserGroupRelation).filter(
+                UserGroupRelation.user_id.in_([user.id for user in changed])
+            )
+        }
+        inserts, deletes = self.diff_user_groups(current, desired)
+
+        if inserts:
+            self.session.execute(insert(UserGroupRelation), inserts)
+        if deletes:
+            self.session.execute(
+                delete(UserGroupRelation).where(UserGroupRelation.id.in_(deletes))
+            )
+        self.session.execute(
+            update(User),
+            [
+                {"id": user.id, "groups_hash": groups_hash}
+                for user, (_, groups_hash) in changed.items()
+            ],
+        )
+        for user in changed:
+            # Reloaded with the new relations when they are used
+            self.session.expire(user, ["groups", "groups_hash"])
+        log.info(
+            f"Groups of {len(changed)} users synchronized: {len(inserts)} added, {len(deletes)} removed"
+        )
+
+    @staticmethod
+    def get_groups_hash(groups) -> str:
+        return hashlib.sha256("\n".join(sorted(groups)).encode()).hexdigest()
+
+    @staticmethod
+    def diff_user_groups(current: dict, desired: set) -> tuple[list[dict], list[int]]:
+        """Relations to insert and ids of the relations to delete.
+
+        `current` maps the (user_id, group_id) of the database to the relation id, `desired` has the ones of Bitbucket.
+        """
+        inserts = [
+            {"user_id": user_id, "group_id": group_id}
+            for user_id, group_id in sorted(desired - current.keys())
+        ]
+        deletes = [
+            relation_id for key, relation_id in current.items() if key not in desired
+        ]
+        return inserts, deletes
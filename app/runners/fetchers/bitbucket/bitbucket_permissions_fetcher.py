@@ -14,7 +14,7 @@ from common.models.repository_project import (
     RepositoryProject,
     RepositoryProjectPermission,
 )
-from app.utils.helper import process_user, process_group
+from app.utils.identity_cache import IdentityCache
 from app.utils.notifications import process_notification
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -29,8 +29,9 @@ class BitbucketPermissionsFetcher(PermissionsFetcher):
         wrapper: BitbucketApiWrapper,
         config: dict,
         only_projects: bool = False,
+        identities: IdentityCache = None,
     ):
-        super().__init__(session, wrapper, config)
+        super().__init__(session, wrapper, config, identities=identities)
         self.only_projects = only_projects
 
     def fetch(self, repositories_query):
@@ -118,9 +119,9 @@ class BitbucketPermissionsFetcher(PermissionsFetcher):
             db_user = None
             db_group = None
             if user is not None:
-                db_user = process_user(self.session, user, self.wrapper)
+                db_user = self.identities.get_user(user)
             else:
-                db_group = process_group(self.session, group)
+                db_group = self.identities.get_group(group)
 
             db_permission = (
                 self.session.query(RepositoryProjectPermission)
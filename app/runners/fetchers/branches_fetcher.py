@@ -17,7 +17,8 @@ class BranchesFetcher(AbstractFetcher):
             Repository.archived == False,
         ]
         repos = repositories_query.filter(*filters).all()
-        for repo in repos:
+        kinds = ["branches", "branch_permissions", "hooks", "branch_model"]
+        for repo in self.prefetched(repos, kinds):
             self.fetch_branch_permission(repo)
 
     def fetch_branch_permission(self, repo: Repository):
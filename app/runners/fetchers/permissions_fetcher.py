@@ -1,15 +1,18 @@
 import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, update
 
 from app.common.exceptions.access_denied_exception import AccessDeniedException
 from app.common.exceptions.repo_not_found_exception import RepoNotFoundException
 from app.runners.fetchers.abstract_fetcher import AbstractFetcher
+from app.utils.tools import read_config
 from common.models.notification_action_enum import NotificationActionEnum
 from common.models.notification_enum import NotificationEnum
 from common.models.permission_enum import PermissionEnum
 from common.models.notifications import Notification
 from common.models.repository import Repository
 from common.models.repository_permission import RepositoryPermission
-from app.utils.helper import process_user, process_group
 from app.utils.notifications import process_notification
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -27,10 +30,16 @@ class PermissionsFetcher(AbstractFetcher):
         # Process all repos
         repos = repositories_query.filter(*filters).all()
         i = 0
-        for repo in repos:
+        kinds = ["repo_users_permissions", "repo_groups_permissions"]
+        batch_size = read_config("fetcher.permissions_batch_size", 200)
+        permissions = {}
+        for repo in self.prefetched(repos, kinds, skip=lambda r: "~" in r.url_http):
             self.wrapper.repo = repo
             log.debug(f"Processing repo {i}/{len(repos)}: ({repo.slug})")
             i += 1
+            if len(permissions) >= batch_size:
+                self.process_repos_permissions(permissions)
+                permissions = {}
             try:
                 if "~" in repo.url_http:
                     log.debug(f"Bypassing repo {repo.url_http}, looks like a personal repo")
@@ -51,71 +60,120 @@ class PermissionsFetcher(AbstractFetcher):
                     self.session.commit()
                     continue
 
-                # Process user and groups permissions
-                self.process_repo_permission(permission_users + permission_groups, repo)
+                # User and groups permissions are processed by batch
+                permissions[repo] = permission_users + permission_groups
             except Exception as e:
                 log.exception(e)
-        self.session.commit()
+        self.process_repos_permissions(permissions)
+
+    def process_repos_permissions(self, permissions: dict) -> list[Repository]:
+        """Process the permissions of a batch of repositories, {repo: permissions of the API}.
+
+        When the batch fails, its repositories are processed one by one so that a failing repository doesn't discard
+        the permissions of the others. Returns the repositories whose permissions couldn't be processed.
+        """
+        try:
+            self.reconcile_permissions(permissions)
+            return []
+        except Exception as e:
+            log.exception(e)
+            self.session.rollback()
+        if len(permissions) <= 1:
+            return list(permissions)
+
+        log.warning(f"Permissions of a batch of {len(permissions)} repos failed, processing them one by one")
+        failed = []
+        for repo, repo_permissions in permissions.items():
+            try:
+                self.reconcile_permissions({repo: repo_permissions})
+            except Exception as e:
+                log.exception(e)
+                self.session.rollback()
+                failed.append(repo)
+        if failed:
+            log.error(f"Permissions of {len(failed)} repos not processed: {', '.join(repo.url_http for repo in failed)}")
+        return failed
+
+    def reconcile_permissions(self, permissions: dict):
+        """Reconcile and commit the permissions of repositories, {repo: permissions of the API}.
+
+        The users and groups come from the identity cache. The permissions of the repositories are loaded at once,
+        compared in memory with the API ones and the changes are written with bulk statements.
+        """
+        entries = []
+        for repo, repo_permissions in permissions.items():
+            for permission in repo_permissions:
+                if permission.get("user") is not None:
+                    entries.append((repo, permission, self.identities.get_user(permission["user"]), None))
+                elif permission.get("group") is not None:
+                    entries.append((repo, permission, None, self.identities.get_group(permission["group"], source=repo.source)))
+                else:
+                    log.debug(f"User or group is null for json {permission}")
+        # The new users and groups get their id
+        self.session.flush()
 
-    def process_repo_permission(self, permissions, repo):
-        """Process permissions for a repository."""
-        _permissions = []
-        for permission in permissions:
-            user = permission["user"] if "user" in permission else None
-            group = permission["group"] if "group" in permission else None
-            _perm = permission["permissions"]
-            if user is None and group is None:
-                log.debug(f"User or group is null for json {permission}")
-                continue
-            db_user = None
-            db_group = None
-            if user is not None:
-                db_user = process_user(self.session, user, self.wrapper)
+        desired = {}
+        for repo, permission, db_user, db_group in entries:
+            if db_user is not None:
+                key = (repo.id, self.identities.get_id(db_user), None)
             else:
-                db_group = process_group(self.session, group)
-            db_permission = (
-                self.session.query(RepositoryPermission)
-                .filter(
-                    RepositoryPermission.repository == repo,
-                    RepositoryPermission.user == db_user,
-                    RepositoryPermission.group == db_group,
-                )
-                .first()
-            )
-
-            if db_permission is None:  # Permission doesn't exist in DB, adding it
-                db_permission = RepositoryPermission(
-                    repository=repo,
-                    user=db_user,
-                    group=db_group,
-                )
-
-                self.session.add(db_permission)
-                log.debug(f"Adding new permission for repo {db_permission.repository.slug}")
-
-            if isinstance(_perm, list):
-                db_permission.permissions = _perm
+                key = (repo.id, None, self.identities.get_id(db_group))
+            desired[key] = self.get_permission_values(permission["permissions"])
+
+        repos = {repo.id: repo for repo in permissions}
+        existing = self.session.query(RepositoryPermission).filter(RepositoryPermission.repository_id.in_(repos)).all()
+        inserts, updates, deletes = self.diff_permissions(existing, desired)
+
+        for permission in deletes:
+            self.notify_deleted_permission(permission, repo=repos[permission.repository_id])
+        if inserts:
+            self.session.execute(insert(RepositoryPermission), inserts)
+        if updates:
+            now = datetime.now(timezone.utc)
+            self.session.execute(update(RepositoryPermission), [dict(row, updated_at=now) for row in updates])
+        if deletes:
+            self.session.execute(delete(RepositoryPermission).where(RepositoryPermission.id.in_([permission.id for permission in deletes])))
+        log.debug(f"Permissions of {len(repos)} repos: {len(inserts)} added, {len(updates)} updated, {len(deletes)} deleted")
+        self.session.commit()
+
+    @staticmethod
+    def get_permission_values(permission) -> dict:
+        """Columns of a RepositoryPermission for a permission of the API, a list (GitHub) or a PermissionEnum name"""
+        if isinstance(permission, list):
+            return {"permissions": permission}
+        return {"permission": PermissionEnum[permission]}
+
+    @staticmethod
+    def diff_permissions(existing: list[RepositoryPermission], desired: dict) -> tuple[list[dict], list[dict], list[RepositoryPermission]]:
+        """Compare the permissions of the database with the API ones, keyed by (repository_id, user_id, group_id).
+
+        Returns the rows to insert, the changed columns to update with the id of their permission and the permissions to
+        delete, the duplicates of a key included.
+        """
+        current = {}
+        deletes = []
+        for permission in existing:
+            key = (permission.repository_id, permission.user_id, permission.group_id)
+            if key in desired and key not in current:
+                current[key] = permission
             else:
-                db_permission.permission = PermissionEnum[_perm]
-
-            # Add the id in the array, needed to check deleted item
-            _permissions.append(db_permission.id)
-
-        # Check if permissions has been removed
-        db_permissions = (
-            self.session.query(RepositoryPermission)
-            .filter(
-                RepositoryPermission.repository == repo,
-                ~RepositoryPermission.id.in_(_permissions),
-            )
-            .all()
-        )
+                deletes.append(permission)
 
-        # Check existing permissions
-        for _permission in db_permissions:
-            self.process_deleted_permission(_permission, repo=repo)
+        inserts, updates = [], []
+        for key, values in desired.items():
+            permission = current.get(key)
+            if permission is None:
+                repository_id, user_id, group_id = key
+                inserts.append(dict(values, repository_id=repository_id, user_id=user_id, group_id=group_id))
+            elif any(getattr(permission, column) != value for column, value in values.items()):
+                updates.append(dict(values, id=permission.id))
+        return inserts, updates, deletes
 
     def process_deleted_permission(self, permission, repo=None, project=None):
+        self.notify_deleted_permission(permission, repo=repo, project=project)
+        self.session.delete(permission)
+
+    def notify_deleted_permission(self, permission, repo=None, project=None):
         text = (
             f"Permission for {'project' if project is not None else 'repo'} has been deleted,"
             f" entity: {permission.group_id if permission.group_id else permission.user_id}"
@@ -132,4 +190,3 @@ class PermissionsFetcher(AbstractFetcher):
             content=text,
         )
         process_notification(notification, self.session)
-        self.session.delete(permission)
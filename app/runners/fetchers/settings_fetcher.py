@@ -8,7 +8,6 @@ from common.models.notifications import Notification
 from common.models.repository import Repository
 from common.models.repository_project import RepositoryProject
 from common.models.repository_setting import RepositorySetting
-from app.utils.helper import process_user, process_group
 from app.utils.notifications import process_notification
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -26,7 +25,7 @@ class SettingsFetcher(AbstractFetcher):
         i = 0
         _settings = []
         _repos_processed = []
-        for repo in repos:
+        for repo in self.prefetched(repos, ["repo_branch_permissions"], skip=lambda r: not r.is_processable()):
             self.wrapper.repo = repo
             if not repo.is_processable():
                 i += 1
@@ -113,11 +112,11 @@ class SettingsFetcher(AbstractFetcher):
                     log.debug(f"Removing group {group_db.id} from repository {repository_setting.repository.name}")
                     repository_setting.groups.remove(group_db)
             for user in users:
-                user_db = process_user(self.session, user, self.wrapper)
+                user_db = self.identities.get_user(user)
                 repository_setting.users.append(user_db)
 
             for group in groups:
-                group_db = process_group(self.session, group, source=repo.source)
+                group_db = self.identities.get_group(group, source=repo.source)
                 repository_setting.groups.append(group_db)
 
             _settings.append(repository_setting.id)
@@ -4,11 +4,31 @@ from abc import ABC, abstractmethod
 from sqlalchemy.orm import Session
 
 from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
+from app.common.git.abstract_git_data import AbstractGitData
+from app.common.git.bitbucket.bitbucket_api_wrapper import BitbucketApiWrapper
 from common.models.repository import Repository
 
 log = logging.getLogger(__name__)
 
 
+def check_source_type(source_data: AbstractGitData):
+    """Raise if the repositories of the git source can't be scanned"""
+    if source_data.type == "github":
+        raise NotImplementedError("Github is not implemented yet")
+    if source_data.type != "bitbucket":
+        raise ValueError(f"Unknown git source type {source_data.type}")
+
+
+def get_git_api_wrapper(
+    source_data: AbstractGitData, repo: Repository
+) -> AbstractGitApiWrapper:
+    """New wrapper of the git source, to clone and scan a repository"""
+    check_source_type(source_data)
+    git_api_wrapper = BitbucketApiWrapper(source_data)
+    git_api_wrapper.repo = repo
+    return git_api_wrapper
+
+
 class AbstractProcessor(ABC):
     def __init__(
         self, session: Session, repo: Repository, git_api_wrapper: AbstractGitApiWrapper
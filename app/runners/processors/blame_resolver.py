@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+from app.utils.tools import read_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class BlameCache:
+    """SQLite store of the blame results, per repository and file.
+
+    A file is only blamed again when its blob id changes, ie. when the file has been modified since the last run.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS blame ("
+                "repository_id INTEGER, file TEXT, blob TEXT, lines TEXT, commits TEXT, PRIMARY KEY (repository_id, file))"
+            )
+
+    def get(self, repository_id: int, file: str, blob: str) -> tuple[dict, dict]:
+        row = self.connection.execute(
+            "SELECT lines, commits FROM blame WHERE repository_id = ? AND file = ? AND blob = ?",
+            (repository_id, file, blob),
+        ).fetchone()
+        if row is None:
+            return {}, {}
+        return {int(line): sha for line, sha in json.loads(row[0]).items()}, json.loads(row[1])
+
+    def set(self, repository_id: int, file: str, blob: str, lines: dict, commits: dict):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO blame (repository_id, file, blob, lines, commits) VALUES (?, ?, ?, ?, ?)",
+                (repository_id, file, blob, json.dumps(lines), json.dumps(commits)),
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class BlameResolver:
+    """Resolve the commit of many findings with one `git blame` per file.
+
+    All the line ranges of a file are blamed with a single `git blame --porcelain -L a,b -L c,d` call. For every
+    finding, the oldest commit among its lines is kept, like the last commit of `git log -L` was: the attribution, and
+    the fingerprint of the leak, don't change when a line of the range is edited later.
+    """
+
+    def __init__(self, git_path: str, repository_id: int, cache: BlameCache = None):
+        self.git_path = git_path
+        self.repository_id = repository_id
+        self.cache = cache
+        if cache is None and read_config("scanner.blame_cache_path") is not None:
+            self.cache = BlameCache(read_config("scanner.blame_cache_path"))
+
+    def resolve(self, leaks: list[dict]) -> dict:
+        """Return the commit of each finding, keyed by (File, StartLine, EndLine). Files must be relative to the repo"""
+        ranges_by_file = {}
+        for leak in leaks:
+            ranges_by_file.setdefault(leak["File"], set()).add((int(leak["StartLine"]), int(leak["EndLine"])))
+
+        blobs = self._get_blobs(list(ranges_by_file.keys())) if self.cache is not None else {}
+        result = {}
+        for file, ranges in ranges_by_file.items():
+            lines, commits = self._blame_file(file, ranges, blobs.get(file))
+            for start, end in ranges:
+                candidates = [commits[lines[line]] for line in range(start, max(start, end) + 1) if line in lines]
+                if candidates:
+                    commit = dict(min(candidates, key=lambda _commit: _commit["timestamp"]))
+                    commit["date"] = datetime.fromisoformat(commit["date"])
+                    result[(file, start, end)] = commit
+        return result
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def _blame_file(self, file: str, ranges: set, blob: str = None) -> tuple[dict, dict]:
+        lines, commits = {}, {}
+        if blob is not None:
+            lines, commits = self.cache.get(self.repository_id, file, blob)
+        missing = [(start, end) for start, end in ranges if any(line not in lines for line in range(start, max(start, end) + 1))]
+        if not missing:
+            return lines, commits
+
+        max_line = self._count_lines(file)
+        args = ["git", "-C", self.git_path, "blame", "--porcelain"]
+        for start, end in sorted(missing):
+            if max_line is not None:
+                start, end = min(start, max_line), min(max(start, end), max_line)
+            args += ["-L", f"{start},{end}"]
+        args += ["HEAD", "--", file]
+        try:
+            output = subprocess.check_output(args, stderr=subprocess.PIPE).decode("utf-8", errors="replace")
+        except subprocess.CalledProcessError as e:
+            log.error(f"Error for getting blame: {' '.join(args)}: {e.stderr.decode('utf-8', errors='replace')}")
+            return lines, commits
+        blamed_lines, blamed_commits = parse_blame_porcelain(output)
+        lines.update(blamed_lines)
+        commits.update(blamed_commits)
+        if blob is not None:
+            self.cache.set(self.repository_id, file, blob, lines, commits)
+        return lines, commits
+
+    def _get_blobs(self, files: list[str]) -> dict:
+        """Get the blob id of every file at HEAD with a single `git ls-tree`"""
+        try:
+            output = subprocess.check_output(
+                ["git", "-C", self.git_path, "ls-tree", "-z", "HEAD", "--"] + files, stderr=subprocess.PIPE
+            ).decode("utf-8", errors="replace")
+        except subprocess.CalledProcessError as e:
+            log.warning(f"Cannot list the blobs of {self.git_path}: {e.stderr}")
+            return {}
+        blobs = {}
+        for entry in output.split("\0"):
+            if "\t" in entry:
+                meta, file = entry.split("\t", 1)
+                blobs[file] = meta.split(" ")[2]
+        return blobs
+
+    def _count_lines(self, file: str) -> int | None:
+        try:
+            with open(os.path.join(self.git_path, file), "rb") as f:
+                return max(1, sum(1 for _ in f))
+        except OSError:
+            return None
+
+
+def parse_blame_porcelain(output: str) -> tuple[dict, dict]:
+    """Parse `git blame --porcelain` output into {line: hash} and {hash: commit}"""
+    lines, commits = {}, {}
+    current = None
+    for line in output.split("\n"):
+        if line.startswith("\t") or line == "":
+            continue
+        key, _, value = line.partition(" ")
+        if len(key) == 40 and all(char in "0123456789abcdef" for char in key):
+            current = commits.setdefault(key, {"hash": key})
+            lines[int(value.split(" ")[1])] = key
+        elif current is not None:
+            current[key] = value
+
+    for sha, commit in commits.items():
+        timestamp = int(commit.get("author-time", 0))
+        tz = commit.get("author-tz", "+0000")
+        offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * (-1 if tz[0] == "-" else 1)
+        commits[sha] = {
+            "hash": sha,
+            "author": commit.get("author"),
+            "email": commit.get("author-mail", "").strip("<>"),
+            "title": commit.get("summary"),
+            "timestamp": timestamp,
+            # Author local time, like `git log` displays it
+            "date": datetime.fromtimestamp(timestamp, timezone(offset)).replace(tzinfo=None).isoformat(),
+        }
+    return lines, commits
@@ -0,0 +1,92 @@
+import functools
+import logging
+import os
+import re
+import shutil
+
+from app.utils.tools import read_config
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+GLOB_CHARS = ("*", "?")
+
+
+def _is_glob(pattern: str) -> bool:
+    return any(char in pattern for char in GLOB_CHARS)
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translate a glob into a regex, "*" and "?" don't cross folders, "**" does"""
+    return re.escape(pattern).replace(r"\*\*", ".*").replace(r"\*", "[^/]*").replace(r"\?", "[^/]")
+
+
+class IgnoreMatcher:
+    """Matcher for the `scanner.ignore` rules, compiled once.
+
+    - extensions: set lookup on the lower-cased extension
+    - files: set lookup on the file name, or a combined regex for globs (ex: "*.min.js")
+    - folders: one combined regex matching any folder of the path (ex: "node_modules", "src/test", "vendor*")
+    """
+
+    def __init__(self, extensions=(), files=(), folders=()):
+        extensions = extensions or ()
+        files = files or ()
+        folders = folders or ()
+        self.extensions = {extension.lower() for extension in extensions if not _is_glob(extension)}
+        self.files = {file for file in files if not _is_glob(file)}
+
+        name_patterns = [_glob_to_regex(file) for file in files if _is_glob(file)]
+        name_patterns += ["[^/]*" + _glob_to_regex(extension) for extension in extensions if _is_glob(extension)]
+        self.names_regex = re.compile("(?:" + "|".join(name_patterns) + r")\Z", re.IGNORECASE) if name_patterns else None
+
+        folder_patterns = [_glob_to_regex(folder.strip("/")) for folder in folders if folder and folder.strip("/")]
+        self.folders_regex = re.compile("(?:^|/)(?:" + "|".join(folder_patterns) + ")/") if folder_patterns else None
+
+    @classmethod
+    def from_config(cls) -> "IgnoreMatcher":
+        return _compile(
+            read_config("scanner.ignore.extensions", default=()),
+            read_config("scanner.ignore.files", default=()),
+            read_config("scanner.ignore.folders", default=()),
+        )
+
+    def is_ignored(self, path: str) -> bool:
+        """Check if a path, relative to the root of the repository, matches one of the rules"""
+        name = path.rsplit("/", 1)[-1]
+        if os.path.splitext(name)[1].lower() in self.extensions or name in self.files:
+            return True
+        if self.names_regex is not None and self.names_regex.match(name):
+            return True
+        return self.folders_regex is not None and self.folders_regex.search(path) is not None
+
+    def is_ignored_folder(self, path: str) -> bool:
+        return self.folders_regex is not None and self.folders_regex.search(path.rstrip("/") + "/") is not None
+
+    def prune(self, root: str) -> int:
+        """Delete the ignored files and folders of a checkout, so that gitleaks doesn't scan them.
+
+        Returns the number of files and folders deleted.
+        """
+        deleted = 0
+        for dirpath, dirnames, filenames in os.walk(root):
+            relative = os.path.relpath(dirpath, root)
+            relative = "" if relative == "." else relative + "/"
+            for dirname in list(dirnames):
+                if dirname == ".git":
+                    dirnames.remove(dirname)
+                elif self.is_ignored_folder(relative + dirname):
+                    shutil.rmtree(os.path.join(dirpath, dirname), ignore_errors=True)
+                    dirnames.remove(dirname)
+                    deleted += 1
+            for filename in filenames:
+                if self.is_ignored(relative + filename):
+                    os.remove(os.path.join(dirpath, filename))
+                    deleted += 1
+        log.debug(f"{deleted} ignored files and folders removed from {root}")
+        return deleted
+
+
+@functools.lru_cache(maxsize=8)
+def _compile(extensions: tuple, files: tuple, folders: tuple) -> IgnoreMatcher:
+    # The config values are tuples, the matcher is only compiled again when the config file changes
+    return IgnoreMatcher(extensions, files, folders)
@@ -0,0 +1,60 @@
+import logging
+import os
+import shutil
+import subprocess
+from typing import Optional
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def git(path: str, *args) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", "-C", path] + list(args), capture_output=True)
+
+
+def get_head(path: str) -> tuple[Optional[str], Optional[str]]:
+    """Return the commit and the branch name checked out in a clone"""
+    commit = git(path, "rev-parse", "HEAD")
+    branch = git(path, "rev-parse", "--abbrev-ref", "HEAD")
+    if commit.returncode != 0:
+        log.warning(f"Cannot read the HEAD of {path}: {commit.stderr.decode('utf-8', errors='replace')}")
+        return None, None
+    return commit.stdout.decode().strip(), branch.stdout.decode().strip() if branch.returncode == 0 else None
+
+
+def get_changed_files(path: str, since: str, until: str = "HEAD") -> Optional[list[str]]:
+    """List the files changed between two commits, deleted files included.
+
+    Returns None when `since` is not an ancestor of `until` anymore (history rewritten by a force push, or the
+    commit is unknown), in which case the whole repository has to be scanned again.
+    """
+    if git(path, "merge-base", "--is-ancestor", since, until).returncode != 0:
+        log.info(f"{since} is not an ancestor of {until} in {path}, history has been rewritten")
+        return None
+    result = git(path, "diff", "--name-only", "--no-renames", "-z", since, until)
+    if result.returncode != 0:
+        log.warning(f"Cannot diff {since}..{until} in {path}: {result.stderr.decode('utf-8', errors='replace')}")
+        return None
+    return [file for file in result.stdout.decode("utf-8", errors="replace").split("\0") if file]
+
+
+def stage_files(path: str, files: list[str], staging_path: str) -> int:
+    """Link the files that still exist in the clone into a staging folder, keeping their relative path.
+
+    Returns the number of files staged.
+    """
+    if os.path.exists(staging_path):
+        shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+    staged = 0
+    for file in files:
+        source = os.path.join(path, file)
+        if not os.path.isfile(source) or os.path.islink(source):
+            continue
+        destination = os.path.join(staging_path, file)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+        staged += 1
+    return staged
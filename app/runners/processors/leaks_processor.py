@@ -2,33 +2,166 @@ import subprocess
 import datetime
 import logging
 import os
+import shutil
+from collections.abc import Iterator
 
 import dateparser
-from sqlalchemy import and_
+from sqlalchemy import and_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 
-from app.common.secrets.process_secret_sources import GitLeaksVault
+from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
+from app.common.secrets.process_secret_sources import gitleaks_config
 from app.runners.processors.abstract_processor import AbstractProcessor
+from app.runners.processors.blame_resolver import BlameResolver
+from app.runners.processors.ignore_matcher import IgnoreMatcher
+from app.runners.processors.incremental_scan import (
+    get_changed_files,
+    get_head,
+    stage_files,
+)
 from common.models.notification_action_enum import NotificationActionEnum
 from common.models.notification_enum import NotificationEnum
 from common.models.gitleaks import Gitleak
 from common.models.notifications import Notification
+from common.models.repository import Repository
 from app.utils import tools
-from app.utils.notifications import process_notification
-from app.utils.tools import read_config
+from app.utils.notifications import process_notifications
+from app.utils.tools import batched, read_config
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# Findings of the report filtered, blamed and added to the database at once
+LEAKS_BATCH_SIZE = 500
+LEAK_COLUMNS = [
+    "branch",
+    "lineNumber",
+    "offender",
+    "offenderEntropy",
+    "commit",
+    "leakURL",
+    "rule",
+    "commitMessage",
+    "author",
+    "email",
+    "file",
+    "date",
+    "tags",
+    "fingerprint",
+]
+# Former rule names, the leaks stored with them are renamed when the scan finds them again
+RENAMED_RULES = ["Generic API Key"]
+# Columns of a stored leak updated when the scan finds it again with another fingerprint
+MATCHED_LEAK_COLUMNS = [
+    "rule",
+    "commit",
+    "commitMessage",
+    "author",
+    "email",
+    "date",
+    "fingerprint",
+]
+
 
 class LeaksProcessor(AbstractProcessor):
-    full_mode = "full"
     path = None
+    scan_path = None
     config_filename = None
+    # Files changed since the last scanned commit, None when the whole repository is scanned
+    changed_files = None
+    head_commit = None
+    head_branch = None
+
+    def __init__(
+        self,
+        session: Session,
+        repo: Repository,
+        git_api_wrapper: AbstractGitApiWrapper,
+        full_mode=True,
+    ):
+        super().__init__(session, repo, git_api_wrapper)
+        self.full_mode = full_mode
 
     def process(self, path: str):
+        self.scan(path)
+        self.process_gitleaks()
+
+    def scan(self, path: str) -> bool:
+        """Run gitleaks on the cloned repository, without touching the database"""
         self.path = path
-        glv = GitLeaksVault()
-        self.config_filename = glv.generate_gitleaks_config_file()
-        self.run_gitleaks()
+        self.scan_path = path
+        self.changed_files = None
+        self.head_commit, self.head_branch = get_head(path)
+        if self.head_branch == "HEAD":
+            # Detached worktree checked out from the mirror cache
+            self.head_branch = self.repo.default_branch
+        if not self.full_mode and read_config("scanner.incremental.enabled", False):
+            self.prepare_incremental_scan()
+            if self.changed_files is not None and len(self.changed_files) == 0:
+                log.info(f"No change in {self.repo.slug} since the last scan")
+                return True
+        try:
+            if read_config("scanner.ignore.prune", False):
+                IgnoreMatcher.from_config().prune(self.scan_path)
+            with gitleaks_config.use() as self.config_filename:
+                success = self.run_gitleaks()
+            if success and self.git_api_wrapper.is_shallow() and self.has_leaks():
+                # The blame needs the history, only fetched for the repositories with findings
+                self.git_api_wrapper.deepen()
+            return success
+        finally:
+            if self.scan_path != self.path:
+                shutil.rmtree(self.scan_path, ignore_errors=True)
+
+    def prepare_incremental_scan(self):
+        """Only scan the files changed since the last scanned commit of the branch.
+
+        Falls back to a full scan when the repository has never been scanned, when the default branch changed or
+        when the history has been rewritten since the last scan.
+        """
+        last_commit = self.repo.last_scanned_commit
+        if (
+            last_commit is None
+            or self.head_commit is None
+            or self.repo.last_scanned_branch != self.head_branch
+        ):
+            log.info(f"No previous scan of {self.repo.slug} to compare with, full scan")
+            return
+        if self.git_api_wrapper.is_shallow():
+            self.git_api_wrapper.deepen()
+        changed_files = get_changed_files(self.path, last_commit, self.head_commit)
+        if changed_files is None:
+            log.warning(
+                f"History of {self.repo.slug} has been rewritten since {last_commit}, full scan"
+            )
+            return
+        log.info(
+            f"Incremental scan of {self.repo.slug}: {len(changed_files)} files changed since {last_commit}"
+        )
+        self.changed_files = changed_files
+        if len(changed_files) > 0:
+            self.scan_path = self.path.rstrip("/") + "-diff"
+            stage_files(self.path, changed_files, self.scan_path)
+
+    def has_leaks(self) -> bool:
+        report_path = self.git_api_wrapper.get_report_path()
+        return (
+            os.path.exists(report_path)
+            and next(tools.iter_json(report_path), None) is not None
+        )
+
+    def mark_scanned(self):
+        self.repo.last_scanned_commit = self.head_commit
+        self.repo.last_scanned_branch = self.head_branch
+
+    def get_relative_file(self, file: str) -> str:
+        """Return the path of a reported file relative to the root of the scanned repository"""
+        for path in (self.scan_path, self.path):
+            if path is not None and file.startswith(path.rstrip("/") + "/"):
+                return file[len(path.rstrip("/")) + 1 :]
+        return file.replace(read_config("scanner.tmp_git_folder"), "").replace(
+            self.git_api_wrapper.repo.slug + "/", "", 1
+        )
 
     def run_gitleaks(
         self,
@@ -39,7 +172,7 @@ class LeaksProcessor(AbstractProcessor):
                 "gitleaks",
                 "detect",
                 "--source",
-                self.path,
+                self.scan_path,
                 "--report-path",
                 self.git_api_wrapper.get_report_path(),
                 "-c",
@@ -58,263 +191,280 @@ class LeaksProcessor(AbstractProcessor):
             log.exception(e)
         return False
 
-    def check_existing_leaks(self, leaks_found):
+    def check_existing_leaks(self, found_fingerprints: set, found_urls: set):
         log.info(
             f"Checking existing leaks to see if some have been fixed for {self.repo.name}"
         )
 
+        repository_id = self.session.merge(self.repo).id
         leaks = (
             self.session.query(Gitleak)
             .filter(
                 and_(
-                    Gitleak.repository_id == self.session.merge(self.repo).id,
+                    Gitleak.repository_id == repository_id,
                     Gitleak.is_false_positive.is_(False),
                     Gitleak.fixed.is_(False),
                 )
             )
             .all()
         )
+        if self.changed_files is not None:
+            # Incremental scan, the leaks of the unchanged files can't have been fixed
+            changed_files = set(self.changed_files)
+            leaks = [leak for leak in leaks if leak.file in changed_files]
+
         leak_unfound = []
         for leak in leaks:
-            found = False
-            for _leak_found in leaks_found:
-                if leak == _leak_found:  # Use __eq__ method inside Gitleak Object
-                    if leak.rule == "Generic API Key":
-                        leak.rule = _leak_found.rule
-
-                    found = True
-                    break
-            if not found:
+            # The leaks whose fingerprint changed get the new one in save_leaks
+            fingerprint = leak.fingerprint or leak.get_fingerprint(repository_id)
+            if fingerprint not in found_fingerprints and leak.leakURL not in found_urls:
                 log.info(f"Leak {leak.id} has not been found. Will be tagged as fixed")
-                notification = Notification(
-                    repository=self.repo,
+                leak_unfound.append(leak)
+
+        if len(leak_unfound) > 0:
+            self.session.execute(
+                update(Gitleak)
+                .where(Gitleak.id.in_([leak.id for leak in leak_unfound]))
+                .values(
+                    fixed=True, fixed_date=datetime.datetime.now(datetime.timezone.utc)
+                )
+            )
+            notifications = [
+                Notification(
+                    repository_id=repository_id,
                     action_type=NotificationActionEnum.DELETE,
-                    leak=leak,
+                    leak_id=leak.id,
                     type=NotificationEnum.LEAK,
                     notified=True,
                     resolved=True,
                     content=f"Leak {leak.id} has not been found. Will be tagged as fixed",
                 )
-                process_notification(notification, self.session)
-                leak_unfound.append(leak)
-        for leak in leak_unfound:
-            leak.fixed = True
-            leak.fixed_date = datetime.datetime.now(datetime.timezone.utc)
+                for leak in leak_unfound
+            ]
+            process_notifications(notifications, self.session)
         self.session.commit()
 
-        log.info("Check done")
+        log.info(f"Check done, {len(leak_unfound)} leaks fixed")
 
     def process_gitleaks(self):
+        if self.changed_files is not None and len(self.changed_files) == 0:
+            self.mark_scanned()
+            self.session.commit()
+            return
         report_path = self.git_api_wrapper.get_report_path()
         if not os.path.exists(report_path):
             log.info(f"Report file {report_path} doesn't exist, skipping...")
             return
         try:
-            leaks = self.filter_leaks()
-            leaks_objects = []
-            for leak in leaks:
-                # Check duplicate
-                leak["File"] = (
-                    leak["File"]
-                    .replace(read_config("scanner.tmp_git_folder"), "")
-                    .replace(self.git_api_wrapper.repo.slug + "/", "", 1)
-                )
-
-                leak["Date"] = dateparser.parse(leak["Date"])
-                # Fetch project and repo from URL
-                _repo_url = self.git_api_wrapper.get_leak_url(leak)
-                if read_config("scanner.display.links", default=False):
-                    log.info(_repo_url)
-
-                gitleak = Gitleak(
-                    branch=self.repo.default_branch,
-                    lineNumber=leak["StartLine"],
-                    offender=leak["Secret"],
-                    offenderEntropy=leak["Entropy"],
-                    commit=leak["Commit"],
-                    leakURL=_repo_url,
-                    rule=leak["Description"],
-                    commitMessage=leak["Message"],
-                    author=leak["Author"],
-                    email=leak["Email"],
-                    file=leak["File"],
-                    date=leak["Date"],
-                    tags=leak["Tags"],
-                )
-                log.info("Checking duplication")
-
-                # Get blame to have commit information
-                commits = self.get_commits_from_line(
-                    read_config("scanner.tmp_git_folder")
-                    + self.git_api_wrapper.repo.slug,
-                    leak,
-                )
-                if len(commits) > 0:
-                    commit = commits[-1]
-                    gitleak.commitMessage = commit["title"]
-                    gitleak.author = commit["author"]
-                    gitleak.date = commit["date"]
-                    gitleak.commit = commit["hash"]
-
-                leak_db = (
-                    self.session.query(Gitleak)
-                    .filter(
-                        Gitleak.file == gitleak.file,
-                        Gitleak.rule == gitleak.rule,
-                        Gitleak.date == gitleak.date,
-                        Gitleak.branch == gitleak.branch,
-                        Gitleak.commit == gitleak.commit,
-                        Gitleak.repository_id == self.git_api_wrapper.repo.id,
-                    )
-                    .first()
-                )
-                leaks_objects.append(gitleak)
-                if leak_db is not None:
-                    # Check if line number has changed
-                    if leak_db.lineNumber != gitleak.lineNumber:
-                        log.warning(
-                            f"Found a leak that has only changed number of line. Leak ID: {leak_db.id}. Updating the line number"
-                        )
-                        leak_db.lineNumber = gitleak.lineNumber
-                        continue
-                    if leak_db.fixed:
-                        log.warning(
-                            f"Found a fixed leak in the repo. Leak ID: {leak_db.id}. Removing the fixed flag."
-                        )
-                        leak_db.fixed = False
-                        leak_db.fixed_date = None
-                        continue
-
-                    log.debug("Leak already processed. Skipping")
-                    continue
-
-                content = f"A new leak has been found in repo {self.repo.slug}. <br />URL: {_repo_url}.<br />"
-                log.info(content)
-
+            # Only the identity of the leaks found is kept, to detect the fixed ones
+            found_fingerprints = set()
+            found_urls = set()
+            batch_size = read_config("scanner.leaks_batch_size", LEAKS_BATCH_SIZE)
+            blame_resolver = BlameResolver(
+                self.path
+                or read_config("scanner.tmp_git_folder")
+                + self.git_api_wrapper.repo.slug,
+                self.git_api_wrapper.repo.id,
+            )
+            for leaks in batched(self.filter_leaks(), batch_size):
+                leaks_objects = self.get_gitleaks(leaks, blame_resolver)
+                found_fingerprints.update(leak.fingerprint for leak in leaks_objects)
+                found_urls.update(leak.leakURL for leak in leaks_objects)
                 if self.repo:
-                    notification = Notification(
-                        repository=self.repo,
-                        action_type=NotificationActionEnum.ADD,
-                        leak=gitleak,
-                        type=NotificationEnum.LEAK,
-                        content=content,
-                    )
-                    process_notification(notification, self.session)
-                    gitleak.repository = self.repo
-                    self.session.add(gitleak)
-                    log.info("Adding leak to database")
-                else:
-                    log.error(
-                        f"No repo found to link with. Will not be link with any, "
-                        f"and report json will be kept. {self.git_api_wrapper.get_report_path()}"
-                    )
+                    self.save_leaks(leaks_objects)
+                    self.session.flush()
+            blame_resolver.close()
+            log.info(f"{len(found_fingerprints)} leaks found in the report")
+            if not self.repo:
+                log.error(
+                    f"No repo found to link with. Will not be link with any, "
+                    f"and report json will be kept. {self.git_api_wrapper.get_report_path()}"
+                )
 
             if self.git_api_wrapper.repo_from_db:
                 self.git_api_wrapper.repo.last_scan_date = datetime.datetime.today()
                 # self.session.add(processor.repo)
             self.session.commit()
-            self.check_existing_leaks(leaks_objects)
+            self.check_existing_leaks(found_fingerprints, found_urls)
+            self.mark_scanned()
+            self.session.commit()
             if (
-                self.git_api_wrapper.repo_from_db or len(leaks) == 0
+                self.git_api_wrapper.repo_from_db or len(found_fingerprints) == 0
             ) and os.path.exists(self.git_api_wrapper.get_report_path()):
                 os.remove(self.git_api_wrapper.get_report_path())
         except Exception as e:
             logging.exception(e)
 
-    def filter_leaks(self) -> list:
-        report_path = self.git_api_wrapper.get_report_path()
-        leaks = tools.read_json(report_path)
+    def save_leaks(self, leaks: list[Gitleak]):
+        """Add the new leaks of a batch with INSERT ... ON CONFLICT (fingerprint) DO NOTHING.
+
+        The leaks already stored get their line number updated and lose their fixed flag.
+        An open leak stored with another fingerprint (other commit attribution, former rule
+        name of RENAMED_RULES) is matched by its URL and secret, and takes the new
+        fingerprint instead of being added again.
+        """
+        repository_id = self.git_api_wrapper.repo.id
+        leaks = list({leak.fingerprint: leak for leak in leaks}.values())
+        existing = {
+            leak_db.fingerprint: leak_db
+            for leak_db in self.session.query(Gitleak).filter(
+                Gitleak.fingerprint.in_([leak.fingerprint for leak in leaks])
+            )
+        }
+        candidates = self.get_leaks_by_url(
+            [leak.leakURL for leak in leaks if leak.fingerprint not in existing],
+            exclude_fingerprints=[leak.fingerprint for leak in leaks],
+        )
+        new_leaks = []
+        for gitleak in leaks:
+            leak_db = existing.get(gitleak.fingerprint)
+            if leak_db is None:
+                leak_db = self.pop_matching_leak(
+                    candidates.get(gitleak.leakURL, []), gitleak
+                )
+                if leak_db is not None:
+                    log.info(
+                        f"Leak {leak_db.id} is now reported by {gitleak.rule} "
+                        f"in commit {gitleak.commit}, updating its fingerprint"
+                    )
+                    for column in MATCHED_LEAK_COLUMNS:
+                        setattr(leak_db, column, getattr(gitleak, column))
+            if leak_db is None:
+                new_leaks.append(gitleak)
+            elif leak_db.lineNumber != gitleak.lineNumber:
+                log.warning(
+                    f"Found a leak that has only changed number of line. Leak ID: {leak_db.id}. Updating the line number"
+                )
+                leak_db.lineNumber = gitleak.lineNumber
+            elif leak_db.fixed:
+                log.warning(
+                    f"Found a fixed leak in the repo. Leak ID: {leak_db.id}. Removing the fixed flag."
+                )
+                leak_db.fixed = False
+                leak_db.fixed_date = None
+        if len(new_leaks) == 0:
+            return
 
-        filtered_leaks = []
+        now = datetime.datetime.now(datetime.timezone.utc)
+        rows = [
+            {column: getattr(gitleak, column) for column in LEAK_COLUMNS}
+            | {
+                "repository_id": repository_id,
+                "fixed": False,
+                "is_false_positive": False,
+                "created_at": now,
+            }
+            for gitleak in new_leaks
+        ]
+        statement = insert(Gitleak.__table__).values(rows)
+        statement = statement.on_conflict_do_nothing(
+            index_elements=[Gitleak.__table__.c.fingerprint]
+        ).returning(Gitleak.__table__.c.id, Gitleak.__table__.c.leakURL)
+        inserted = self.session.execute(statement).all()
+        log.info(f"{len(inserted)} new leaks added to the database")
+
+        notifications = []
+        for leak_id, leak_url in inserted:
+            content = f"A new leak has been found in repo {self.repo.slug}. <br />URL: {leak_url}.<br />"
+            log.info(content)
+            notifications.append(
+                Notification(
+                    repository_id=repository_id,
+                    action_type=NotificationActionEnum.ADD,
+                    leak_id=leak_id,
+                    type=NotificationEnum.LEAK,
+                    content=content,
+                )
+            )
+        process_notifications(notifications, self.session)
 
+    def get_leaks_by_url(
+        self, urls: list[str], exclude_fingerprints: list[str]
+    ) -> dict[str, list[Gitleak]]:
+        """Open leaks of the repository by URL, without the given fingerprints.
+
+        A false positive comes first, then the oldest one.
+        """
+        if len(urls) == 0:
+            return {}
+        leaks = (
+            self.session.query(Gitleak)
+            .filter(
+                Gitleak.repository_id == self.git_api_wrapper.repo.id,
+                Gitleak.fixed.is_(False),
+                Gitleak.leakURL.in_(urls),
+                Gitleak.fingerprint.notin_(exclude_fingerprints),
+            )
+            .order_by(Gitleak.is_false_positive.desc(), Gitleak.id.asc())
+        )
+        by_url = {}
         for leak in leaks:
-            filename, file_extension = os.path.splitext(leak["File"])
-            if file_extension.lower() in read_config(
-                "scanner.ignore.extensions", default=[]
-            ):
-                continue
-            if filename.split("/")[-1] in read_config(
-                "scanner.ignore.files", default=[]
+            by_url.setdefault(leak.leakURL, []).append(leak)
+        return by_url
+
+    @staticmethod
+    def pop_matching_leak(leaks: list[Gitleak], gitleak: Gitleak) -> Gitleak | None:
+        """Remove and return the first stored leak with the same secret and rule (or a former rule name)"""
+        for leak in leaks:
+            if leak.offender == gitleak.offender and (
+                leak.rule == gitleak.rule or leak.rule in RENAMED_RULES
             ):
-                continue
-            is_ignore = False
-            for dir in read_config("scanner.ignore.folders", default=[]):
-                if leak["File"].startswith(dir) or "/" + dir + "/" in leak["File"]:
-                    is_ignore = True
-            if is_ignore:
-                continue
-            filtered_leaks.append(leak)
+                leaks.remove(leak)
+                return leak
+        return None
+
+    def get_gitleaks(
+        self, leaks: list[dict], blame_resolver: BlameResolver
+    ) -> list[Gitleak]:
+        """Gitleak objects of a batch of findings, with the commit found by git blame"""
+        # Get blame to have commit information
+        commits = blame_resolver.resolve(leaks)
+        leaks_objects = []
+        for leak in leaks:
+            leak["Date"] = dateparser.parse(leak["Date"])
+            # Fetch project and repo from URL
+            _repo_url = self.git_api_wrapper.get_leak_url(leak)
+            if read_config("scanner.display.links", default=False):
+                log.info(_repo_url)
+
+            gitleak = Gitleak(
+                branch=self.repo.default_branch,
+                lineNumber=leak["StartLine"],
+                offender=leak["Secret"],
+                offenderEntropy=leak["Entropy"],
+                commit=leak["Commit"],
+                leakURL=_repo_url,
+                rule=leak["Description"],
+                commitMessage=leak["Message"],
+                author=leak["Author"],
+                email=leak["Email"],
+                file=leak["File"],
+                date=leak["Date"],
+                tags=leak["Tags"],
+            )
+
+            commit = commits.get((leak["File"], leak["StartLine"], leak["EndLine"]))
+            if commit is not None:
+                gitleak.commitMessage = commit["title"]
+                gitleak.author = commit["author"]
+                gitleak.email = commit["email"]
+                gitleak.date = commit["date"]
+                gitleak.commit = commit["hash"]
+            gitleak.fingerprint = gitleak.get_fingerprint(self.git_api_wrapper.repo.id)
+            leaks_objects.append(gitleak)
+        return leaks_objects
+
+    def filter_leaks(self) -> Iterator[dict]:
+        """Stream the findings of the report which are not ignored, with their file relative to the repo"""
+        report_path = self.git_api_wrapper.get_report_path()
+        matcher = IgnoreMatcher.from_config()
 
-        return filtered_leaks
+        for leak in tools.iter_json(report_path):
+            leak["File"] = self.get_relative_file(leak["File"])
+            if not matcher.is_ignored(leak["File"]):
+                yield leak
 
     def cleaning(self):
         secret_file_path = read_config("scanner.tmp_secret_folder", "/tmp/sec")
         if os.path.exists(secret_file_path):
             os.remove(secret_file_path)
-
-        if os.path.exists(self.config_filename):
-            os.remove(self.config_filename)
-
-    def get_commits_from_line(self, git_path: str, leak: dict):
-        commits = []
-        try:
-            lines = (
-                subprocess.check_output(
-                    [
-                        "git",
-                        "-C",
-                        git_path,
-                        "log",
-                        "-L",
-                        f"{leak['StartLine']},{leak['EndLine']}:{leak['File']}",
-                    ],
-                    stderr=subprocess.STDOUT,
-                )
-                .decode("utf-8")
-                .split("\n")
-            )
-
-            current_commit = {}
-
-            def save_current_commit():
-                title = current_commit["message"][0]
-                message = current_commit["message"][1:]
-                if message and message[0] == "":
-                    del message[0]
-                current_commit["title"] = title
-                current_commit["message"] = "\n".join(message)
-                commits.append(current_commit)
-
-            for line in lines:
-                if not line.startswith(" "):
-                    if line.startswith("commit "):
-                        if current_commit:
-                            save_current_commit()
-                            current_commit = {}
-                        current_commit["hash"] = line.split("commit ")[1]
-                    else:
-                        try:
-                            key, value = line.split(":", 1)
-                            current_commit[key.lower()] = value.strip()
-                        except ValueError:
-                            pass
-                else:
-                    current_commit.setdefault("message", []).append(line)
-            if current_commit:
-                save_current_commit()
-        except Exception:
-            logging.error(
-                "Error for getting blame: "
-                + " ".join(
-                    [
-                        "git",
-                        "-C",
-                        git_path,
-                        "log",
-                        "-L",
-                        f"{leak['StartLine']},\
-                                                                                                      {leak['EndLine']}:{leak['File']}",
-                    ]
-                )
-            )
-        return commits
@@ -10,8 +10,10 @@ from app.common.exceptions.access_denied_exception import AccessDeniedException
 from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
 from app.common.git.abstract_git_data import AbstractGitData
 from app.common.git.abstract_git_service import AbstractGitService
-from app.common.git.bitbucket.bitbucket_api_wrapper import BitbucketApiWrapper
+from app.common.secrets.process_secret_sources import gitleaks_config
+from app.runners.processors.abstract_processor import get_git_api_wrapper
 from app.runners.processors.leaks_processor import LeaksProcessor
+from app.runners.processors.scan_pipeline import ScanPipeline
 from app.runners.processors.sonarqube_processor import SonarQubeProcessor
 from common.models.repository import Repository
 from common.models.repository_project import RepositoryProject
@@ -21,36 +23,78 @@ log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
 class RunProcessors:
-    def __init__(self, service: AbstractGitService):
+    def __init__(self, service: AbstractGitService, full_mode=True):
         self._session = service.session
+        self.full_mode = full_mode
         self.config_filename = None
         self.service = service
         self.path = None
 
     def process(self, repo_url=None, force=False):
         config = read_config("git_sources", {})
-        filters = [
-            or_(RepositoryProject.url.is_(None), RepositoryProject.url.notlike("~%"))
-        ]
-        if repo_url is not None:
-            filters.append(Repository.url_http == repo_url)
         for name, git_source_config in config.items():
             if git_source_config.get("enabled", False):
                 source_data = self.service.wrapper.source
                 log.info(f"Processing git source {name}")
-                repos = (
-                    self._session.query(Repository)
-                    .join(RepositoryProject, isouter=True)
-                    .filter(*filters)
-                    .filter(Repository.url_http.like(f"{source_data.url}%"))
-                    .all()
-                )
+                repos = self.get_repositories(repo_url=repo_url)
                 log.info(f"Analysing {len(repos)} repositories...")
+                if read_config("scanner.pipeline.enabled", False):
+                    repos = [
+                        repo
+                        for repo in repos
+                        if self.should_process_repo(repo, source_data, force=force)
+                    ]
+                    ScanPipeline(self.service, full_mode=self.full_mode).run(
+                        repos, source_data
+                    )
+                    continue
                 for repo in repos:
                     log.info(f"Processing repo {repo.slug}")
                     self.process_repo(repo, source_data, force=force)
 
         self.cleaning()
+        # The gitleaks config holds the secrets, don't keep it once the run is done
+        gitleaks_config.clear()
+
+    def get_repositories(self, repo_url=None) -> list[Repository]:
+        """Get the repositories of the current git source that can be scanned"""
+        filters = [
+            or_(RepositoryProject.url.is_(None), RepositoryProject.url.notlike("~%"))
+        ]
+        if repo_url is not None:
+            filters.append(Repository.url_http == repo_url)
+        source_data = self.service.wrapper.source
+        return (
+            self._session.query(Repository)
+            .join(RepositoryProject, isouter=True)
+            .filter(*filters)
+            .filter(Repository.url_http.like(f"{source_data.url}%"))
+            .all()
+        )
+
+    def process_repo_by_id(self, repo_id: int, force=False) -> dict:
+        """Process a single repository and return a summary, errors are logged and reported in the summary"""
+        repo = self._session.get(Repository, repo_id)
+        if repo is None:
+            log.warning(f"Repository {repo_id} not found, skipping")
+            return {"repository_id": repo_id, "status": "missing"}
+        log.info(f"Processing repo {repo.slug}")
+        try:
+            processed = self.process_repo(
+                repo, self.service.wrapper.source, force=force
+            )
+        except Exception as e:
+            log.exception(e)
+            self._session.rollback()
+            return {"repository_id": repo_id, "status": "failed", "error": str(e)}
+        finally:
+            self.cleaning()
+            self.path = None
+        return {
+            "repository_id": repo_id,
+            "status": "scanned" if processed else "skipped",
+            "leak_count": repo.leak_count,
+        }
 
     def process_repo(
         self, repo: Repository, source_data: AbstractGitData, force=False
@@ -59,20 +103,17 @@ class RunProcessors:
         if not self.should_process_repo(repo, source_data, force=force):
             return False
         log.debug(f"Analysing repository {repo.url_http}")
-        if source_data.type == "bitbucket":
-            git_api_wrapper = BitbucketApiWrapper(self.service.data)
-        elif source_data.type == "github":
-            raise NotImplementedError("Github is not implemented yet")
-        else:
-            raise ValueError(f"Unknown git source type {source_data.type}")
+        git_api_wrapper = get_git_api_wrapper(source_data, repo)
         start_time = time.time()
-        git_api_wrapper.repo = repo
         self.clone_repo(repo, git_api_wrapper)
         self.run_processors(repo, git_api_wrapper)
+        repo.clone_time = git_api_wrapper.clone_time
+        repo.clone_size = git_api_wrapper.clone_size
         repo.time_analysis = time.time() - start_time
         log.debug(f"Time to process: {repo.time_analysis}")
         repo.leak_count = repo.get_leak_count()  # Update leak_count
         self._session.commit()
+        return True
 
     def clone_repo(
         self,
@@ -94,7 +135,12 @@ class RunProcessors:
         ]
 
         for processor in processors:
-            p = processor(self._session, repo, git_api_wrapper)
+            if processor is LeaksProcessor:
+                p = processor(
+                    self._session, repo, git_api_wrapper, full_mode=self.full_mode
+                )
+            else:
+                p = processor(self._session, repo, git_api_wrapper)
             p.process(self.path)
 
         git_api_wrapper.clean()
@@ -116,13 +162,16 @@ class RunProcessors:
         ):
             log.info("Passing this repository, as it has been scanned recently")
             return False
+        # Only the full clones are skipped, the shallow and partial ones are cheaper and
+        # refresh the clone time of the repositories skipped before
         max_clone_time = read_config("scanner.max_clone_time")
         if (
-            repo.time_analysis is not None
+            repo.clone_time is not None
             and max_clone_time is not None
-            and int(repo.time_analysis) > int(max_clone_time)
+            and source_data.clone_strategy == "full"
+            and repo.clone_time > float(max_clone_time)
         ):
-            log.info(f"Skipping... too long to clone ({repo.time_analysis})")
+            log.info(f"Skipping... too long to clone ({repo.clone_time:.0f}s)")
             return False
         if (
             repo.project is not None
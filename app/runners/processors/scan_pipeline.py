@@ -0,0 +1,183 @@
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from app.common.git.abstract_git_data import AbstractGitData
+from app.common.git.abstract_git_service import AbstractGitService
+from app.runners.processors.abstract_processor import check_source_type, get_git_api_wrapper
+from app.runners.processors.leaks_processor import LeaksProcessor
+from app.runners.processors.sonarqube_processor import SonarQubeProcessor
+from app.utils.tools import read_config
+from common.models.basemodel import engine
+from common.models.repository import Repository
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+_END = object()
+
+
+class ScanJob:
+    """A repository travelling through the pipeline stages"""
+
+    def __init__(self, repo: Repository, git_api_wrapper):
+        self.repo = repo
+        self.repo_id = repo.id
+        self.git_api_wrapper = git_api_wrapper
+        self.path = None
+        self.leaks_processor = None
+        self.access_denied = False
+        self.error = None
+        self.duration = 0.0
+
+
+class PipelineStage:
+    """A pool of worker threads reading jobs from a queue and pushing them to the next stage"""
+
+    def __init__(self, name: str, func, workers: int, next_stage: "PipelineStage" = None, queue_size: int = 10):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = next_stage
+        self.output_queue = next_stage.input_queue if next_stage is not None else None
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self._running = self.workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started_at = time.time()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"scan-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            job = self.input_queue.get()
+            if job is _END:
+                break
+            start_time = time.time()
+            try:
+                if job.error is None or self.output_queue is None:
+                    self.func(job)
+            except Exception as e:
+                log.exception(e)
+                job.error = e
+            elapsed = time.time() - start_time
+            job.duration += elapsed
+            with self._lock:
+                self.busy_time += elapsed
+                self.processed += 1
+                if job.error is not None:
+                    self.failed += 1
+            if self.output_queue is not None:
+                self.output_queue.put(job)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            self.finished_at = time.time()
+            if self.output_queue is not None:
+                # Only the last worker closes the next stage, once every job has been handed over
+                for _ in range(self.next_stage.workers):
+                    self.output_queue.put(_END)
+
+    def log_throughput(self):
+        elapsed = max((self.finished_at or time.time()) - self.started_at, 0.001)
+        log.info(
+            f"[Pipeline] {self.name}: {self.processed} repositories ({self.failed} failed) in {elapsed:.1f}s, "
+            f"{self.processed / elapsed:.2f} repo/s, {self.workers} workers, "
+            f"{100 * self.busy_time / (elapsed * self.workers):.0f}% busy"
+        )
+
+
+class ScanPipeline:
+    """Clone, scan and ingest repositories in separate stages, each one with its own pool of workers.
+
+    Clones and gitleaks scans only work on the filesystem and run concurrently. Ingestion writes to the database,
+    so every ingest worker uses its own session.
+    """
+
+    def __init__(self, service: AbstractGitService, full_mode=True):
+        self.service = service
+        self.full_mode = full_mode
+        concurrency = read_config("scanner.pipeline.concurrency", {}) or {}
+        queue_size = int(read_config("scanner.pipeline.queue_size", 10))
+        ingest = PipelineStage("ingest", self.ingest, concurrency.get("ingest", 1), queue_size=queue_size)
+        scan = PipelineStage("scan", self.scan, concurrency.get("scan", 2), ingest, queue_size=queue_size)
+        clone = PipelineStage("clone", self.clone, concurrency.get("clone", 4), scan, queue_size=queue_size)
+        self.stages = [clone, scan, ingest]
+
+    def run(self, repos: list[Repository], source_data: AbstractGitData):
+        log.info(f"[Pipeline] Processing {len(repos)} repositories")
+        # Checked before the stages start, their workers would wait for the end of the jobs forever
+        check_source_type(source_data)
+        for stage in self.stages:
+            stage.start()
+        clone = self.stages[0]
+        try:
+            for repo in repos:
+                clone.input_queue.put(ScanJob(repo, get_git_api_wrapper(source_data, repo)))
+        finally:
+            for _ in range(clone.workers):
+                clone.input_queue.put(_END)
+        for stage in self.stages:
+            stage.join()
+        for stage in self.stages:
+            stage.log_throughput()
+
+    def clone(self, job: ScanJob):
+        log.debug(f"[Pipeline] Cloning {job.repo.slug}")
+        job.path = job.git_api_wrapper.clone(branch=job.repo.default_branch)
+        if job.path is None:
+            job.access_denied = True
+
+    def scan(self, job: ScanJob):
+        if job.access_denied:
+            return
+        log.debug(f"[Pipeline] Scanning {job.repo.slug}")
+        # The session is attached later by the ingest worker, the scan doesn't touch the database
+        job.leaks_processor = LeaksProcessor(None, job.repo, job.git_api_wrapper, full_mode=self.full_mode)
+        job.leaks_processor.scan(job.path)
+        job.leaks_processor.cleaning()
+
+    def ingest(self, job: ScanJob):
+        start_time = time.time()
+        with Session(engine) as session:
+            repo = session.get(Repository, job.repo_id)
+            try:
+                if job.error is not None:
+                    log.warning(f"[Pipeline] Skipping ingestion of {repo.slug}: {job.error}")
+                    return
+                if job.access_denied:
+                    log.warning(f"[Pipeline] Access denied when cloning {repo.slug}")
+                    repo.permission_denied = True
+                    session.commit()
+                    return
+                log.debug(f"[Pipeline] Ingesting {repo.slug}")
+                job.git_api_wrapper.repo = repo
+                job.leaks_processor.session = session
+                job.leaks_processor.repo = repo
+                job.leaks_processor.process_gitleaks()
+                SonarQubeProcessor(session, repo, job.git_api_wrapper).process(job.path)
+                repo.clone_time = job.git_api_wrapper.clone_time
+                repo.clone_size = job.git_api_wrapper.clone_size
+                repo.leak_count = repo.get_leak_count()
+                # Clone, scan and ingestion, the time of this stage isn't in job.duration yet
+                repo.time_analysis = job.duration + time.time() - start_time
+                session.commit()
+            finally:
+                if job.git_api_wrapper.path is not None:
+                    job.git_api_wrapper.clean()
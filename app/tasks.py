@@ -2,13 +2,17 @@ import logging
 from datetime import datetime, timedelta
 
 import jinja2
+from celery import chord, group
+from celery.signals import worker_process_shutdown
 from sqlalchemy.orm import Session
 
 from app.celery import app
+from app.common.api.http_session import log_sessions_stats
 from app.common.core.db_task import DBTask
 from app.common.git.abstract_git_service import AbstractGitService
 from app.common.git.bitbucket.bitbucket_git_service import BitBucketGitService
 from app.common.git.github.github_git_service import GithubGitService
+from app.common.secrets.process_secret_sources import gitleaks_config
 from app.config import EMAIL_FOLDER
 from app.runners.processors.run_processors import RunProcessors
 from common.models.basemodel import engine
@@ -26,6 +30,17 @@ sources_mapping: dict[str, AbstractGitService] = {
 }
 
 
+def get_service(name: str, git_source_config: dict = None) -> AbstractGitService:
+    if git_source_config is None:
+        git_source_config = read_config(f"git_sources.{name}", {})
+    source_type = git_source_config.get("type", None)
+    if source_type not in sources_mapping:
+        raise RuntimeError(f"{source_type} not in source_mapping definition")
+    service = sources_mapping[source_type](git_source_config)
+    service.name = name
+    return service
+
+
 def get_all_services() -> list[AbstractGitService]:
     config_sources = read_config("git_sources", {})
     sources: list[AbstractGitService] = []
@@ -33,13 +48,19 @@ def get_all_services() -> list[AbstractGitService]:
     for name, git_source_config in config_sources.items():
         if git_source_config.get("enabled", False):
             log.info(f"Processing git source {name}")
-            source_type = git_source_config.get("type", None)
-            if source_type not in sources_mapping:
-                raise RuntimeError(f"{source_type} not in source_mapping definition")
-            sources.append(sources_mapping[source_type](git_source_config))
+            sources.append(get_service(name, git_source_config))
     return sources
 
 
+def chords_allowed() -> bool:
+    """The chord summary needs a result backend supporting it (the rpc backend doesn't)"""
+    try:
+        app.backend.ensure_chords_allowed()
+    except NotImplementedError:
+        return False
+    return True
+
+
 @app.task(base=DBTask, bind=True)
 def fetchers(self, repo_url=None, skip_branches=False):
     sources = get_all_services()
@@ -49,6 +70,7 @@ def fetchers(self, repo_url=None, skip_branches=False):
         source.fetch_settings(repo_url=repo_url)
         if not skip_branches:
             source.fetch_branches(repo_url=repo_url)
+    log_sessions_stats()
 
 
 @app.task()
@@ -57,16 +79,111 @@ def processors(
     dry_run_label=True,
     only_classification=False,
     force=False,
+    fan_out=None,
+    full_mode=True,
 ):
+    if fan_out is None:
+        fan_out = read_config("scanner.fan_out.enabled", False)
+    if fan_out and not chords_allowed():
+        log.warning(
+            "The result backend doesn't support chords, repositories will be processed in this task"
+        )
+        fan_out = False
     services = get_all_services()
 
     for service in services:
-        main_processor = RunProcessors(service)
+        if fan_out and not only_classification:
+            fan_out_processors(
+                service,
+                repo_url=repo_url,
+                dry_run_label=dry_run_label,
+                force=force,
+                full_mode=full_mode,
+            )
+            continue
+        main_processor = RunProcessors(service, full_mode=full_mode)
         if not only_classification:
             main_processor.process(repo_url=repo_url, force=force)
         service.process_classification(repo_url=repo_url, dry_run_label=dry_run_label)
 
 
+def fan_out_processors(
+    service: AbstractGitService,
+    repo_url=None,
+    dry_run_label=True,
+    force=False,
+    full_mode=True,
+):
+    """Send one subtask per batch of repositories, the classification runs once all of them are done"""
+    main_processor = RunProcessors(service)
+    repo_ids = [
+        repo.id
+        for repo in main_processor.get_repositories(repo_url=repo_url)
+        if main_processor.should_process_repo(repo, service.data, force=force)
+    ]
+    batch_size = max(1, int(read_config("scanner.fan_out.batch_size", 1)))
+    log.info(
+        f"Sending {len(repo_ids)} repositories of {service.name} to the workers, by batch of {batch_size}"
+    )
+    summary = classification.s(
+        source_name=service.name, repo_url=repo_url, dry_run_label=dry_run_label
+    )
+    if len(repo_ids) == 0:
+        summary.delay([])
+        return
+    header = group(
+        process_repositories.s(
+            service.name,
+            repo_ids[i : i + batch_size],
+            force=force,
+            full_mode=full_mode,
+        )
+        for i in range(0, len(repo_ids), batch_size)
+    )
+    # Still classify the repositories if a worker died during the scans
+    summary.on_error(
+        classification.si(
+            source_name=service.name, repo_url=repo_url, dry_run_label=dry_run_label
+        )
+    )
+    chord(header)(summary)
+
+
+@app.task(acks_late=True)
+def process_repositories(source_name, repo_ids, force=False, full_mode=True):
+    service = get_service(source_name)
+    main_processor = RunProcessors(service, full_mode=full_mode)
+    results = [
+        main_processor.process_repo_by_id(repo_id, force=force) for repo_id in repo_ids
+    ]
+    service.session.close()
+    # The gitleaks config is kept for the next batches, the classification deletes it
+    return results
+
+
+@app.task()
+def classification(results=None, source_name=None, repo_url=None, dry_run_label=True):
+    if results is None:
+        log.warning(
+            f"Some scans of {source_name} failed, running the classification anyway"
+        )
+        results = []
+    statuses = {}
+    for result in sum(results, []):
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    log.info(f"Scans of {source_name} done: {statuses}")
+    # The gitleaks config holds the secrets, don't keep it once the scans are done
+    gitleaks_config.clear()
+    service = get_service(source_name)
+    service.process_classification(repo_url=repo_url, dry_run_label=dry_run_label)
+
+
+@worker_process_shutdown.connect
+def clear_gitleaks_config(*args, **kwargs):
+    """The gitleaks configs of the scans of this worker are deleted when it stops"""
+    gitleaks_config.clear()
+
+
 @app.task()
 def checkers(repo_url=None):
     log.info("Running checkers")
@@ -122,31 +239,3 @@ def clean_leaks(date):
         for leak in leaks:
             session.delete(leak)
         session.commit()
-
-
-@app.task()
-def process_duplicate_leaks(fix=False):
-    with Session(engine) as session:
-        cursor = session.execute(
-            'SELECT count(*),"leakURL" FROM gitleak \
-                       GROUP BY "leakURL" \
-                       HAVING COUNT(*) > 1;'
-        )
-        leaks_deleted = 0
-        log.info(f"Number of duplicated leaks: {cursor.rowcount}")
-        if fix:
-            for row in cursor:
-                url = row[1]
-                _leak_deleted = (
-                    session.query(Gitleak)
-                    .filter(Gitleak.rule == "Generic API Key", Gitleak.leakURL == url)
-                    .delete()
-                )
-                if _leak_deleted == 0:
-                    session.query(Gitleak).filter(
-                        Gitleak.leakURL == url
-                    ).first().delete()
-                    leaks_deleted += 1
-            log.info(f"Number of leaks deleted: {leaks_deleted}")
-
-        session.commit()
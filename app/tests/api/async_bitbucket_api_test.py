@@ -0,0 +1,77 @@
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from app.common.api.async_bitbucket_api import AsyncBitBucketApi
+from app.common.api.rate_limit import RateLimitScheduler
+
+TOTAL = 250
+
+
+class PagesHandler(BaseHTTPRequestHandler):
+    throttled = set()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        start = int(parse_qs(url.query).get("start", ["0"])[0])
+        if url.path.endswith("/permissions/users") and url.path not in PagesHandler.throttled:
+            PagesHandler.throttled.add(url.path)
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if url.path.endswith("/repos"):
+            # The server caps the pages to 50 values
+            values = [{"id": i} for i in range(start, min(start + 50, TOTAL))]
+            page = {"size": len(values), "limit": 50, "values": values, "isLastPage": start + 50 >= TOTAL}
+            if not page["isLastPage"]:
+                page["nextPageStart"] = start + 50
+        else:
+            page = {"size": 1, "values": [{"path": url.path}], "isLastPage": True}
+        body = json.dumps(page).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_get_all_prefetches_pages(run_server):
+    url = run_server(PagesHandler)
+
+    async def get_repos():
+        async with AsyncBitBucketApi(url, token="token", concurrency=4, prefetch_pages=3) as api:
+            return await api.get_repos(all=True), await api.get_repos(count=True)
+
+    repos, count = asyncio.run(get_repos())
+
+    assert [repo["id"] for repo in repos] == list(range(TOTAL))
+    assert count == TOTAL
+
+
+def test_concurrent_requests_are_retried(run_server):
+    url = run_server(PagesHandler)
+    repos = [SimpleNamespace(project=SimpleNamespace(key="KEY"), slug=f"repo-{i}") for i in range(10)]
+    scheduler = RateLimitScheduler(url, rate=1000)
+
+    async def get_permissions():
+        async with AsyncBitBucketApi(url, concurrency=4, scheduler=scheduler) as api:
+            api.backoff_factor = 0
+            results = await asyncio.gather(*(api.get_repo_users_permissions(repo) for repo in repos))
+            return results, api.stats.summary()
+
+    results, [stat] = asyncio.run(get_permissions())
+
+    assert [result[0]["path"] for result in results] == [f"/rest/api/1.0/projects/KEY/repos/repo-{i}/permissions/users" for i in range(10)]
+    assert stat["endpoint"] == "GET /rest/api/1.0/projects/{}/repos/{}/permissions/users"
+    assert stat["count"] == 20
+    assert stat["retries"] == 10
+    assert stat["statuses"] == {200: 10, 503: 10}
+    # Low priority requests of the scheduler of the server
+    assert scheduler.metrics()["requests"] == {"low": 20}
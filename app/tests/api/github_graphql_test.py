@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from app.common.api.github_graphql import GithubGraphQL
+from app.common.git.github.github_api_wrapper import GithubApiWrapper
+
+
+def collaborators(logins, permission="WRITE", next_cursor=None):
+    return {
+        "pageInfo": {"hasNextPage": next_cursor is not None, "endCursor": next_cursor},
+        "edges": [
+            {"permission": permission, "node": {"login": login, "name": login.title(), "email": "", "databaseId": i}}
+            for i, login in enumerate(logins)
+        ],
+    }
+
+
+RULE = {
+    "requiresApprovingReviews": True,
+    "requiredApprovingReviewCount": 2,
+    "dismissesStaleReviews": True,
+    "requiresCodeOwnerReviews": False,
+    "requireLastPushApproval": False,
+    "requiresCommitSignatures": False,
+    "isAdminEnforced": True,
+    "requiresLinearHistory": False,
+    "allowsForcePushes": False,
+    "allowsDeletions": False,
+    "blocksCreations": False,
+    "requiresConversationResolution": True,
+    "lockBranch": False,
+    "lockAllowsFetchAndMerge": False,
+    "bypassPullRequestAllowances": {"nodes": [{"actor": {"login": "release-bot"}}, {"actor": {"name": "Maintainers"}}]},
+}
+
+
+class FakeSession:
+    def __init__(self):
+        self.queries = []
+
+    def post(self, url, json, headers):
+        self.queries.append(json)
+        variables = json["variables"]
+        if "owner0" in variables:
+            data = {
+                "r0": {
+                    "databaseId": 10,
+                    "nameWithOwner": "org/first",
+                    "collaborators": collaborators(["alice", "bob"], next_cursor="c1"),
+                    "outsideCollaborators": collaborators(["bob"]),
+                    "defaultBranchRef": {"name": "main", "branchProtectionRule": RULE},
+                },
+                # Not found
+                "r1": None,
+            }
+        else:
+            data = {"repository": {"collaborators": collaborators(["carol"], permission="ADMIN")}}
+        return mock.Mock(status_code=200, json=mock.Mock(return_value={"data": data}))
+
+
+def test_get_repositories_follows_the_cursors():
+    session = FakeSession()
+    client = GithubGraphQL("token", session=session)
+
+    result = client.get_repositories(["org/first", "org/missing"])
+
+    assert list(result.keys()) == [10]
+    assert [(user["login"], user["external"], user["permissions"]) for user in result[10]["collaborators"]] == [
+        ("alice", False, ["push", "triage", "pull"]),
+        ("bob", True, ["push", "triage", "pull"]),
+        ("carol", False, ["admin", "maintain", "push", "triage", "pull"]),
+    ]
+    assert len(session.queries) == 2
+    assert session.queries[1]["variables"] == {"owner": "org", "name": "first", "affiliation": "ALL", "after": "c1"}
+
+
+def test_prefetched_branch_protection_matches_rest():
+    client = GithubGraphQL("token", session=FakeSession())
+    protection = client.get_repositories(["org/first"], collaborators=False)[10]["protection"]
+
+    wrapper = GithubApiWrapper.__new__(GithubApiWrapper)
+    wrapper.repo = SimpleNamespace(id=10, name="org/first")
+    wrapper._prefetched = {("branch_permissions", 10): protection}
+
+    assert wrapper.get_branch_permissions("main") == {
+        "permissions": ["dismiss_stale_reviews", "enforce_admins", "required_conversation_resolution"],
+        "bypass_users": ["release-bot"],
+        "bypass_teams": ["Maintainers"],
+        "reviewers_required_count": 2,
+    }
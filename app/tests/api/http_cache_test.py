@@ -0,0 +1,74 @@
+import json
+from http.server import BaseHTTPRequestHandler
+from unittest import mock
+
+from github import Github, Requester
+
+from app.common.api import http_session
+from app.common.api.bitbucket_api import BitBucketApi
+from app.common.api.http_cache import HttpCache
+from app.common.api.http_session import create_session, inject_github_session
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        ETagHandler.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        if self.path.startswith("/api/v3/repos/"):
+            body = json.dumps({"full_name": "owner/repo", "name": "repo"}).encode()
+        else:
+            body = json.dumps({"size": 1, "values": [{"path": self.path}], "isLastPage": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_bitbucket_responses_are_revalidated(tmp_path, run_server):
+    cache = HttpCache(str(tmp_path / "cache.sqlite"), {"default": 0, "/labels": 3600})
+    ETagHandler.requests = []
+    url = run_server(ETagHandler)
+    api = BitBucketApi(url, token="token", session=create_session(retries=0, cache=cache))
+    repo = mock.Mock(slug="repo", project=mock.Mock(key="KEY"))
+    for _ in range(2):
+        assert api.get_repo_users_permissions(repo) == [{"path": "/rest/api/1.0/projects/KEY/repos/repo/permissions/users?limit=100"}]
+        assert api.get_labels(repo) == [{"path": "/rest/api/1.0/projects/KEY/repos/repo/labels"}]
+    # Another token doesn't see the responses of the first one
+    BitBucketApi(url, token="other", session=create_session(retries=0, cache=cache)).get_labels(repo)
+
+    assert ETagHandler.requests == [
+        ("/rest/api/1.0/projects/KEY/repos/repo/permissions/users?limit=100", None),
+        ("/rest/api/1.0/projects/KEY/repos/repo/labels", None),
+        ("/rest/api/1.0/projects/KEY/repos/repo/permissions/users?limit=100", '"v1"'),
+        ("/rest/api/1.0/projects/KEY/repos/repo/labels", None),
+    ]
+    assert cache.stats == {"miss": 3, "revalidated": 1, "hit": 1}
+
+
+def test_github_requests_go_through_the_cache(tmp_path, run_server):
+    cache = HttpCache(str(tmp_path / "cache.sqlite"))
+    ETagHandler.requests = []
+    url = run_server(ETagHandler)
+    try:
+        with mock.patch.object(http_session, "get_http_cache", return_value=cache):
+            inject_github_session()
+            api = Github(base_url=f"{url}/api/v3")
+            assert api.get_repo("owner/repo").name == "repo"
+            assert api.get_repo("owner/repo").name == "repo"
+    finally:
+        Requester.Requester.resetConnectionClasses()
+        http_session._sessions.pop("http://127.0.0.1", None)
+
+    assert [if_none_match for _, if_none_match in ETagHandler.requests] == [None, '"v1"']
+    assert cache.stats == {"miss": 1, "revalidated": 1}
@@ -0,0 +1,45 @@
+from http.server import BaseHTTPRequestHandler
+
+from app.common.api.bitbucket_api import BitBucketApi
+from app.common.api.http_session import create_session, get_endpoint
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        FlakyHandler.calls += 1
+        if FlakyHandler.calls == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b'{"size": 1, "values": [{"slug": "example"}], "isLastPage": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_get_endpoint():
+    assert get_endpoint("GET", "https://bitbucket.example.com/rest/api/1.0/projects/KEY/repos/slug/permissions/users?limit=100") == (
+        "GET /rest/api/1.0/projects/{}/repos/{}/permissions/users"
+    )
+    assert get_endpoint("GET", "https://bitbucket.example.com/rest/api/1.0/repos") == "GET /rest/api/1.0/repos"
+
+
+def test_bitbucket_api_retries_and_stats(run_server):
+    url = run_server(FlakyHandler)
+    api = BitBucketApi(url, token="token", session=create_session(retries=3, backoff_factor=0))
+    assert api.get_repos(all=True) == [{"slug": "example"}]
+
+    [stat] = api.session.stats.summary()
+    assert stat["endpoint"] == "GET /rest/api/1.0/repos"
+    assert stat["count"] == 1
+    assert stat["retries"] == 1
+    assert stat["statuses"] == {200: 1}
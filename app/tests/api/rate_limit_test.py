@@ -0,0 +1,55 @@
+import threading
+import time
+from unittest import mock
+
+from app.common.api.rate_limit import HIGH, LOW, RateLimitScheduler, request_priority
+
+
+def response(status=200, **headers):
+    return mock.Mock(status_code=status, headers=headers)
+
+
+def test_low_priority_requests_leave_the_reserve():
+    scheduler = RateLimitScheduler("https://api.example.com", rate=1000, burst=10, reserve=5)
+    scheduler.update(response(**{"X-RateLimit-Remaining": "5", "X-RateLimit-Limit": "5000", "X-RateLimit-Reset": str(time.time() + 0.5)}))
+    order = []
+
+    def read():
+        with request_priority(LOW):
+            scheduler.acquire()
+        order.append("low")
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    time.sleep(0.1)
+    # The low priority request waits for the reset, the high priority one uses the reserve
+    scheduler.acquire(HIGH)
+    order.append("high")
+    reader.join()
+
+    assert order == ["high", "low"]
+    metrics = scheduler.metrics()
+    assert metrics["requests"] == {"high": 1, "low": 1}
+    assert metrics["wait_time"]["low"] >= 0.3
+
+
+def test_throttling_pauses_the_requests():
+    scheduler = RateLimitScheduler("https://bitbucket.example.com", rate=1000, burst=10)
+    scheduler.update(response(429, **{"Retry-After": "1"}))
+
+    start_time = time.monotonic()
+    scheduler.acquire()
+
+    assert time.monotonic() - start_time >= 0.9
+    assert scheduler.metrics()["throttled"] == 1
+
+
+def test_token_bucket_paces_the_requests():
+    scheduler = RateLimitScheduler("https://bitbucket.example.com", rate=20, burst=2)
+
+    start_time = time.monotonic()
+    for _ in range(6):
+        scheduler.acquire()
+
+    # 2 requests at once, then one every 50ms
+    assert time.monotonic() - start_time >= 0.18
@@ -1,8 +1,13 @@
 import datetime
+import os
+import subprocess
+import threading
+from http.server import ThreadingHTTPServer
 
 import dateparser
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
 
 from common.config import SQLALCHEMY_DATABASE_URI
 from common.models.basemodel import SessionGD, base, engine
@@ -140,3 +145,75 @@ def make_repo_permission(db_session):
 
     yield _make_
     db_session.query(RepositoryPermission).delete()
+
+
+@pytest.fixture()
+def git():
+    """Run a git command in a repository and return its output, committing as `author` at `date` (now by default)"""
+
+    def _git_(path, *args, author="john bug", date=None):
+        env = dict(
+            os.environ,
+            GIT_AUTHOR_NAME=author,
+            GIT_AUTHOR_EMAIL="john.bug@example.com",
+            GIT_COMMITTER_NAME=author,
+            GIT_COMMITTER_EMAIL="john.bug@example.com",
+        )
+        if date is not None:
+            env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+        return subprocess.check_output(["git", "-C", str(path)] + list(args), env=env).decode().strip()
+
+    yield _git_
+
+
+@pytest.fixture()
+def make_remote(git):
+    """Create a repository with `commits` commits of config.ini, to be cloned with a file:// URL, and return its HEAD"""
+
+    def _make_(path, commits=1):
+        path.mkdir()
+        git(path, "init", "-q", "-b", "main")
+        git(path, "config", "uploadpack.allowFilter", "true")
+        for i in range(commits):
+            (path / "config.ini").write_text(f"password={i}\n")
+            git(path, "add", ".")
+            git(path, "commit", "-q", "-m", f"Commit {i}")
+        return git(path, "rev-parse", "HEAD")
+
+    yield _make_
+
+
+@pytest.fixture()
+def session():
+    """Session of an in-memory sqlite database with all the tables"""
+    engine = create_engine("sqlite://")
+    base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture()
+def make_api_user():
+    """User as returned by the git API wrappers"""
+
+    def _make_(remote_id, slug, external=False):
+        return {"source": "bitbucket", "id": remote_id, "name": slug.title(), "slug": slug, "active": True, "external": external}
+
+    yield _make_
+
+
+@pytest.fixture()
+def run_server():
+    """Start a local HTTP server with a request handler class and return its URL, the servers are stopped after the test"""
+    servers = []
+
+    def _run_(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield _run_
+    for server in servers:
+        server.shutdown()
+        server.server_close()
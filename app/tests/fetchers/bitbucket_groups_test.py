@@ -0,0 +1,43 @@
+from unittest import mock
+
+from sqlalchemy import event
+
+from app.runners.fetchers.bitbucket.bitbucket_fetcher import BitbucketFetcher
+from common.models.group import Group
+from common.models.user import User
+
+
+def member(remote_id, slug):
+    return {"id": remote_id, "slug": slug, "name": slug}
+
+
+def test_groups_are_synchronized_in_bulk(session):
+    developers = Group(source="bitbucket", name="developers")
+    session.add_all(
+        [
+            User(source="bitbucket", remote_id=1, name="alice", slug="alice", groups=[developers]),
+            User(source="bitbucket", remote_id=2, name="bob", slug="bob", groups=[developers, Group(source="bitbucket", name="old")]),
+        ]
+    )
+    session.commit()
+    wrapper = mock.Mock()
+    wrapper.get_groups_members.return_value = {
+        "developers": [member(1, "alice")],
+        "admins": [member(1, "alice"), member(2, "bob"), member(3, "carol")],
+    }
+    fetcher = BitbucketFetcher(session, wrapper, {})
+
+    fetcher.get_groups_from_users()
+    session.commit()
+
+    users = {user.slug: user for user in session.query(User)}
+    assert sorted(group.name for group in users["alice"].groups) == ["admins", "developers"]
+    assert [group.name for group in users["bob"].groups] == ["admins"]
+    assert users["bob"].groups_hash == BitbucketFetcher.get_groups_hash(["admins"])
+    assert fetcher.identities.memberships["carol"] == ["admins"]
+
+    # Nothing changed, only the users are read
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    fetcher.get_groups_from_users()
+    assert len(statements) == 1
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from app.runners.fetchers.permissions_fetcher import PermissionsFetcher
+from common.models.permission_enum import PermissionEnum
+from common.models.repository import Repository
+from common.models.repository_permission import RepositoryPermission
+from common.models.user import User
+
+
+def db_permission(permission_id, repository_id, user_id=None, group_id=None, permission=None, permissions=None):
+    return SimpleNamespace(
+        id=permission_id,
+        repository_id=repository_id,
+        user_id=user_id,
+        group_id=group_id,
+        permission=permission,
+        permissions=permissions,
+    )
+
+
+def test_diff_permissions():
+    existing = [
+        db_permission(1, 10, user_id=1, permission=PermissionEnum.REPO_READ),
+        db_permission(2, 10, group_id=5, permission=PermissionEnum.REPO_WRITE),
+        # Duplicate of the first one
+        db_permission(3, 10, user_id=1, permission=PermissionEnum.REPO_READ),
+        db_permission(4, 11, user_id=2, permissions=["push", "pull"]),
+        db_permission(5, 11, user_id=3, permissions=["pull"]),
+    ]
+    desired = {
+        (10, 1, None): PermissionsFetcher.get_permission_values("REPO_READ"),
+        (10, None, 5): PermissionsFetcher.get_permission_values("REPO_ADMIN"),
+        (11, 2, None): PermissionsFetcher.get_permission_values(["push", "pull"]),
+        (11, 4, None): PermissionsFetcher.get_permission_values(["pull"]),
+    }
+
+    inserts, updates, deletes = PermissionsFetcher.diff_permissions(existing, desired)
+
+    assert inserts == [{"permissions": ["pull"], "repository_id": 11, "user_id": 4, "group_id": None}]
+    assert updates == [{"permission": PermissionEnum.REPO_ADMIN, "id": 2}]
+    assert [permission.id for permission in deletes] == [3, 5]
+
+
+def test_failing_repo_does_not_discard_the_batch(session, make_api_user):
+    repos = [Repository(id=i, name=f"repo-{i}", url_http=f"https://bitbucket/repo-{i}") for i in range(1, 4)]
+    session.add_all(repos)
+    session.commit()
+    wrapper = mock.Mock()
+    wrapper.get_groups.return_value = []
+
+    with mock.patch("app.utils.identity_cache.read_config", return_value=[]):
+        fetcher = PermissionsFetcher(session, wrapper, {})
+        failed = fetcher.process_repos_permissions(
+            {
+                repos[0]: [{"user": make_api_user(1, "alice"), "permissions": "REPO_READ"}],
+                # Unknown permission
+                repos[1]: [{"user": make_api_user(2, "bob"), "permissions": "REPO_UNKNOWN"}],
+                repos[2]: [{"user": make_api_user(1, "alice"), "permissions": "REPO_WRITE"}],
+            }
+        )
+
+    assert [repo.id for repo in failed] == [2]
+    rows = session.query(RepositoryPermission).order_by(RepositoryPermission.repository_id)
+    assert [(row.repository_id, row.permission) for row in rows] == [(1, PermissionEnum.REPO_READ), (3, PermissionEnum.REPO_WRITE)]
+    # The user of the failing repository was rolled back
+    assert [user.slug for user in session.query(User)] == ["alice"]
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from app.common.exceptions.access_denied_exception import AccessDeniedException
+from app.common.git.abstract_git_service import AbstractGitService
+from common.models.gitleaks import Gitleak
+from common.models.notifications import Notification
+from common.models.repository import Repository
+from common.models.repository_project import RepositoryProject
+
+
+class GitService(AbstractGitService):
+    def checker(self, repo_url=None):
+        pass
+
+    def fetch_data(self, repo_url=None):
+        pass
+
+
+def test_classification_is_computed_in_bulk(session):
+    project = RepositoryProject(key="KEY", name="Project", classification=0)
+    session.add_all(
+        [
+            Repository(id=1, name="clean", project=project, classification=0),
+            Repository(id=2, name="leaky", project=project, classification=0),
+            Repository(id=3, name="vault", project=project, classification=1, classification_reason="confidential"),
+            Repository(id=4, name="fixed", project=project, classification=1, classification_reason="confidential"),
+            Gitleak(repository_id=2, tags="password"),
+            Gitleak(repository_id=2, tags="token", is_false_positive=True),
+            Gitleak(repository_id=3, tags="password"),
+            Gitleak(repository_id=3, tags="vault,password"),
+            Gitleak(repository_id=4, tags="vault", fixed=True),
+        ]
+    )
+    session.commit()
+    service = GitService({}, session=session)
+    service.data = SimpleNamespace(query_filters=[])
+    service.wrapper = mock.Mock()
+    service.wrapper.get_labels.return_value = []
+
+    service.process_classification(dry_run_label=False)
+
+    repos = {repo.name: repo for repo in session.query(Repository)}
+    assert {name: (repo.classification, repo.classification_reason) for name, repo in repos.items()} == {
+        "clean": (0, "internal"),
+        "leaky": (1, "confidential"),
+        "vault": (1, "vault secret"),
+        "fixed": (0, "internal"),
+    }
+    assert sorted(call.args[1] for call in service.wrapper.add_label.call_args_list) == [
+        "confidential",
+        "confidential",
+        "internal",
+        "internal",
+    ]
+    assert sorted(notification.repository_id for notification in session.query(Notification)) == [2, 4]
+    project = session.query(RepositoryProject).one()
+    assert (project.classification, project.classification_reason) == (1, "vault secret")
+
+
+def test_only_the_changed_labels_are_synchronized(session):
+    session.add_all(
+        [
+            Repository(id=1, name="same", classification=0, label="internal"),
+            Repository(id=2, name="changed", classification=1, label="internal"),
+            Repository(id=3, name="denied", classification=1),
+            Repository(id=4, name="new", classification=0),
+        ]
+    )
+    session.commit()
+    service = GitService({}, session=session)
+    service.data = SimpleNamespace(query_filters=[])
+    service.wrapper = mock.Mock()
+    service.wrapper.get_labels.side_effect = lambda repo: [{"name": "internal"}] if repo.id == 2 else []
+
+    def add_label(repo, label):
+        if repo.id == 3:
+            raise AccessDeniedException()
+
+    service.wrapper.add_label.side_effect = add_label
+
+    service.process_labels(repo_url=None, dry_run_label=False)
+
+    service.wrapper.delete_label.assert_called_once_with(mock.ANY, "internal")
+    assert sorted(call.args[0].id for call in service.wrapper.add_label.call_args_list) == [2, 3, 4]
+    repos = {repo.name: repo for repo in session.query(Repository)}
+    assert {name: repo.label for name, repo in repos.items()} == {
+        "same": "internal",
+        "changed": "confidential",
+        "denied": None,
+        "new": "internal",
+    }
+    assert repos["denied"].access_denied_to_admin is True
@@ -0,0 +1,46 @@
+from unittest import mock
+
+from app.common.git.bitbucket.bitbucket_api_wrapper import BitbucketApiWrapper
+from app.common.git.bitbucket.bitbucket_git_data import BitBucketGitData
+from app.runners.processors.run_processors import RunProcessors
+from common.models.repository import Repository
+
+
+def make_wrapper(tmp_path, strategy):
+    wrapper = BitbucketApiWrapper(BitBucketGitData({"url": "https://bitbucket.example.com", "ssh": {}, "clone": {"strategy": strategy}}))
+    wrapper.repo = Repository(id=1, name="remote", url_ssh=f"file://{tmp_path / 'remote'}")
+    wrapper.get_clone_path = lambda: str(tmp_path / "clone")
+    return wrapper
+
+
+def test_shallow_clone_and_deepen(git, make_remote, tmp_path):
+    make_remote(tmp_path / "remote", commits=3)
+    wrapper = make_wrapper(tmp_path, "shallow")
+
+    path = wrapper.clone(branch="main")
+
+    assert wrapper.is_shallow()
+    assert git(path, "rev-list", "--count", "HEAD") == "1"
+    assert wrapper.clone_time is not None and wrapper.clone_size > 0
+    assert wrapper.deepen()
+    assert not wrapper.is_shallow()
+    assert git(path, "rev-list", "--count", "HEAD") == "3"
+
+
+def test_partial_clone_args(tmp_path):
+    wrapper = make_wrapper(tmp_path, "partial")
+    assert wrapper.get_clone_args() == ["--filter=blob:limit=1m"]
+    assert make_wrapper(tmp_path, "full").get_clone_args() == []
+
+
+def test_max_clone_time_only_skips_full_clones():
+    processors = RunProcessors(mock.Mock())
+    slow = Repository(id=1, name="slow", url_http="https://bitbucket.example.com/slow", time_analysis=600, clone_time=600)
+    # Skipped before the clone time was stored
+    unknown = Repository(id=2, name="unknown", url_http="https://bitbucket.example.com/unknown", time_analysis=600)
+
+    with mock.patch("app.runners.processors.run_processors.read_config", side_effect=lambda key, default=None: 60):
+        for strategy, expected in [("full", False), ("shallow", True), ("partial", True)]:
+            source = BitBucketGitData({"url": "https://bitbucket.example.com", "ssh": {}, "clone": {"strategy": strategy}})
+            assert processors.should_process_repo(slow, source) is expected
+            assert processors.should_process_repo(unknown, source) is True
@@ -0,0 +1,51 @@
+import os
+
+from app.common.git.mirror_cache import MirrorCache
+
+
+def test_mirror_cache_checkout_and_fetch(git, make_remote, tmp_path):
+    remote = tmp_path / "remote"
+    first = make_remote(remote)
+    cache = MirrorCache(str(tmp_path / "mirrors"), max_size_mb=None)
+    worktree = str(tmp_path / "worktree")
+
+    cache.checkout(1, str(remote), worktree)
+    assert git(worktree, "rev-parse", "HEAD") == first
+    assert (tmp_path / "worktree" / "config.ini").read_text() == "password=0\n"
+    cache.remove_worktree(1, worktree)
+    assert not os.path.exists(worktree)
+
+    (remote / "config.ini").write_text("password=REDACTED\n")
+    git(remote, "commit", "-q", "-am", "Remove password")
+    second = cache.checkout(1, str(remote), worktree, branch="main")
+    assert git(second, "rev-parse", "HEAD") == git(remote, "rev-parse", "HEAD")
+    # Previous commits stay in the mirror for the incremental scans
+    assert git(second, "merge-base", "--is-ancestor", first, "HEAD") == ""
+    cache.remove_worktree(1, worktree)
+
+
+def test_mirror_cache_evicts_least_recently_used(git, make_remote, tmp_path):
+    remote = tmp_path / "remote"
+    make_remote(remote)
+    cache = MirrorCache(str(tmp_path / "mirrors"), max_size_mb=None)
+    for repo_id in (1, 2, 3, 4):
+        cache.checkout(repo_id, str(remote), str(tmp_path / f"worktree-{repo_id}"))
+    os.utime(cache.get_mirror_path(1), (1, 1))
+    cache.remove_worktree(1, str(tmp_path / "worktree-1"))
+    cache.remove_worktree(2, str(tmp_path / "worktree-2"))
+    # Worktree of another worker
+    other = MirrorCache(str(tmp_path / "mirrors"), max_size_mb=None)
+    other.checkout(3, str(remote), str(tmp_path / "worktree-other"))
+    cache.remove_worktree(3, str(tmp_path / "worktree-3"))
+
+    cache.max_size = 1
+    cache.evict()
+
+    assert not os.path.exists(cache.get_mirror_path(1))
+    assert not os.path.exists(cache.get_mirror_path(2))
+    # Still checked out
+    assert os.path.exists(cache.get_mirror_path(3))
+    assert os.path.exists(cache.get_mirror_path(4))
+    other.remove_worktree(3, str(tmp_path / "worktree-other"))
+    cache.evict()
+    assert not os.path.exists(cache.get_mirror_path(3))
@@ -0,0 +1,48 @@
+from app.runners.processors.blame_resolver import BlameCache, BlameResolver
+
+
+def make_repo(git, path):
+    git(path, "init", "-q")
+    (path / "config.ini").write_text("a\nb\nc\nd\n")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "First commit", date="2024-01-01T10:00:00+0100")
+    (path / "config.ini").write_text("a\nsecret\nc\ntoken\n")
+    git(path, "commit", "-q", "-am", "Add secrets", author="jane leak", date="2024-02-01T10:00:00+0100")
+    return git(path, "rev-parse", "HEAD")
+
+
+def test_blame_resolver_keeps_oldest_commit_of_range(git, tmp_path):
+    head = make_repo(git, tmp_path)
+    leaks = [
+        {"File": "config.ini", "StartLine": 1, "EndLine": 2},
+        {"File": "config.ini", "StartLine": 4, "EndLine": 4},
+        {"File": "config.ini", "StartLine": 3, "EndLine": 3},
+    ]
+
+    resolver = BlameResolver(str(tmp_path), 1, cache=BlameCache(str(tmp_path / ".git" / "blame.sqlite")))
+    commits = resolver.resolve(leaks)
+    resolver.close()
+
+    # The first line of the range wasn't edited by the last commit
+    assert commits[("config.ini", 1, 2)]["hash"] == commits[("config.ini", 3, 3)]["hash"]
+    assert commits[("config.ini", 1, 2)]["author"] == "john bug"
+    assert commits[("config.ini", 1, 2)]["title"] == "First commit"
+    assert commits[("config.ini", 4, 4)]["author"] == "jane leak"
+    assert commits[("config.ini", 4, 4)]["hash"] == head
+    assert commits[("config.ini", 3, 3)]["title"] == "First commit"
+    assert commits[("config.ini", 3, 3)]["date"].isoformat() == "2024-01-01T10:00:00"
+
+
+def test_blame_resolver_cache(git, tmp_path):
+    repo_path = tmp_path / "repo"
+    repo_path.mkdir()
+    head = make_repo(git, repo_path)
+    cache = BlameCache(str(tmp_path / "blame.sqlite"))
+    leaks = [{"File": "config.ini", "StartLine": 2, "EndLine": 2}]
+
+    assert BlameResolver(str(repo_path), 1, cache=cache).resolve(leaks)[("config.ini", 2, 2)]["hash"] == head
+    # Cached results are used as long as the blob doesn't change
+    resolver = BlameResolver(str(tmp_path / "missing"), 1, cache=cache)
+    resolver._get_blobs = BlameResolver(str(repo_path), 1, cache=cache)._get_blobs
+    assert resolver.resolve(leaks)[("config.ini", 2, 2)]["hash"] == head
+    cache.close()
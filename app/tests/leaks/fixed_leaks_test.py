@@ -0,0 +1,119 @@
+from unittest import mock
+
+from app.runners.processors.leaks_processor import LeaksProcessor
+from app.utils.notifications import process_notifications
+from common.models.gitleaks import Gitleak
+from common.models.notification_enum import NotificationEnum
+from common.models.notifications import Notification
+from common.models.repository import Repository
+
+
+def leak(file, rule="Password", url=None, **kwargs):
+    return Gitleak(file=file, rule=rule, commit="abc", offender="secret", leakURL=url or f"https://git/{file}", **kwargs)
+
+
+def stored_leak(file, rule="Password", **kwargs):
+    gitleak = leak(file, rule, repository_id=1, **kwargs)
+    gitleak.fingerprint = gitleak.get_fingerprint()
+    return gitleak
+
+
+def test_fixed_leaks_are_detected_by_fingerprint(session):
+    repo = Repository(id=1, name="repo")
+    session.add(repo)
+    session.add_all(
+        [
+            # Still there, on another line
+            stored_leak("config.ini", url="https://git/config.ini#1"),
+            # Stored with the old name of the rule, matched by its URL
+            stored_leak("api.py", rule="Generic API Key"),
+            stored_leak("removed.py"),
+            stored_leak("other.py", is_false_positive=True),
+        ]
+    )
+    session.commit()
+    processor = LeaksProcessor(session, repo, mock.Mock())
+
+    found = [leak("config.ini", url="https://git/config.ini#2"), leak("api.py", rule="API Token")]
+    processor.check_existing_leaks({leak.get_fingerprint(1) for leak in found}, {leak.leakURL for leak in found})
+
+    leaks = {(leak.file, leak.rule): leak for leak in session.query(Gitleak)}
+    assert {key: leak.fixed for key, leak in leaks.items()} == {
+        ("config.ini", "Password"): False,
+        ("api.py", "Generic API Key"): False,
+        ("removed.py", "Password"): True,
+        ("other.py", "Password"): False,
+    }
+    assert leaks[("removed.py", "Password")].fixed_date is not None
+    notifications = session.query(Notification).all()
+    assert [(notification.leak_id, notification.repository_id) for notification in notifications] == [
+        (leaks[("removed.py", "Password")].id, 1)
+    ]
+
+
+def test_leaks_of_a_renamed_rule_are_renamed(session):
+    repo = Repository(id=1, name="repo", slug="repo")
+    session.add(repo)
+    for commit, kwargs in [("abc", {}), ("def", {"is_false_positive": True}), ("ghi", {"fixed": True})]:
+        # Same URL, other commits
+        gitleak = leak("api.py", rule="Generic API Key", repository_id=1, **kwargs)
+        gitleak.commit = commit
+        gitleak.fingerprint = gitleak.get_fingerprint()
+        session.add(gitleak)
+    session.commit()
+    processor = LeaksProcessor(session, repo, mock.Mock(repo=repo))
+
+    found = leak("api.py", rule="API Token")
+    found.fingerprint = found.get_fingerprint(1)
+    processor.save_leaks([found])
+    session.commit()
+
+    # The false positive is kept, nothing is added
+    leaks = session.query(Gitleak).order_by(Gitleak.id).all()
+    assert [(leak.id, leak.rule) for leak in leaks] == [(1, "Generic API Key"), (2, "API Token"), (3, "Generic API Key")]
+    assert leaks[1].fingerprint == found.fingerprint
+    assert leaks[1].is_false_positive is True
+
+
+def test_leaks_attributed_to_another_commit_are_updated(session):
+    repo = Repository(id=1, name="repo", slug="repo")
+    session.add(repo)
+    stored = leak("config.ini", repository_id=1)
+    stored.commit = "old"
+    stored.fingerprint = stored.get_fingerprint()
+    # Another secret at the same URL
+    other = leak("config.ini", repository_id=1)
+    other.offender = "other"
+    other.fingerprint = other.get_fingerprint()
+    session.add_all([stored, other])
+    session.commit()
+    processor = LeaksProcessor(session, repo, mock.Mock(repo=repo))
+
+    found = leak("config.ini")
+    found.fingerprint = found.get_fingerprint(1)
+    processor.save_leaks([found])
+    session.commit()
+
+    leaks = session.query(Gitleak).order_by(Gitleak.id).all()
+    assert [(leak.id, leak.commit, leak.offender) for leak in leaks] == [(1, "abc", "secret"), (2, "abc", "other")]
+    assert leaks[0].fingerprint == found.fingerprint
+    assert session.query(Notification).count() == 0
+
+
+def test_fingerprint_ignores_the_line_and_url():
+    assert leak("a.py", url="https://git/a.py#1").get_fingerprint(1) == leak("a.py", url="https://git/a.py#2").get_fingerprint(1)
+    assert leak("a.py").get_fingerprint(1) != leak("a.py").get_fingerprint(2)
+    assert leak("a.py").get_fingerprint(1) != leak("a.py", rule="API Token").get_fingerprint(1)
+
+
+def test_open_notifications_are_not_added_twice(session):
+    session.add(Notification(repository_id=1, type=NotificationEnum.LEAK, content="Leak 1"))
+    session.commit()
+
+    process_notifications(
+        [Notification(repository_id=1, type=NotificationEnum.LEAK, content=content) for content in ["Leak 1", "Leak 2", "Leak 2"]],
+        session,
+    )
+    session.commit()
+
+    assert sorted(notification.content for notification in session.query(Notification)) == ["Leak 1", "Leak 2"]
@@ -0,0 +1,45 @@
+from app.runners.processors.ignore_matcher import IgnoreMatcher
+
+
+def make_matcher():
+    return IgnoreMatcher(
+        extensions=[".map", ".JAR"],
+        files=["Podfile.lock", "*.min.js"],
+        folders=["node_modules", "tests", "docs/generated", "vendor*"],
+    )
+
+
+def test_ignore_matcher_extensions_and_files():
+    matcher = make_matcher()
+
+    assert matcher.is_ignored("src/app.js.map")
+    assert matcher.is_ignored("lib/library.jar")
+    assert matcher.is_ignored("ios/Podfile.lock")
+    assert matcher.is_ignored("static/app.min.js")
+    assert not matcher.is_ignored("static/app.js")
+    assert not matcher.is_ignored("ios/Podfile")
+
+
+def test_ignore_matcher_folders():
+    matcher = make_matcher()
+
+    assert matcher.is_ignored("node_modules/lib/index.js")
+    assert matcher.is_ignored("front/node_modules/lib/index.js")
+    assert matcher.is_ignored("api/tests/conftest.py")
+    assert matcher.is_ignored("docs/generated/api.md")
+    assert matcher.is_ignored("vendored/lib.go")
+    assert not matcher.is_ignored("api/tests_utils.py")
+    assert not matcher.is_ignored("docs/api.md")
+    assert not matcher.is_ignored("src/my_vendor/lib.go")
+
+
+def test_ignore_matcher_prune(tmp_path):
+    for file in ["app/main.py", "app/tests/main_test.py", "app/bundle.js.map", ".git/config"]:
+        (tmp_path / file).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / file).write_text("content")
+
+    assert make_matcher().prune(str(tmp_path)) == 2
+    assert (tmp_path / "app/main.py").exists()
+    assert (tmp_path / ".git/config").exists()
+    assert not (tmp_path / "app/tests").exists()
+    assert not (tmp_path / "app/bundle.js.map").exists()
@@ -0,0 +1,41 @@
+import os
+
+from app.runners.processors.incremental_scan import get_changed_files, get_head, stage_files
+
+
+def commit_files(git, path, files: dict, message="commit"):
+    for file, content in files.items():
+        os.makedirs(os.path.dirname(path / file), exist_ok=True)
+        if content is None:
+            os.remove(path / file)
+        else:
+            (path / file).write_text(content)
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", message)
+    return git(path, "rev-parse", "HEAD")
+
+
+def test_incremental_scan_changed_files(git, tmp_path):
+    git(tmp_path, "init", "-q", "-b", "main")
+    first = commit_files(git, tmp_path, {"a.txt": "a", "b.txt": "b", "src/c.txt": "c"})
+    head = commit_files(git, tmp_path, {"a.txt": "a2", "b.txt": None, "src/d.txt": "d"})
+
+    assert get_head(str(tmp_path)) == (head, "main")
+    assert sorted(get_changed_files(str(tmp_path), first)) == ["a.txt", "b.txt", "src/d.txt"]
+    assert get_changed_files(str(tmp_path), head) == []
+
+    staging = tmp_path.parent / "staging"
+    assert stage_files(str(tmp_path), get_changed_files(str(tmp_path), first), str(staging)) == 2
+    assert (staging / "src" / "d.txt").read_text() == "d"
+    assert not (staging / "b.txt").exists()
+
+
+def test_incremental_scan_rewritten_history(git, tmp_path):
+    git(tmp_path, "init", "-q", "-b", "main")
+    commit_files(git, tmp_path, {"a.txt": "a"})
+    old_head = commit_files(git, tmp_path, {"a.txt": "a2"})
+    git(tmp_path, "reset", "-q", "--hard", "HEAD~1")
+    commit_files(git, tmp_path, {"a.txt": "a3"})
+
+    assert get_changed_files(str(tmp_path), old_head) is None
+    assert get_changed_files(str(tmp_path), "0" * 40) is None
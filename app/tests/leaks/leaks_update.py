@@ -3,16 +3,17 @@ from unittest.mock import patch
 import dateparser
 
 from app.common.git.bitbucket.bitbucket_api_wrapper import BitbucketApiWrapper
-from app.runners.processors.leaks_processor import LeaksProcessor
+from app.runners.processors.blame_resolver import BlameResolver
 from common.models.gitleaks import Gitleak
 from common.models.notifications import Notification
 
 
-@patch.object(LeaksProcessor, "get_commits_from_line")
-def test_bitbucket_leaks_update_line_number(get_commits_from_line, db_session, make_leak, make_repo, make_leak_processor):
-    get_commits_from_line.return_value = [
-        {'title': 'Commit title', 'message': 'Commit message', 'hash': '47967b2f7fc968f928faaf4613d853649d3986c3', 'author': 'john bug',
-         'date': dateparser.parse("2024-13-01")}]
+@patch.object(BlameResolver, "resolve")
+def test_bitbucket_leaks_update_line_number(resolve, db_session, make_leak, make_repo, make_leak_processor):
+    resolve.return_value = {
+        ("test-project/manifests/company/grafana/configs/grafana2/grafana.ini", 150, 150):
+        {'title': 'Commit title', 'hash': '47967b2f7fc968f928faaf4613d853649d3986c3', 'author': 'john bug',
+         'email': 'john.bug@example.com', 'date': dateparser.parse("2024-13-01")}}
     repo = make_repo(name="example", classification=1, url="http://example_url")
     make_leak(
         line=150,
@@ -0,0 +1,68 @@
+import json
+import os
+from unittest import mock
+
+from app.runners.processors import leaks_processor
+from app.runners.processors.leaks_processor import LeaksProcessor
+from app.utils.tools import iter_json
+
+REPORT_EXAMPLE = os.path.join(os.path.dirname(__file__), "leak_report_example.json")
+
+
+def finding(file, line):
+    return {
+        "Description": "Password",
+        "StartLine": line,
+        "EndLine": line,
+        "Secret": f"secret-{line}",
+        "File": file,
+        "Commit": "abc",
+        "Entropy": 4.5,
+        "Author": "",
+        "Email": "",
+        "Date": "2024-01-01",
+        "Message": "",
+        "Tags": [],
+    }
+
+
+def test_iter_json_streams_arrays_and_json_lines(tmp_path):
+    with open(REPORT_EXAMPLE) as f:
+        assert list(iter_json(REPORT_EXAMPLE, chunk_size=16)) == json.load(f)
+
+    items = [{"a": 1}, {"b": "x]y,[z"}, 12]
+    (tmp_path / "report.jsonl").write_text("\n".join(json.dumps(item) for item in items))
+    assert list(iter_json(str(tmp_path / "report.jsonl"), chunk_size=3)) == items
+    (tmp_path / "empty.json").write_text("[]")
+    assert list(iter_json(str(tmp_path / "empty.json"))) == []
+
+
+def test_report_is_processed_in_batches(tmp_path):
+    path = str(tmp_path / "repo")
+    findings = [finding(f"{path}/src/file{i}.py", i) for i in range(1, 8)] + [finding(f"{path}/test/ignored.py", 1)]
+    (tmp_path / "report.json").write_text(json.dumps(findings))
+    wrapper = mock.Mock(repo_from_db=False, repo=mock.Mock(id=1, slug="repo"))
+    wrapper.get_report_path.return_value = str(tmp_path / "report.json")
+    wrapper.get_leak_url.side_effect = lambda leak: f"https://git/{leak['File']}#{leak['StartLine']}"
+    processor = LeaksProcessor(mock.Mock(), mock.Mock(default_branch="main"), wrapper)
+    processor.path = processor.scan_path = path
+    processor.changed_files = None
+    # The test folders are ignored by the default config
+    config = {"scanner.leaks_batch_size": 3}
+
+    with (
+        mock.patch.object(leaks_processor, "read_config", side_effect=lambda name, default=None: config.get(name, default)),
+        mock.patch.object(leaks_processor, "BlameResolver") as blame_resolver,
+        mock.patch.object(processor, "save_leaks") as save_leaks,
+        mock.patch.object(processor, "check_existing_leaks") as check_existing_leaks,
+        mock.patch.object(processor, "mark_scanned"),
+    ):
+        blame_resolver.return_value.resolve.return_value = {}
+        processor.process_gitleaks()
+
+    assert [len(call.args[0]) for call in blame_resolver.return_value.resolve.call_args_list] == [3, 3, 1]
+    assert [len(call.args[0]) for call in save_leaks.call_args_list] == [3, 3, 1]
+    assert save_leaks.call_args_list[0].args[0][0].file == "src/file1.py"
+    found_fingerprints, found_urls = check_existing_leaks.call_args.args
+    assert len(found_fingerprints) == 7
+    assert found_urls == {f"https://git/src/file{i}.py#{i}" for i in range(1, 8)}
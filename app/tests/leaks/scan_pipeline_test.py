@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from app.runners.processors.scan_pipeline import ScanPipeline
+from common.models.repository import Repository
+
+
+def test_unsupported_source_is_rejected_before_the_stages_start():
+    pipeline = ScanPipeline(mock.Mock())
+    for stage in pipeline.stages:
+        stage.start = mock.Mock()
+
+    with pytest.raises(NotImplementedError):
+        pipeline.run([Repository(id=1, name="repo")], SimpleNamespace(type="github"))
+
+    assert not any(stage.start.called for stage in pipeline.stages)
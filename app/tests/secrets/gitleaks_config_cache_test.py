@@ -0,0 +1,62 @@
+import os
+
+from app.common.secrets import process_secret_sources
+from app.common.secrets.process_secret_sources import GitLeaksConfigCache, GitLeaksVault
+
+
+def test_gitleaks_config_cache(monkeypatch, tmp_path):
+    calls = {"render": 0, "versions": 0}
+    versions = {"hashicorp_vault": {"app": 1}}
+
+    def render_config(self):
+        calls["render"] += 1
+        return f"rules {versions['hashicorp_vault']['app']}"
+
+    def get_versions(self):
+        calls["versions"] += 1
+        return {name: dict(value) for name, value in versions.items()}
+
+    monkeypatch.setattr(process_secret_sources, "CONFIG_FOLDER", str(tmp_path))
+    monkeypatch.setattr(GitLeaksVault, "render_config", render_config)
+    monkeypatch.setattr(GitLeaksVault, "get_versions", get_versions)
+    cache = GitLeaksConfigCache()
+
+    filename = cache.get()
+    assert cache.get() == filename
+    assert calls == {"render": 1, "versions": 1}
+    assert oct(os.stat(filename).st_mode & 0o777) == "0o600"
+
+    # Expired, but the secrets didn't change
+    cache.expires_at = 0
+    assert cache.get() == filename
+    assert calls["render"] == 1
+
+    versions["hashicorp_vault"]["app"] = 2
+    cache.expires_at = 0
+    new_filename = cache.get()
+    assert new_filename != filename
+    assert calls["render"] == 2
+    assert not os.path.exists(filename)
+
+    cache.clear()
+    assert not os.path.exists(new_filename)
+
+
+def test_gitleaks_config_in_use_is_not_deleted(monkeypatch, tmp_path):
+    monkeypatch.setattr(process_secret_sources, "CONFIG_FOLDER", str(tmp_path))
+    monkeypatch.setattr(GitLeaksVault, "render_config", lambda self: "rules")
+    monkeypatch.setattr(GitLeaksVault, "get_versions", lambda self: {})
+    # Left by a previous run
+    (tmp_path / "gitleaks-0000000000000000.toml").write_text("old rules")
+    os.utime(tmp_path / "gitleaks-0000000000000000.toml", (1, 1))
+    cache = GitLeaksConfigCache()
+
+    with cache.use() as filename:
+        # Another worker clearing its config
+        GitLeaksConfigCache().clear()
+        cache.clear()
+        assert os.path.exists(filename)
+
+    assert not os.path.exists(tmp_path / "gitleaks-0000000000000000.toml")
+    cache.clear()
+    assert os.listdir(tmp_path) == []
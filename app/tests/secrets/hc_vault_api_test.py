@@ -0,0 +1,80 @@
+from cryptography.fernet import Fernet
+
+from app.common.secrets.sources import hc_vault_api
+from app.common.secrets.sources.hc_vault_api import HcVaultSecretSource
+
+SECRETS = {
+    "app": {"version": 1, "data": {"password": "1234", "welcome": "hello"}},
+    "team/db": {"version": 3, "data": {"password": "5678"}},
+    "team/nested/api": {"version": 2, "data": {"token": "abcd"}},
+}
+
+
+class FakeVaultClient:
+    def __init__(self, url=None, verify=None):
+        self.reads = []
+        self.adapter = self
+        self.auth = self
+        self.approle = self
+
+    def login(self, **kwargs):
+        pass
+
+    def is_authenticated(self):
+        return True
+
+    def request(self, method, url):
+        path = url[len("v1/infra/metadata/") :]
+        if path.endswith("?list=1"):
+            prefix = path[: -len("?list=1")]
+            keys = {
+                name[len(prefix) :].split("/", 1)[0] + ("/" if "/" in name[len(prefix) :] else "")
+                for name in SECRETS
+                if name.startswith(prefix)
+            }
+            return {"data": {"keys": sorted(keys)}}
+        return {"data": {"current_version": SECRETS[path]["version"]}}
+
+    def read(self, path):
+        self.reads.append(path)
+        return {"data": {"data": SECRETS[path[len("infra/data/") :]]["data"]}}
+
+
+def make_source(monkeypatch, tmp_path, key):
+    monkeypatch.setattr(hc_vault_api.hvac, "Client", FakeVaultClient)
+    monkeypatch.setenv("HC_VAULT_ROLE_ID", "role")
+    monkeypatch.setenv("HC_VAULT_ACCESS_TOKEN", "token")
+    monkeypatch.setenv("HC_VAULT_CACHE_KEY", key)
+    return HcVaultSecretSource(
+        {
+            "url": "https://vault.example.com",
+            "path": "infra/data",
+            "excludes": ["welcome"],
+            "credentials_env": {"role_id": "HC_VAULT_ROLE_ID", "token": "HC_VAULT_ACCESS_TOKEN"},
+            "cache": {"path": str(tmp_path / "vault_cache.bin"), "key_env": "HC_VAULT_CACHE_KEY"},
+        }
+    )
+
+
+def test_hc_vault_recursive_harvest_with_cache(monkeypatch, tmp_path):
+    key = Fernet.generate_key().decode()
+    source = make_source(monkeypatch, tmp_path, key)
+
+    assert source.get_secrets() == {
+        "app/password": "1234",
+        "team/db/password": "5678",
+        "team/nested/api/token": "abcd",
+    }
+    assert len(source.client.reads) == 3
+    assert b"5678" not in (tmp_path / "vault_cache.bin").read_bytes()
+
+    # Only the secrets with a new version are read again
+    monkeypatch.setitem(SECRETS, "team/db", {"version": 4, "data": {"password": "9999"}})
+    source = make_source(monkeypatch, tmp_path, key)
+    assert source.get_secrets()["team/db/password"] == "9999"
+    assert source.client.reads == ["infra/data/team/db"]
+
+    # A cache encrypted with another key is ignored
+    source = make_source(monkeypatch, tmp_path, Fernet.generate_key().decode())
+    assert len(source.get_secrets()) == 3
+    assert len(source.client.reads) == 3
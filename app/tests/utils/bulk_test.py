@@ -0,0 +1,39 @@
+from app.runners.fetchers.bitbucket.bitbucket_fetcher import REPOSITORY_UPDATE_COLUMNS, BitbucketFetcher
+from app.utils.bulk import split_rows
+
+
+def bitbucket_repo(repo_id, name, description=None):
+    repo = {
+        "id": repo_id,
+        "slug": name.lower(),
+        "name": name,
+        "public": False,
+        "project": {"id": 1, "key": "KEY"},
+        "links": {
+            "self": [{"href": f"https://bitbucket.example.com/projects/KEY/repos/{name.lower()}/browse"}],
+            "clone": [
+                {"name": "http", "href": f"https://bitbucket.example.com/scm/key/{name.lower()}.git"},
+                {"name": "ssh", "href": f"ssh://git@bitbucket.example.com:7999/key/{name.lower()}.git"},
+            ],
+        },
+    }
+    if description is not None:
+        repo["description"] = description
+    return repo
+
+
+def test_split_rows():
+    rows = [
+        BitbucketFetcher.get_repository_row(repo)
+        for repo in [bitbucket_repo(1, "Api"), bitbucket_repo(2, "Web", "Front"), bitbucket_repo(3, "New")]
+    ]
+    existing = {1: ("api", "Api", None), 2: ("web", "Web", "Old description")}
+
+    inserts, updates, unchanged = split_rows(existing, rows, REPOSITORY_UPDATE_COLUMNS)
+
+    assert [row["id"] for row in inserts] == [3]
+    assert [row["id"] for row in updates] == [2]
+    assert unchanged == 1
+    assert inserts[0]["url_http"] == "https://bitbucket.example.com/scm/key/new.git"
+    assert inserts[0]["url_ssh"] == "ssh://git@bitbucket.example.com:7999/key/new.git"
+    assert inserts[0]["project_id"] == 1
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from app.utils.tools import ConfigSnapshot
+
+
+def write_config(path, content, mtime):
+    path.write_text(content)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_config_snapshot_lookup(tmp_path):
+    config_file = tmp_path / "config.yml"
+    write_config(config_file, "scanner:\n  max_clone_time: 60\n  ignore:\n    extensions:\n      - .map\n", 1_000_000_000)
+    config = ConfigSnapshot(str(config_file))
+
+    assert config.get("scanner.max_clone_time") == 60
+    assert config.get("scanner.ignore.extensions") == (".map",)
+    assert config.get("scanner.unknown", 3) == 3
+    assert config.get("scanner.max_clone_time.unknown", 3) == 3
+    with pytest.raises(TypeError):
+        config.get("scanner")["max_clone_time"] = 10
+
+
+def test_config_snapshot_reload_on_mtime_change(tmp_path):
+    config_file = tmp_path / "config.yml"
+    write_config(config_file, "scanner:\n  max_clone_time: 60\n", 1_000_000_000)
+    config = ConfigSnapshot(str(config_file))
+    assert config.get("scanner.max_clone_time") == 60
+
+    write_config(config_file, "scanner:\n  max_clone_time: 120\n", 1_000_000_000)
+    assert config.refresh() is False
+    assert config.get("scanner.max_clone_time") == 60
+
+    write_config(config_file, "scanner:\n  max_clone_time: 120\n", 2_000_000_000)
+    assert config.refresh() is True
+    assert config.get("scanner.max_clone_time") == 120
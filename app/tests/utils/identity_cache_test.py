@@ -0,0 +1,58 @@
+from unittest import mock
+
+from sqlalchemy import event
+
+from app.utils.identity_cache import IdentityCache
+from common.models.group import Group
+from common.models.user import User
+
+
+def test_users_and_groups_are_loaded_once(session, make_api_user):
+    contractors = Group(source="bitbucket", name="contractors")
+    session.add(User(source="bitbucket", remote_id=1, name="Alice", slug="alice", groups=[contractors]))
+    session.add(Group(source="github", name="developers"))
+    session.commit()
+    wrapper = mock.Mock()
+    wrapper.get_groups.return_value = ["developers", "testers"]
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    with mock.patch("app.utils.identity_cache.read_config", return_value=["contractors"]):
+        identities = IdentityCache(session, wrapper)
+        for _ in range(3):
+            alice = identities.get_user(make_api_user(1, "alice"))
+            bob = identities.get_user(make_api_user(2, "bob"))
+            assert identities.get_group({"name": "developers"}) is identities.get_group({"name": "developers"}, source="github")
+
+    # Users, their groups and the groups
+    assert len(statements) == 3
+    wrapper.get_groups.assert_called_once_with("bob")
+    assert alice.external is True
+    assert bob.external is False
+    assert [group.name for group in bob.groups] == ["developers", "testers"]
+
+    session.flush()
+    assert identities.get_id(bob) == bob.id
+    assert identities.get_user(make_api_user(2, "bob", external=True)).external is True
+
+
+def test_rolled_back_users_and_groups_are_dropped(session, make_api_user):
+    session.add(Group(source="bitbucket", name="developers"))
+    session.commit()
+    wrapper = mock.Mock()
+    wrapper.get_groups.return_value = ["developers", "testers"]
+
+    with mock.patch("app.utils.identity_cache.read_config", return_value=[]):
+        identities = IdentityCache(session, wrapper)
+        bob = identities.get_user(make_api_user(2, "bob"))
+        session.flush()
+        session.rollback()
+
+        assert identities.get_group({"name": "developers"}).id is not None
+        new_bob = identities.get_user(make_api_user(2, "bob"))
+        assert new_bob is not bob
+        assert [group.name for group in new_bob.groups] == ["developers", "testers"]
+        session.commit()
+
+    assert session.query(User).count() == 1
+    assert session.query(Group).count() == 2
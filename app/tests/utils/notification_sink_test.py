@@ -0,0 +1,49 @@
+from sqlalchemy import event
+
+from app.utils.notifications import NotificationSink, process_notification
+from common.models.notification_enum import NotificationEnum
+from common.models.notifications import Notification, get_content_hash
+from common.models.repository import Repository
+
+
+def notification(content, **kwargs):
+    return Notification(type=NotificationEnum.LEAK, content=content, **kwargs)
+
+
+def test_notifications_are_added_at_commit(session):
+    repo = Repository(name="repo")
+    session.add(repo)
+    session.add_all(
+        [
+            notification("open", repository_id=None, project_id=None),
+            notification("resolved", resolved=True),
+        ]
+    )
+    session.commit()
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    # Linked by relationship, the id of the repository is resolved when flushing
+    for content in ["open", "resolved", "new", "new"]:
+        process_notification(notification(content, repository=repo if content == "new" else None), session)
+    assert session.query(Notification).count() == 2
+    session.commit()
+
+    assert sorted((n.content, n.repository_id, bool(n.resolved)) for n in session.query(Notification)) == [
+        ("new", repo.id, False),
+        ("open", None, False),
+        ("resolved", None, False),
+        ("resolved", None, True),
+    ]
+    assert len([statement for statement in statements if statement.startswith("INSERT INTO notification")]) == 1
+    assert {n.content_hash for n in session.query(Notification).filter(Notification.content == "new")} == {get_content_hash("new")}
+
+
+def test_notifications_are_dropped_on_rollback(session):
+    session.query(Notification).count()
+    process_notification(notification("leak"), session)
+    session.rollback()
+    session.commit()
+
+    assert session.query(Notification).count() == 0
+    assert NotificationSink.get(session).flush() == 0
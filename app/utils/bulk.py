@@ -0,0 +1,50 @@
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def split_rows(existing: dict, rows: list[dict], update_columns: list[str]) -> tuple[list[dict], list[dict], int]:
+    """Split rows keyed by id into the ones to insert, the ones to update and the count of unchanged ones.
+
+    `existing` maps the ids of the database to the values of `update_columns`.
+    """
+    inserts, updates, unchanged = [], [], 0
+    for row in rows:
+        current = existing.get(row["id"])
+        if current is None:
+            inserts.append(row)
+        elif current != tuple(row[column] for column in update_columns):
+            updates.append(row)
+        else:
+            unchanged += 1
+    return inserts, updates, unchanged
+
+
+def bulk_upsert(session: Session, model, rows: list[dict], update_columns: list[str], chunk_size: int = 1000) -> dict:
+    """Insert the new rows of a model and update the changed ones, with `INSERT ... ON CONFLICT (id) DO UPDATE`.
+
+    The current values are loaded in one query. Only `update_columns` are updated on the existing rows, the other
+    columns are only written on insert. All the rows must have the same keys.
+    Returns the number of rows inserted, updated and unchanged.
+    """
+    columns = [getattr(model, column) for column in update_columns]
+    existing = {row[0]: tuple(row[1:]) for row in session.query(model.id, *columns)}
+    inserts, updates, unchanged = split_rows(existing, rows, update_columns)
+
+    now = datetime.now(timezone.utc)
+    # Copies, the rows of the caller are left as they are
+    changed = [dict(row, updated_at=row.get("updated_at")) for row in inserts] + [dict(row, updated_at=now) for row in updates]
+    for start in range(0, len(changed), chunk_size):
+        chunk = changed[start : start + chunk_size]
+        statement = insert(model.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[model.__table__.c.id],
+            set_={column: statement.excluded[column] for column in update_columns + ["updated_at"]},
+        )
+        session.execute(statement, chunk)
+    log.debug(f"{model.__tablename__}: {len(inserts)} inserted, {len(updates)} updated, {unchanged} unchanged")
+    return {"inserted": len(inserts), "updated": len(updates), "unchanged": unchanged}
@@ -0,0 +1,120 @@
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, selectinload
+
+from app.common.git.abstract_git_api_wrapper import AbstractGitApiWrapper
+from app.utils.tools import read_config
+from common.models.group import Group
+from common.models.user import User
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class IdentityCache:
+    """Users and groups of the database, shared by the fetchers of a task.
+
+    The users (with their groups) and the groups are loaded once, keyed by (source, remote id) and (source, name).
+    The groups of a user returned by the API and the external user classification are computed once per task.
+    The users and groups added since the last commit are dropped when the session is rolled back.
+    """
+
+    def __init__(self, session: Session, wrapper: AbstractGitApiWrapper):
+        self.session = session
+        self.wrapper = wrapper
+        self.external_groups = list(read_config("best_practices.external_groups", []))
+        self.users = None
+        self.groups = None
+        self.groups_by_name = None
+        self.memberships = {}
+        self.external = {}
+        # after_rollback is dispatched before the new objects are expunged, after_soft_rollback after it
+        event.listen(session, "after_soft_rollback", self._after_rollback)
+
+    def load(self):
+        """Load all the users and groups, the users with their groups"""
+        self.users = {}
+        for user in self.session.query(User).options(selectinload(User.groups)):
+            self.users.setdefault((user.source, user.remote_id), user)
+        self.groups = {}
+        self.groups_by_name = {}
+        for group in self.session.query(Group):
+            self.groups.setdefault((group.source, group.name), group)
+            self.groups_by_name.setdefault(group.name, group)
+        log.debug(f"Identity cache loaded: {len(self.users)} users, {len(self.groups)} groups")
+
+    def get_user(self, user: dict) -> User:
+        """Database user of a user of the API, added if it's new"""
+        if self.users is None:
+            self.load()
+        key = (user["source"], user["id"])
+        db_obj = self.users.get(key)
+        if db_obj is None:
+            db_obj = User(
+                source=user["source"],
+                external=user.get("external", False),
+                remote_id=user["id"],
+                emailAddress=user["emailAddress"] if "emailAddress" in user else None,
+                name=user["name"],
+                slug=user["slug"],
+                active=user["active"],
+            )
+            log.debug(f"Adding new User {db_obj.name}")
+            _groups = self.get_memberships(user["slug"])
+            log.debug(f"Adding {len(_groups)} groups for this user")
+            for _group in _groups:
+                db_obj.groups.append(self.get_group({"name": _group}, source=user["source"]))
+            self.session.add(db_obj)
+            self.users[key] = db_obj
+            self.external[key] = db_obj.is_external_user(self.external_groups)
+            db_obj.external = self.external[key]
+        elif key not in self.external:
+            self.external[key] = db_obj.is_external_user(self.external_groups) or user.get("external", False)
+            db_obj.external = self.external[key]
+        elif user.get("external", False) and not self.external[key]:
+            self.external[key] = True
+            db_obj.external = True
+        return db_obj
+
+    def get_group(self, group: dict, source="bitbucket") -> Group:
+        """Database group of a group of the API, added if it's new.
+
+        A group of another source with the same name is used, like the groups stored before their source was set.
+        """
+        if self.groups is None:
+            self.load()
+        db_obj = self.groups.get((source, group["name"])) or self.groups_by_name.get(group["name"])
+        if db_obj is None:
+            db_obj = Group(
+                source=source,
+                name=group["name"],
+            )
+            log.debug(f"Adding new Group {db_obj.name}")
+            self.session.add(db_obj)
+            self.groups[(source, group["name"])] = db_obj
+            self.groups_by_name[group["name"]] = db_obj
+        return db_obj
+
+    def get_memberships(self, username: str) -> list[str]:
+        """Names of the groups of a user, requested once per task"""
+        if username not in self.memberships:
+            self.memberships[username] = self.wrapper.get_groups(username)
+        return self.memberships[username]
+
+    def _after_rollback(self, session: Session, previous_transaction):
+        if self.users is None:
+            return
+        for key, user in list(self.users.items()):
+            if not inspect(user).persistent:
+                del self.users[key]
+                self.external.pop(key, None)
+        for cache in (self.groups, self.groups_by_name):
+            for key, group in list(cache.items()):
+                if not inspect(group).persistent:
+                    del cache[key]
+
+    @staticmethod
+    def get_id(db_obj) -> int:
+        """Id of a user or group, without reloading it when the session expired it on commit"""
+        identity = inspect(db_obj).identity
+        return identity[0] if identity is not None else db_obj.id
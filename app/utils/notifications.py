@@ -1,22 +1,91 @@
 import logging
+from datetime import datetime, timezone
 
-from common.models.notifications import Notification
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from common.models.notifications import Notification, get_content_hash
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# Columns of the notifications set from their relationship when only the object is given
+RELATIONSHIPS = {"project_id": "project", "repository_id": "repository", "user_id": "user", "group_id": "group", "leak_id": "leak"}
+# Content hashes looked up per query
+LOOKUP_SIZE = 1000
+
+
+class NotificationSink:
+    """Buffer of the notifications created in a session, added with one bulk insert when the session is committed.
+
+    A notification is skipped when an open one has the same (project, repository, type, content hash), in the database or
+    in the buffer. The buffer is dropped when the session is rolled back.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.pending = []
+        event.listen(session, "before_commit", self._before_commit)
+        event.listen(session, "after_rollback", self._after_rollback)
+
+    @staticmethod
+    def get(session: Session) -> "NotificationSink":
+        """Sink of a session, created on first use"""
+        if "notification_sink" not in session.info:
+            session.info["notification_sink"] = NotificationSink(session)
+        return session.info["notification_sink"]
+
+    def add(self, notification: Notification):
+        self.pending.append(notification)
+
+    def flush(self) -> int:
+        """Insert the buffered notifications which are not already open, return the number inserted"""
+        if len(self.pending) == 0:
+            return 0
+        notifications, self.pending = self.pending, []
+        # The ids of the objects linked to the notifications are needed
+        self.session.flush()
+
+        now = datetime.now(timezone.utc)
+        rows = {}
+        for notification in notifications:
+            row = {column.key: getattr(notification, column.key) for column in Notification.__table__.columns if column.key != "id"}
+            for column, relationship in RELATIONSHIPS.items():
+                if row[column] is None and getattr(notification, relationship) is not None:
+                    row[column] = getattr(notification, relationship).id
+            row["content_hash"] = get_content_hash(row["content"])
+            row["created_at"] = row["created_at"] or now
+            row["notified"] = bool(row["notified"])
+            row["resolved"] = bool(row["resolved"])
+            rows.setdefault((row["project_id"], row["repository_id"], row["type"], row["content_hash"]), row)
+
+        hashes = list({key[3] for key in rows if key[3] is not None})
+        for start in range(0, len(hashes), LOOKUP_SIZE):
+            existing = self.session.query(
+                Notification.project_id, Notification.repository_id, Notification.type, Notification.content_hash
+            ).filter(Notification.resolved.isnot(True), Notification.content_hash.in_(hashes[start : start + LOOKUP_SIZE]))
+            for key in existing:
+                rows.pop(tuple(key), None)
+
+        if rows:
+            # All the rows in one INSERT, the None values aren't left out
+            self.session.execute(insert(Notification).execution_options(render_nulls=True), list(rows.values()))
+        log.debug(f"{len(rows)} notifications added, {len(notifications) - len(rows)} already open")
+        return len(rows)
+
+    def _before_commit(self, session: Session):
+        self.flush()
+
+    def _after_rollback(self, session: Session):
+        self.pending = []
+
+
+def process_notification(notification: Notification, session: Session):
+    """Add a notification when the session is committed, unless the same one is already open"""
+    NotificationSink.get(session).add(notification)
+
 
-def process_notification(notification: Notification, session):
-    notif_exist = (
-        session.query(Notification)
-        .filter(
-            Notification.project == notification.project,
-            Notification.repository == notification.repository,
-            Notification.type == notification.type,
-            Notification.resolved.isnot(True),
-            Notification.content == notification.content,
-        )
-        .first()
-    )
-
-    if notif_exist is None:
-        session.add(notification)
+def process_notifications(notifications: list[Notification], session: Session):
+    """Like `process_notification`, for many notifications"""
+    sink = NotificationSink.get(session)
+    for notification in notifications:
+        sink.add(notification)
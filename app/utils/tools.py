@@ -1,8 +1,13 @@
 import json
 import logging
 import os
+import threading
+import time
+from collections.abc import Iterable, Iterator, Mapping
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from itertools import islice
+from types import MappingProxyType
 
 import yaml
 
@@ -21,18 +26,77 @@ def read_env_variable(name, default=None):
     return val
 
 
-def read_config(path, default=None):
-    config_file = CONFIG_FILE
-    data = read_yaml(config_file if "/" in config_file else "app/config/" + config_file)
-    split = path.split(".")
-    for key in split:
-        if key in data:
-            data = data[key]
-        else:
-            return default
+_MISSING = object()
+
+
+def _freeze(data):
+    """Recursively convert the parsed YAML into read-only mappings and tuples"""
+    if isinstance(data, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return tuple(_freeze(value) for value in data)
     return data
 
 
+class ConfigSnapshot:
+    """Immutable snapshot of the YAML config file.
+
+    The file is parsed once, then reloaded only when its modification time changes. The modification time is checked
+    at the start of every Celery task and at most every `refresh_interval` seconds otherwise. Dotted path lookups are
+    memoized.
+    """
+
+    def __init__(self, file_path: str, refresh_interval: float = 60):
+        self.file_path = file_path
+        self.refresh_interval = refresh_interval
+        self._data = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lookups = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False) -> bool:
+        """Reload the file if it changed since the last load, return True if it has been reloaded"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            mtime = os.stat(self.file_path).st_mtime_ns
+            if not force and self._data is not None and mtime == self._mtime:
+                return False
+            data = _freeze(read_yaml(self.file_path) or {})
+            self._data, self._mtime, self._lookups = data, mtime, {}
+        log.debug(f"Config file {self.file_path} loaded")
+        return True
+
+    def get(self, path: str, default=None):
+        if self._data is None or time.monotonic() - self._checked_at > self.refresh_interval:
+            self.refresh()
+        lookups = self._lookups
+        if path not in lookups:
+            lookups[path] = self._lookup(path)
+        value = lookups[path]
+        return default if value is _MISSING else value
+
+    def _lookup(self, path: str):
+        data = self._data
+        for key in path.split("."):
+            if not isinstance(data, Mapping) or key not in data:
+                return _MISSING
+            data = data[key]
+        return data
+
+
+_config = ConfigSnapshot(CONFIG_FILE if "/" in CONFIG_FILE else "app/config/" + CONFIG_FILE)
+
+
+def refresh_config(force=False) -> bool:
+    """Reload the config file if it changed, or unconditionally when forced"""
+    return _config.refresh(force=force)
+
+
+def read_config(path, default=None):
+    return _config.get(path, default)
+
+
 def read_yaml(file_path):
     with open(file_path, "r") as f:
         return yaml.safe_load(f)
@@ -43,11 +107,71 @@ def read_json(file_path):
         return json.loads(f.read())
 
 
+def iter_json(file_path, chunk_size: int = 1 << 16) -> Iterator:
+    """Yield the items of a JSON array file one by one, without loading the whole file.
+
+    JSON lines files (one object per line) are read the same way.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r") as f:
+        buffer, position, eof = "", 0, False
+        in_array = None
+        while True:
+            # Skip the separators of the items
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and in_array is None:
+                in_array = buffer[position] == "["
+                position += 1 if in_array else 0
+                continue
+            if position < len(buffer) and in_array and buffer[position] == "]":
+                return
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer, position = f.read(chunk_size), 0
+                eof = buffer == ""
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                item, end = None, None
+            # The item can be cut by the end of the buffer, even when it is decoded (number)
+            if end is None or (end == len(buffer) and not eof):
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of file", buffer, position)
+                chunk = f.read(chunk_size)
+                eof = chunk == ""
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield item
+            position = end
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Lists of `size` items of an iterable, the last one can be shorter"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
 def write_json(file_path, data):
     with open(file_path, "w+") as f:
         f.write(json.dumps(data, indent=4))
 
 
+def get_folder_size(path: str) -> int:
+    """Size in bytes of the files of a folder, recursively"""
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
 def send_mail(subject, content, recipients):
     import smtplib
 
@@ -1,3 +1,5 @@
+import hashlib
+
 import sqlalchemy as db
 from sqlalchemy.orm import relationship
 
@@ -19,6 +21,8 @@ class Gitleak(BaseModel):
     file = db.Column(db.String(255))
     date = db.Column(db.DateTime())
     tags = db.Column(db.String(255))
+    # get_fingerprint, the same leak is only stored once per repository
+    fingerprint = db.Column(db.String(64), nullable=True, unique=True, index=True)
     fixed = db.Column(db.Boolean, unique=False, default=False)
     fixed_date = db.Column(db.DateTime(timezone=True))
     is_false_positive = db.Column(db.Boolean, unique=False, default=False)
@@ -28,6 +32,12 @@ class Gitleak(BaseModel):
 
     notifications = relationship("Notification", cascade="save-update, delete", back_populates="leak")
 
+    def get_fingerprint(self, repository_id: int = None) -> str:
+        """Stable identity of the leak: repository, file, rule, commit and hash of the secret"""
+        secret_hash = hashlib.sha256((self.offender or "").encode()).hexdigest()
+        values = [repository_id or self.repository_id, self.file, self.rule, self.commit, secret_hash]
+        return hashlib.sha256("\0".join("" if value is None else str(value) for value in values).encode()).hexdigest()
+
     def __eq__(self, other):
         if not isinstance(other, Gitleak):
             # don't attempt to compare against unrelated types
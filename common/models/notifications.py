@@ -1,3 +1,5 @@
+import hashlib
+
 import sqlalchemy as db
 from sqlalchemy.orm import relationship
 
@@ -8,6 +10,10 @@ from common.models.basemodel import BaseModel
 from common.models.gitleaks import Gitleak
 
 
+def get_content_hash(content: str | None) -> str | None:
+    return hashlib.sha256(content.encode()).hexdigest() if content is not None else None
+
+
 class Notification(BaseModel):
     __tablename__ = "notification"
     project_id = db.Column(
@@ -37,6 +43,13 @@ class Notification(BaseModel):
     permission_type = db.Column(db.Enum(PermissionEnum))
 
     content = db.Column(db.Text())
+    # sha256 of the content, to find the open notifications already sent without comparing the texts
+    content_hash = db.Column(
+        db.String(64),
+        nullable=True,
+        index=True,
+        default=lambda context: get_content_hash(context.get_current_parameters().get("content")),
+    )
     action_type = db.Column(db.Enum(NotificationActionEnum))
     type = db.Column(db.Enum(NotificationEnum))
 
@@ -21,6 +21,9 @@ class Repository(BaseModel):
     confidentiality = db.Column(db.String(255))
     source = db.Column(db.String(255))
     last_scan_date = db.Column(db.DateTime)
+    # HEAD of the branch at the last scan, the next incremental scan only looks at the files changed since
+    last_scanned_commit = db.Column(db.String(40), nullable=True)
+    last_scanned_branch = db.Column(db.String(255), nullable=True)
     organization_id = db.Column(db.Integer, db.ForeignKey("gh_organization.id"), nullable=True)
     organization = relationship(GhOrganization)
 
@@ -35,12 +38,17 @@ class Repository(BaseModel):
 
     classification = db.Column(db.Integer)
     classification_reason = db.Column(db.Text)
+    # Classification label applied to the repository by the last label synchronization
+    label = db.Column(db.String(255), nullable=True)
     leaks = relationship(
         "Gitleak",
         back_populates="repository",
         primaryjoin="(and_(Repository.id == Gitleak.repository_id, Gitleak.is_false_positive.is_(False), " "Gitleak.fixed.is_(False)))",
     )
     time_analysis = db.Column(db.Integer)
+    # Duration in seconds and bytes downloaded by the last clone
+    clone_time = db.Column(db.Float)
+    clone_size = db.Column(db.BigInteger)
     branches = relationship("RepositoryBranch", back_populates="repository")
     permissions = relationship("RepositoryPermission", back_populates="repository")
     access_denied_to_admin = db.Column(db.Boolean, unique=False, default=False)
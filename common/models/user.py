@@ -14,6 +14,8 @@ class User(BaseModel):
     external = db.Column(db.Boolean, unique=False, default=False)
     slug = db.Column(db.String(255))
     remote_id = db.Column(db.Integer)
+    # Hash of the names of the groups of the user at the last groups sync
+    groups_hash = db.Column(db.String(64), nullable=True)
     groups = relationship(
         "Group", secondary="user_group_relation", back_populates="users"
     )
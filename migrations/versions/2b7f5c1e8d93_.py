@@ -0,0 +1,44 @@
+"""Store the hash of the content of the notifications, with an index
+
+Revision ID: 2b7f5c1e8d93
+Revises: 9e4c2a7b3f58
+Create Date: 2026-10-18 18:05:49.730162
+
+"""
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2b7f5c1e8d93"
+down_revision = "9e4c2a7b3f58"
+branch_labels = None
+depends_on = None
+
+notification = sa.table("notification", sa.column("id", sa.Integer), sa.column("content", sa.Text), sa.column("content_hash", sa.String))
+
+
+def upgrade():
+    with op.batch_alter_table("notification", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("content_hash", sa.String(length=64), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(notification.c.id, notification.c.content).where(notification.c.content.isnot(None)))
+    values = [{"notification_id": row.id, "value": hashlib.sha256(row.content.encode()).hexdigest()} for row in rows]
+    for start in range(0, len(values), 1000):
+        connection.execute(
+            notification.update().where(notification.c.id == sa.bindparam("notification_id")).values(content_hash=sa.bindparam("value")),
+            values[start : start + 1000],
+        )
+
+    with op.batch_alter_table("notification", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_notification_content_hash"), ["content_hash"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("notification", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_notification_content_hash"))
+        batch_op.drop_column("content_hash")
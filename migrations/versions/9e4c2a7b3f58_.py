@@ -0,0 +1,117 @@
+"""Store the fingerprint of the leaks, with a unique index
+
+Revision ID: 9e4c2a7b3f58
+Revises: 5d3b8e2f6a14
+Create Date: 2026-10-18 17:12:36.518204
+
+"""
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9e4c2a7b3f58"
+down_revision = "5d3b8e2f6a14"
+branch_labels = None
+depends_on = None
+
+gitleak = sa.table(
+    "gitleak",
+    sa.column("id", sa.Integer),
+    sa.column("repository_id", sa.Integer),
+    sa.column("file", sa.String),
+    sa.column("rule", sa.String),
+    sa.column("commit", sa.String),
+    sa.column("offender", sa.Text),
+    sa.column("fingerprint", sa.String),
+    sa.column("is_false_positive", sa.Boolean),
+    sa.column("fixed", sa.Boolean),
+    sa.column("fixed_date", sa.DateTime),
+)
+notification = sa.table(
+    "notification",
+    sa.column("id", sa.Integer),
+    sa.column("leak_id", sa.Integer),
+)
+
+
+def get_fingerprint(row) -> str:
+    """Same as Gitleak.get_fingerprint"""
+    secret_hash = hashlib.sha256((row.offender or "").encode()).hexdigest()
+    values = [row.repository_id, row.file, row.rule, row.commit, secret_hash]
+    return hashlib.sha256("\0".join("" if value is None else str(value) for value in values).encode()).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table("gitleak", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("fingerprint", sa.String(length=64), nullable=True))
+
+    # The duplicates of a leak are merged into one of them: a false positive first, then an open leak, then the oldest
+    # one. It is a false positive if any duplicate is, and stays fixed only if all of them are fixed.
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(
+            gitleak.c.id,
+            gitleak.c.repository_id,
+            gitleak.c.file,
+            gitleak.c.rule,
+            gitleak.c.commit,
+            gitleak.c.offender,
+            gitleak.c.is_false_positive,
+            gitleak.c.fixed,
+            gitleak.c.fixed_date,
+        ).order_by(gitleak.c.id)
+    )
+    leaks = {}
+    for row in rows:
+        leaks.setdefault(get_fingerprint(row), []).append(row)
+
+    values = []
+    merged = []
+    for fingerprint, duplicates in leaks.items():
+        duplicates.sort(key=lambda row: (not row.is_false_positive, bool(row.fixed), row.id))
+        leak = duplicates[0]
+        fixed = all(row.fixed for row in duplicates)
+        values.append(
+            {
+                "leak_id": leak.id,
+                "value": fingerprint,
+                "false_positive": any(row.is_false_positive for row in duplicates),
+                "fixed_value": fixed,
+                "fixed_date_value": max((row.fixed_date for row in duplicates if row.fixed_date), default=None) if fixed else None,
+            }
+        )
+        merged.extend({"kept_id": leak.id, "duplicate_id": row.id} for row in duplicates[1:])
+
+    for start in range(0, len(values), 1000):
+        connection.execute(
+            gitleak.update()
+            .where(gitleak.c.id == sa.bindparam("leak_id"))
+            .values(
+                fingerprint=sa.bindparam("value"),
+                is_false_positive=sa.bindparam("false_positive"),
+                fixed=sa.bindparam("fixed_value"),
+                fixed_date=sa.bindparam("fixed_date_value"),
+            ),
+            values[start : start + 1000],
+        )
+    # The notifications of the duplicates are moved to the leak kept before they are deleted
+    for start in range(0, len(merged), 1000):
+        connection.execute(
+            notification.update().where(notification.c.leak_id == sa.bindparam("duplicate_id")).values(leak_id=sa.bindparam("kept_id")),
+            merged[start : start + 1000],
+        )
+        connection.execute(gitleak.delete().where(gitleak.c.id.in_([row["duplicate_id"] for row in merged[start : start + 1000]])))
+
+    with op.batch_alter_table("gitleak", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_gitleak_fingerprint"), ["fingerprint"], unique=True)
+
+
+def downgrade():
+    # The merged duplicates are not restored
+    with op.batch_alter_table("gitleak", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_gitleak_fingerprint"))
+        batch_op.drop_column("fingerprint")